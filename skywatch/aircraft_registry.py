@@ -0,0 +1,267 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Offline aircraft registry keyed by 24-bit ICAO address
+
+# Misses in the 'airplanes' table used to go straight to hexdb.io, which is
+# common for GA and military traffic. This module bulk-loads an offline
+# registry dump into the 'aircraft_registry' table so that most of these
+# lookups can be answered locally.
+#
+# Supported dumps use the same shape that hexdb.io returns:
+#
+#   ModeS, Registration, Manufacturer, ICAOTypeCode, Type, RegisteredOwners, OperatorFlagCode
+#
+# either as a CSV file or as a SQLite database (e.g. BaseStation.sqb, table 'Aircraft').
+#
+# Usage:
+#
+#   python aircraft_registry.py aircraft_db.csv
+#   python aircraft_registry.py BaseStation.sqb --table Aircraft --delete-missing
+
+import os
+import sys
+import csv
+import time
+import sqlite3
+import hashlib
+import argparse
+import logging
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+import models_sql
+import data_access
+import utility
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# hexdb field name -> aircraft_registry column
+FIELD_MAP = {
+    "modes": "mode_s",
+    "registration": "registration",
+    "manufacturer": "manufacturer",
+    "icaotypecode": "icao_type_code",
+    "type": "type",
+    "registeredowners": "registered_owners",
+    "operatorflagcode": "operator_flag_code",
+}
+
+# aircraft_registry column -> hexdb field name
+COLUMN_MAP = {
+    "mode_s": "ModeS",
+    "registration": "Registration",
+    "manufacturer": "Manufacturer",
+    "icao_type_code": "ICAOTypeCode",
+    "type": "Type",
+    "registered_owners": "RegisteredOwners",
+    "operator_flag_code": "OperatorFlagCode",
+}
+
+registry_table = models_sql.AircraftRegistry.__table__
+
+
+def hex_to_address(hex_ident):
+
+    try:
+        address = int(hex_ident.strip(), 16)
+    except (AttributeError, ValueError):
+        return None
+
+    if address < 0 or address > 0xFFFFFF:
+        return None
+
+    return address
+
+
+def normalize_row(row):
+    """
+        Convert one dump row into an aircraft_registry record, or None if
+        the row does not carry a valid ICAO address.
+    """
+
+    record = {column: None for column in COLUMN_MAP}
+    for name, value in row.items():
+        if name is None:
+            continue
+        column = FIELD_MAP.get(name.strip().lower())
+        if not column:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        record[column] = value or None
+
+    address = hex_to_address(record.get("mode_s"))
+    if address is None:
+        return None
+
+    record["icao_address"] = address
+    record["mode_s"] = f"{address:06X}"
+
+    digest = hashlib.sha1()
+    for column in COLUMN_MAP:
+        digest.update(str(record.get(column) or "").encode("utf-8"))
+        digest.update(b"\x1f")
+    record["row_hash"] = digest.hexdigest()
+
+    return record
+
+
+def read_registry_csv(filepath):
+
+    with open(filepath, newline='', encoding='utf-8', errors='replace') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            yield row
+
+
+def read_registry_sqlite(filepath, table="Aircraft"):
+
+    conn = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+
+    try:
+        cursor = conn.execute(f'SELECT * FROM "{table}"')
+        for row in cursor:
+            yield dict(row)
+    finally:
+        conn.close()
+
+
+def read_registry(filepath, table="Aircraft"):
+
+    if filepath.endswith((".sqb", ".sqlite", ".sqlite3", ".db")):
+        return read_registry_sqlite(filepath, table)
+
+    return read_registry_csv(filepath)
+
+
+def import_registry(filepath, table="Aircraft", batch_size=5000, delete_missing=False):
+    """
+        Incrementally load a registry dump into 'aircraft_registry'.
+        Only new or changed rows (by content hash) are written.
+    """
+
+    if not os.path.exists(filepath):
+        log.error("%s does not exist.", filepath)
+        return False, f"{filepath} does not exist."
+
+    start_time = time.time()
+
+    models_sql.Base.metadata.create_all(models_sql.engine, tables=[registry_table])
+
+    stats = {"read": 0, "invalid": 0, "unchanged": 0, "upserted": 0, "deleted": 0}
+    seen = set()
+
+    with models_sql.engine.begin() as conn:
+
+        batch = {}
+
+        for row in read_registry(filepath, table):
+
+            stats["read"] += 1
+
+            record = normalize_row(row)
+            if not record:
+                stats["invalid"] += 1
+                continue
+
+            batch[record["icao_address"]] = record
+
+            if len(batch) >= batch_size:
+                upsert_batch(conn, batch, stats)
+                seen.update(batch)
+                batch = {}
+
+        if batch:
+            upsert_batch(conn, batch, stats)
+            seen.update(batch)
+
+        if delete_missing:
+            stats["deleted"] = delete_addresses_not_in(conn, seen, batch_size)
+
+    duration = time.time() - start_time
+    elapsed = utility.elapsed_format(duration)
+    log.info("Registry import completed in %s: %s", elapsed, stats)
+
+    return True, stats
+
+
+def upsert_batch(conn, batch, stats):
+
+    existing = conn.execute(
+        select(registry_table.c.icao_address, registry_table.c.row_hash)
+        .where(registry_table.c.icao_address.in_(list(batch)))
+    ).all()
+
+    existing_hash = dict(existing)
+
+    changed = [
+        record for address, record in batch.items()
+        if existing_hash.get(address) != record["row_hash"]
+    ]
+
+    stats["unchanged"] += len(batch) - len(changed)
+    if not changed:
+        return
+
+    stmt = insert(registry_table).values(changed)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[registry_table.c.icao_address],
+        set_={
+            column: stmt.excluded[column]
+            for column in list(COLUMN_MAP) + ["row_hash"]
+        }
+    )
+    conn.execute(stmt)
+
+    stats["upserted"] += len(changed)
+
+
+def delete_addresses_not_in(conn, seen, batch_size):
+
+    stored = conn.execute(select(registry_table.c.icao_address)).scalars().all()
+    missing = [address for address in stored if address not in seen]
+
+    for i in range(0, len(missing), batch_size):
+        chunk = missing[i:i + batch_size]
+        conn.execute(registry_table.delete().where(registry_table.c.icao_address.in_(chunk)))
+
+    return len(missing)
+
+
+def lookup(hex_ident):
+    """
+        Look up an aircraft by ICAO hex code.
+        Returns a dict in the same shape as hexdb.io, or None.
+    """
+
+    address = hex_to_address(hex_ident)
+    if address is None:
+        return None
+
+    row = data_access.get_registry(address)
+    if not row:
+        return None
+
+    return {
+        field: row[column]
+        for column, field in COLUMN_MAP.items()
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Import an offline aircraft registry dump.")
+    parser.add_argument("filepath", help="CSV file or SQLite database")
+    parser.add_argument("--table", default="Aircraft", help="table name for SQLite dumps")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--delete-missing", action="store_true", help="remove rows not present in the dump")
+    args = parser.parse_args()
+
+    status, output = import_registry(args.filepath,
+                                     table=args.table,
+                                     batch_size=args.batch_size,
+                                     delete_missing=args.delete_missing)
+    if not status:
+        sys.exit(1)
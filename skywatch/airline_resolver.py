@@ -0,0 +1,274 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Resolve the airline straight from an SBS callsign
+
+# An ICAO flight callsign such as 'UAL1791' starts with the three-letter ICAO
+# airline designator (UAL = United Airlines). Military and some charter
+# flights use the radio telephony instead, e.g. 'REACH123'.
+#
+# The airlines table is indexed once at startup into two dictionaries, so that
+# resolving a callsign is a dictionary lookup without Postgres or network.
+# When several airlines share a designator, the 'active' one is preferred.
+# After a reference sync only the affected keys are refreshed (apply_changes).
+#
+# Benchmark:
+#
+#   python airline_resolver.py                      # synthetic callsigns
+#   python airline_resolver.py aircraft_log.csv     # callsigns from a day of SBS log
+
+import sys
+import csv
+import time
+import random
+import logging
+
+import models_sql
+import utility
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# lower rank wins when two airlines share a designator
+STATUS_RANK = {
+    "active": 0,
+    "restarting": 1,
+    "start_up": 2,
+    "renamed": 3,
+    "merged": 4,
+    "historical/administration": 5,
+    "historical": 6,
+    "not_ready": 7,
+    "disabled": 8,
+    "unknown": 9,
+}
+
+
+class Airline_Resolver():
+
+    def __init__(self):
+
+        self.by_icao = {}         # UAL -> airline dict
+        self.by_telephony = {}    # UNITED -> airline dict
+
+        # every airline and the keys it is indexed under, so that single
+        # records can be changed without rebuilding the whole index
+        self.airlines = {}        # airline id -> airline dict
+        self.icao_members = {}    # UAL -> set of airline ids
+        self.telephony_members = {}
+
+
+    @staticmethod
+    def index_keys(airline):
+
+        icao_code = (airline.get("icao_code") or "").strip().upper()
+        if not (len(icao_code) == 3 and icao_code.isalpha()):
+            icao_code = None
+
+        telephony = (airline.get("callsign") or "").replace(" ", "").replace("-", "").upper()
+        if not telephony.isalpha():
+            telephony = None
+
+        return icao_code, telephony
+
+
+    def build(self, airlines):
+        """
+            Build the prefix index from an iterable of airline dicts.
+        """
+
+        self.airlines = {}
+        self.icao_members = {}
+        self.telephony_members = {}
+
+        for airline in airlines:
+            self.__add(airline)
+
+        self.by_icao = {
+            key: self.__best(ids) for key, ids in self.icao_members.items()
+        }
+        self.by_telephony = {
+            key: self.__best(ids) for key, ids in self.telephony_members.items()
+        }
+
+        log.info("Airline resolver indexed %d ICAO designators and %d telephony callsigns.",
+                 len(self.by_icao), len(self.by_telephony))
+
+
+    def apply_changes(self, upserted, deleted):
+        """
+            Listener for reference_sync: refresh only the affected keys.
+            'deleted' holds primary key tuples, e.g. [("4441699",)].
+        """
+
+        affected_icao = set()
+        affected_telephony = set()
+
+        changed_ids = [airline.get("id") for airline in upserted] + [key[0] for key in deleted]
+
+        for airline_id in changed_ids:
+            old = self.__remove(airline_id)
+            if old:
+                affected_icao.add(old[0])
+                affected_telephony.add(old[1])
+
+        for airline in upserted:
+            icao_code, telephony = self.__add(airline)
+            affected_icao.add(icao_code)
+            affected_telephony.add(telephony)
+
+        Airline_Resolver.__refresh(self.by_icao, self.icao_members, affected_icao, self.__best)
+        Airline_Resolver.__refresh(self.by_telephony, self.telephony_members, affected_telephony, self.__best)
+
+        log.info("Airline resolver refreshed %d airlines.", len(changed_ids))
+
+
+    def __add(self, airline):
+
+        airline_id = airline.get("id")
+        self.airlines[airline_id] = airline
+
+        icao_code, telephony = Airline_Resolver.index_keys(airline)
+        if icao_code:
+            self.icao_members.setdefault(icao_code, set()).add(airline_id)
+        if telephony:
+            self.telephony_members.setdefault(telephony, set()).add(airline_id)
+
+        return icao_code, telephony
+
+
+    def __remove(self, airline_id):
+
+        airline = self.airlines.pop(airline_id, None)
+        if not airline:
+            return None
+
+        icao_code, telephony = Airline_Resolver.index_keys(airline)
+        if icao_code:
+            self.icao_members.get(icao_code, set()).discard(airline_id)
+        if telephony:
+            self.telephony_members.get(telephony, set()).discard(airline_id)
+
+        return icao_code, telephony
+
+
+    @staticmethod
+    def __refresh(index, members, keys, best):
+
+        for key in keys:
+            if not key:
+                continue
+            ids = members.get(key)
+            if ids:
+                index[key] = best(ids)
+            else:
+                members.pop(key, None)
+                index.pop(key, None)
+
+
+    def __best(self, ids):
+
+        # lowest status rank wins, ties broken by id for a stable result
+        return min(
+            (self.airlines[airline_id] for airline_id in ids),
+            key=lambda airline: (Airline_Resolver.__rank(airline), str(airline.get("id")))
+        )
+
+
+    def load(self, session):
+
+        start_time = time.time()
+
+        airlines = session.query(models_sql.Airline).all()
+        self.build(models_sql.model_to_dict(airline) for airline in airlines)
+
+        duration = time.time() - start_time
+        elapsed = utility.elapsed_format(duration)
+        log.info("Airline resolver built in %s", elapsed)
+
+
+    @staticmethod
+    def __rank(airline):
+
+        return STATUS_RANK.get(airline.get("status"), len(STATUS_RANK))
+
+
+    def resolve(self, callsign):
+        """
+            callsign=UAL1791 returns the 'United Airlines' airline dict.
+        """
+
+        if not callsign:
+            return None
+
+        callsign = callsign.strip().upper()
+
+        # leading alphabetic part of the callsign: UAL1791 -> UAL, REACH123 -> REACH
+        end = 0
+        for char in callsign:
+            if not char.isalpha():
+                break
+            end += 1
+
+        prefix = callsign[:end]
+        if not prefix:
+            return None
+
+        # An all-letter callsign is usually a registration (N123AB, GEZBZ).
+        if end == len(callsign):
+            return None
+
+        if end == 3:
+            airline = self.by_icao.get(prefix)
+            if airline:
+                return airline
+
+        return self.by_telephony.get(prefix)
+
+
+def read_callsigns(filepath):
+
+    callsigns = []
+
+    with open(filepath, newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            callsign = (row.get("callsign") or "").strip()
+            if callsign:
+                callsigns.append(callsign)
+
+    return callsigns
+
+
+if __name__ == "__main__":
+
+    session = models_sql.Session(bind=models_sql.engine)
+
+    resolver = Airline_Resolver()
+    resolver.load(session)
+
+    if len(sys.argv) > 1:
+        callsigns = read_callsigns(sys.argv[1])
+    else:
+        # ~ one day of callsign-bearing messages on a busy receiver
+        designators = list(resolver.by_icao) or ["UAL"]
+        callsigns = [
+            f"{random.choice(designators)}{random.randint(1, 9999)}"
+            for _ in range(500000)
+        ]
+
+    start_time = time.perf_counter()
+    resolved = sum(1 for callsign in callsigns if resolver.resolve(callsign))
+    duration = time.perf_counter() - start_time
+
+    log.info("Index: %d callsigns, %d resolved, %.3f us/lookup",
+             len(callsigns), resolved, duration / max(len(callsigns), 1) * 1e6)
+
+    # The previous path needed an airplane lookup followed by this query.
+    sample = callsigns[:1000]
+    start_time = time.perf_counter()
+    for callsign in sample:
+        session.query(models_sql.Airline).filter_by(icao_code=callsign[:3], status="active").all()
+    duration = time.perf_counter() - start_time
+
+    log.info("Postgres: %d callsigns, %.3f us/lookup",
+             len(sample), duration / max(len(sample), 1) * 1e6)
@@ -0,0 +1,412 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Alert rules compiled once and evaluated per SBS message
+
+# Rules are declared in alert_rules.json:
+#
+#   {
+#       "rules": [
+#           {
+#               "name": "emergency",
+#               "content": "🚨 Emergency!",
+#               "dedup_sec": 600,
+#               "any": [
+#                   {"squawk": {"in": ["7500", "7600", "7700"]}},
+#                   {"emergency": {"eq": true}}
+#               ]
+#           }
+#       ]
+#   }
+#
+# A rule matches when every condition in 'when' holds and, if the rule has
+# an 'any' list, the conditions of at least one of its entries hold. Use
+# 'any' rather than two rules when several signals mean the same event:
+# dump1090 sets the emergency flag for the emergency squawks too, and two
+# rules would alert twice for one message. Conditions refer to
+#
+#   - a field of the current SBS message (typed, see sbs_message.FIELD_TYPES)
+#   - 'distance_km', the distance to base
+#   - 'state.<field>', the aggregated state of the aircraft (Redis)
+#   - 'designator', the ICAO type designator from the local reference tables
+#
+# with the operators eq, ne, in, not_in, min, max, prefix, regex and exists.
+# String values starting with '$' are variables, e.g. "$alert_radius_km".
+#
+# Each condition is compiled to a closure and the conditions of a rule are
+# ordered by cost, so a cheap field compare rejects most messages before any
+# regex, distance, Redis or database lookup is made. Lookups are done at most
+# once per message and shared between rules.
+
+import os
+import re
+import json
+import time
+import logging
+
+import sbs_message
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# evaluation cost of a condition, cheapest first
+COST_FIELD = 0
+COST_PATTERN = 1
+COST_DISTANCE = 2
+COST_STATE = 3
+COST_LOOKUP = 4
+
+OPERATORS = ("eq", "ne", "in", "not_in", "min", "max", "prefix", "regex", "exists")
+
+# used when alert_rules.json is missing: the original nearby-aircraft alert
+DEFAULT_RULES = {
+    "rules": [
+        {
+            "name": "nearby",
+            "content": "✈️ Nearby aircraft detected!",
+            "dedup_sec": 600,
+            "when": {
+                "distance_km": {"max": "$alert_radius_km"},
+                "state.callsign": {"exists": True}
+            }
+        }
+    ]
+}
+
+MISSING = object()
+
+
+class Rule_Context():
+    """
+        Per-message view used by the compiled conditions. Typed values and
+        lookups are computed on first use and cached for the other rules.
+    """
+
+    __slots__ = ("sbs_dict", "values", "get_state", "get_designator", "_state", "_designator")
+
+    def __init__(self, sbs_dict, get_state=None, get_designator=None):
+
+        self.sbs_dict = sbs_dict
+        self.values = {}
+        self.get_state = get_state
+        self.get_designator = get_designator
+        self._state = MISSING
+        self._designator = MISSING
+
+
+    def field(self, name):
+
+        value = self.values.get(name, MISSING)
+        if value is MISSING:
+            value = sbs_message.parse_value(name, self.sbs_dict.get(name))
+            self.values[name] = value
+        return value
+
+
+    def distance(self):
+
+        return self.sbs_dict.get("distance_km")
+
+
+    def state(self):
+
+        if self._state is MISSING:
+            self._state = (self.get_state() if self.get_state else None) or {}
+        return self._state
+
+
+    def state_field(self, name):
+
+        return sbs_message.parse_value(name, self.state().get(name))
+
+
+    def designator(self):
+
+        if self._designator is MISSING:
+            self._designator = self.get_designator() if self.get_designator else None
+        return self._designator
+
+
+class Alert_Rule():
+
+    def __init__(self, name, content, dedup_sec, color, checks, conditions=None, any_conditions=None):
+
+        self.name = name
+        self.content = content
+        self.dedup_sec = dedup_sec
+        self.color = color
+        self.checks = checks            # closures ordered by cost
+        self.conditions = conditions    # (field, op, value, test), same order
+        self.any_conditions = any_conditions or []  # one list of conditions per 'any' entry
+
+        self.evaluated_count = 0
+        self.hit_count = 0
+        self.cost_ns = 0
+
+
+    def matches(self, ctx):
+
+        for check in self.checks:
+            if not check(ctx):
+                return False
+        return True
+
+
+    def stats(self):
+
+        return {
+            "evaluated": self.evaluated_count,
+            "hits": self.hit_count,
+            "avg_us": round(self.cost_ns / self.evaluated_count / 1000, 2) if self.evaluated_count else None
+        }
+
+
+def resolve_variable(value, variables):
+
+    if isinstance(value, str) and value.startswith("$"):
+        name = value[1:]
+        if name not in variables:
+            raise ValueError(f"Unknown variable '{value}'")
+        return variables[name]
+
+    if isinstance(value, list):
+        return [resolve_variable(item, variables) for item in value]
+
+    return value
+
+
+def compile_getter(field):
+    """
+        Returns (cost, getter, sbs field name used for typing).
+    """
+
+    if field == "distance_km":
+        return COST_DISTANCE, Rule_Context.distance, "distance_km"
+
+    if field == "designator":
+        return COST_LOOKUP, Rule_Context.designator, "designator"
+
+    if field.startswith("state."):
+        name = field[len("state."):]
+        if name not in sbs_message.SBS_FIELD_NAMES:
+            raise ValueError(f"Unknown state field '{field}'")
+        return COST_STATE, lambda ctx: ctx.state_field(name), name
+
+    if field in sbs_message.SBS_FIELD_NAMES:
+        return COST_FIELD, lambda ctx: ctx.field(field), field
+
+    raise ValueError(f"Unknown field '{field}'")
+
+
+def typed(field, value):
+
+    if isinstance(value, str):
+        parsed = sbs_message.parse_value(field, value)
+        return value if parsed is None else parsed
+    return value
+
+
+def compile_test(op, value, type_field):
+    """
+        Predicate on one typed value (None if missing).
+    """
+
+    if op == "exists":
+        if value:
+            return lambda v: v is not None
+        return lambda v: v is None
+
+    if op == "eq":
+        expected = typed(type_field, value)
+        return lambda v: v == expected
+
+    if op == "ne":
+        expected = typed(type_field, value)
+        return lambda v: v != expected
+
+    if op == "in":
+        values = frozenset(typed(type_field, item) for item in value)
+        return lambda v: v in values
+
+    if op == "not_in":
+        values = frozenset(typed(type_field, item) for item in value)
+        return lambda v: v not in values
+
+    if op == "min":
+        bound = float(value)
+        return lambda v: Alert_Rule_Engine.number(v) >= bound
+
+    if op == "max":
+        bound = float(value)
+        return lambda v: Alert_Rule_Engine.number(v) <= bound
+
+    if op == "prefix":
+        prefixes = tuple(value) if isinstance(value, list) else (value,)
+        return lambda v: str(v or "").startswith(prefixes)
+
+    if op == "regex":
+        pattern = re.compile(value)
+        return lambda v: pattern.search(str(v or "")) is not None
+
+    raise ValueError(f"Unknown operator '{op}'")
+
+
+def compile_condition(field, spec, variables):
+    """
+        Compile {"min": 0, "max": 5000} on 'altitude' into a list of
+        (cost, check, condition) where condition is (field, op, value, test).
+    """
+
+    if not isinstance(spec, dict):
+        spec = {"eq": spec}
+
+    unknown = set(spec) - set(OPERATORS)
+    if unknown:
+        raise ValueError(f"Unknown operator(s) {sorted(unknown)} for field '{field}'")
+
+    cost, get, type_field = compile_getter(field)
+    checks = []
+
+    for op, value in spec.items():
+
+        value = resolve_variable(value, variables)
+        test = compile_test(op, value, type_field)
+
+        check_cost = max(cost, COST_PATTERN) if op == "regex" else cost
+        checks.append((check_cost,
+                       lambda ctx, test=test: test(get(ctx)),
+                       (field, op, value, test)))
+
+    return checks
+
+
+def compile_conditions(name, when, variables):
+
+    checks = []
+    for field, spec in when.items():
+        try:
+            checks.extend(compile_condition(field, spec, variables))
+        except ValueError as e:
+            raise ValueError(f"Alert rule '{name}': {e}") from e
+
+    # stable sort: same-cost conditions keep the order they were declared in
+    checks.sort(key=lambda item: item[0])
+    return checks
+
+
+def compile_rule(rule_config, variables):
+
+    name = rule_config.get("name")
+    if not name:
+        raise ValueError("Alert rule without a name")
+
+    when = rule_config.get("when") or {}
+    any_of = rule_config.get("any") or []
+    if not when and not any_of:
+        raise ValueError(f"Alert rule '{name}' has no conditions")
+
+    if not isinstance(any_of, list) or not all(isinstance(entry, dict) and entry for entry in any_of):
+        raise ValueError(f"Alert rule '{name}': 'any' must be a list of conditions")
+
+    checks = compile_conditions(name, when, variables)
+    groups = [compile_conditions(name, entry, variables) for entry in any_of]
+
+    if groups:
+
+        group_checks = [[check for _, check, _ in group] for group in groups]
+
+        def check_any(ctx):
+            for group in group_checks:
+                if all(check(ctx) for check in group):
+                    return True
+            return False
+
+        # after the 'when' conditions that cost no more than its dearest entry
+        checks.append((max(group[-1][0] for group in groups), check_any, None))
+        checks.sort(key=lambda item: item[0])
+
+    return Alert_Rule(name=name,
+                      content=rule_config.get("content") or f"Alert: {name}",
+                      dedup_sec=int(rule_config.get("dedup_sec", 600)),
+                      color=rule_config.get("color"),
+                      checks=[check for _, check, _ in checks],
+                      conditions=[condition for _, _, condition in checks if condition is not None],
+                      any_conditions=[[condition for _, _, condition in group] for group in groups])
+
+
+class Alert_Rule_Engine():
+
+    def __init__(self, rules):
+
+        self.rules = rules
+
+
+    @staticmethod
+    def number(value):
+
+        # missing values never satisfy a numeric bound
+        if value is None:
+            return float("nan")
+        return value
+
+
+    @classmethod
+    def from_config(cls, config, variables=None):
+
+        variables = variables or {}
+
+        rules = [
+            compile_rule(rule_config, variables)
+            for rule_config in config.get("rules", [])
+            if rule_config.get("enabled", True)
+        ]
+
+        names = [rule.name for rule in rules]
+        if len(names) != len(set(names)):
+            raise ValueError(f"Duplicate alert rule names in {names}")
+
+        return cls(rules)
+
+
+    @classmethod
+    def load(cls, path="alert_rules.json", variables=None):
+
+        if not os.path.exists(path):
+            log.info("%s not found, using the default alert rule.", path)
+            return cls.from_config(DEFAULT_RULES, variables)
+
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+        engine = cls.from_config(config, variables)
+        log.info("Loaded %d alert rules from %s: %s", len(engine.rules), path,
+                 ", ".join(rule.name for rule in engine.rules))
+        return engine
+
+
+    def evaluate(self, sbs_dict, get_state=None, get_designator=None):
+        """
+            Returns (matched rules, context). The context holds the state
+            and designator if a rule had to look them up.
+        """
+
+        ctx = Rule_Context(sbs_dict, get_state, get_designator)
+        matched = []
+
+        for rule in self.rules:
+            start_ns = time.perf_counter_ns()
+            hit = rule.matches(ctx)
+            rule.cost_ns += time.perf_counter_ns() - start_ns
+            rule.evaluated_count += 1
+            if hit:
+                rule.hit_count += 1
+                matched.append(rule)
+
+        return matched, ctx
+
+
+    def stats(self):
+
+        return {
+            rule.name: rule.stats()
+            for rule in self.rules
+        }
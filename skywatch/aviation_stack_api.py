@@ -7,8 +7,10 @@
 import os
 import getpass
 import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from rest_client import REST_API_Client
+from rate_limiter import Rate_Limiter
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger(__name__)
@@ -21,12 +23,17 @@ class Aviation_Stack_REST_API_Client(REST_API_Client):
                  port=None,
                  api_ver=None,
                  base=None,
-                 user=getpass.getuser()):
+                 user=getpass.getuser(),
+                 rate_per_sec=2,
+                 max_workers=4):
 
         super().__init__(host, port, api_ver, base, user)
 
         self.access_token = os.getenv('AVIATION_STACK_API_TOKEN', None)
 
+        self.limiter = Rate_Limiter(rate_per_sec)
+        self.max_workers = max_workers
+
 
     def get_flights(self,
                     flight_status=None, # scheduled, active, landed, cancelled, incident, diverted
@@ -67,8 +74,88 @@ class Aviation_Stack_REST_API_Client(REST_API_Client):
         return True, output
 
 
+    def fetch_page(self, endpoint, search, limit, offset):
+
+        url = f"{self.baseurl}/{endpoint}"
+
+        params = {
+            "access_key": self.access_token,
+            "search": search,
+            "limit": limit,
+            "offset": offset
+        }
+
+        self.limiter.acquire()
+
+        # pages are streamed to the database once, do not cache them
+        return self.request_uncached("GET", url, params=params)
+
+
+    def iter_pages(self, endpoint, search=None, limit=100, max_pages=-1):
+        """
+            Generator of (status, records) per page.
+
+            The first page reveals the total number of records. The remaining
+            pages are then fetched concurrently (within the rate limit) and
+            yielded as they complete, so callers can stream them to the
+            database without holding the whole dataset in memory.
+        """
+
+        status, output = self.fetch_page(endpoint, search, limit, 0)
+        if not status:
+            yield False, output
+            return
+
+        yield True, output.get("data", [])
+
+        pagination = output.get("pagination", {})
+        count = pagination.get("count", 0)
+        total = pagination.get("total", 0)
+
+        if not count or count >= total:
+            return
+
+        offsets = list(range(count, total, count))
+        if max_pages != -1:
+            offsets = offsets[:max(max_pages - 1, 0)]
+
+        # keep a bounded number of pages in flight
+        max_in_flight = self.max_workers * 2
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+
+            pending = set()
+            offsets_iter = iter(offsets)
+
+            for offset in offsets_iter:
+                pending.add(pool.submit(self.fetch_page, endpoint, search, count, offset))
+                if len(pending) >= max_in_flight:
+                    break
+
+            while pending:
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+
+                    status, output = future.result()
+                    if not status:
+                        for future_pending in pending:
+                            future_pending.cancel()
+                        yield False, output
+                        return
+
+                    yield True, output.get("data", [])
+
+                    offset = next(offsets_iter, None)
+                    if offset is not None:
+                        pending.add(pool.submit(self.fetch_page, endpoint, search, count, offset))
+
+
     def get_airports(self, search=None, limit=100, max_pages=-1):
         """
+            Generator of (status, records) per page, see iter_pages. A record:
+
             {
                 "id": "3487527",
                 "gmt": "-10",
@@ -87,46 +174,13 @@ class Aviation_Stack_REST_API_Client(REST_API_Client):
             }
         """
 
-        url = f"{self.baseurl}/airports"
-
-        offset = 0
-        page_num = 1
-        results = []
-
-        while True:
-
-            params = {
-                "access_key": self.access_token,
-                "search": search,
-                "limit": limit,
-                "offset": offset
-            }
-
-            status, output = self.request("GET", url, params=params)
-            if not status:
-                return False, output
-
-            data = output.get("data", [])
-            results.extend(data)
-
-            pagination = output.get("pagination", {})
-            count = pagination.get("count", 0)
-            total = pagination.get("total", 0)
-
-            if len(results) >= total:
-                break
-
-            if max_pages != -1 and page_num >= max_pages:
-                break
-
-            page_num += 1
-            offset += count
-
-        return True, results
+        return self.iter_pages("airports", search, limit, max_pages)
 
 
     def get_airlines(self, search=None, limit=100, max_pages=-1):
         """
+            Generator of (status, records) per page, see iter_pages. A record:
+
             {
                 "id": "4439746",
                 "fleet_average_age": "6.3",
@@ -146,46 +200,13 @@ class Aviation_Stack_REST_API_Client(REST_API_Client):
             }
         """
 
-        url = f"{self.baseurl}/airlines"
-
-        offset = 0
-        page_num = 1
-        results = []
-
-        while True:
-
-            params = {
-                "access_key": self.access_token,
-                "search": search,
-                "limit": limit,
-                "offset": offset
-            }
-
-            status, output = self.request("GET", url, params=params)
-            if not status:
-                return False, output
-
-            data = output.get("data", [])
-            results.extend(data)
-
-            pagination = output.get("pagination", {})
-            count = pagination.get("count", 0)
-            total = pagination.get("total", 0)
-
-            if len(results) >= total:
-                break
-
-            if max_pages != -1 and page_num >= max_pages:
-                break
-
-            page_num += 1
-            offset += count
-
-        return True, results
+        return self.iter_pages("airlines", search, limit, max_pages)
 
 
     def get_airplanes(self, search=None, limit=100, max_pages=-1):
         """
+            Generator of (status, records) per page, see iter_pages. A record:
+
             {
                 "id": "6454205",
                 "iata_type": "ATR72-500",
@@ -216,92 +237,26 @@ class Aviation_Stack_REST_API_Client(REST_API_Client):
             }
         """
 
-        url = f"{self.baseurl}/airplanes"
-
-        offset = 0
-        page_num = 1
-        results = []
-
-        while True:
-
-            params = {
-                "access_key": self.access_token,
-                "search": search,
-                "limit": limit,
-                "offset": offset
-            }
-
-            status, output = self.request("GET", url, params=params)
-            if not status:
-                return False, output
-
-            data = output.get("data", [])
-            results.extend(data)
-
-            pagination = output.get("pagination", {})
-            count = pagination.get("count", 0)
-            total = pagination.get("total", 0)
-
-            if len(results) >= total:
-                break
-
-            if max_pages != -1 and page_num >= max_pages:
-                break
-
-            page_num += 1
-            offset += count
-
-        return True, results
+        return self.iter_pages("airplanes", search, limit, max_pages)
 
 
     def get_aircraft_types(self, search=None, limit=100, max_pages=-1):
         """
+            Generator of (status, records) per page, see iter_pages. A record:
+
             'id' = '22228'
             'iata_code' = '100'
             'aircraft_name' = 'Fokker 100'
             'plane_type_id' = '1'
         """
 
-        url = f"{self.baseurl}/aircraft_types"
-
-        offset = 0
-        page_num = 1
-        results = []
-
-        while True:
-
-            params = {
-                "access_key": self.access_token,
-                "search": search,
-                "limit": limit,
-                "offset": offset
-            }
-
-            status, output = self.request("GET", url, params=params)
-            if not status:
-                return False, output
-
-            data = output.get("data", [])
-            results.extend(data)
-
-            pagination = output.get("pagination", {})
-            count = pagination.get("count", 0)
-            total = pagination.get("total", 0)
-
-            if len(results) >= total:
-                break
-
-            if max_pages != -1 and page_num >= max_pages:
-                break
-
-            page_num += 1
-            offset += count
-
-        return True, results
+        return self.iter_pages("aircraft_types", search, limit, max_pages)
 
 
     def get_countries(self, search=None, limit=100, max_pages=-1):
         """
+            Generator of (status, records) per page, see iter_pages. A record:
+
             {
                 "id": "83665",
                 "capital": "Andorra la Vella",
@@ -319,46 +274,13 @@ class Aviation_Stack_REST_API_Client(REST_API_Client):
             }
         """
 
-        url = f"{self.baseurl}/countries"
-
-        offset = 0
-        page_num = 1
-        results = []
-
-        while True:
-
-            params = {
-                "access_key": self.access_token,
-                "search": search,
-                "limit": limit,
-                "offset": offset
-            }
-
-            status, output = self.request("GET", url, params=params)
-            if not status:
-                return False, output
-
-            data = output.get("data", [])
-            results.extend(data)
-
-            pagination = output.get("pagination", {})
-            count = pagination.get("count", 0)
-            total = pagination.get("total", 0)
-
-            if len(results) >= total:
-                break
-
-            if max_pages != -1 and page_num >= max_pages:
-                break
-
-            page_num += 1
-            offset += count
-
-        return True, results
+        return self.iter_pages("countries", search, limit, max_pages)
 
 
     def get_cities(self, search=None, limit=100, max_pages=-1):
         """
+            Generator of (status, records) per page, see iter_pages. A record:
+
             {
                 "id": "3157947",
                 "gmt": "-10",
@@ -373,42 +295,7 @@ class Aviation_Stack_REST_API_Client(REST_API_Client):
             }
         """
 
-        url = f"{self.baseurl}/cities"
-
-        offset = 0
-        page_num = 1
-        results = []
-
-        while True:
-
-            params = {
-                "access_key": self.access_token,
-                "search": search,
-                "limit": limit,
-                "offset": offset
-            }
-
-            status, output = self.request("GET", url, params=params)
-            if not status:
-                return False, output
-
-            data = output.get("data", [])
-            results.extend(data)
-
-            pagination = output.get("pagination", {})
-            count = pagination.get("count", 0)
-            total = pagination.get("total", 0)
-
-            if len(results) >= total:
-                break
-
-            if max_pages != -1 and page_num >= max_pages:
-                break
-
-            page_num += 1
-            offset += count
-
-        return True, results
+        return self.iter_pages("cities", search, limit, max_pages)
 
 
 if __name__ == "__main__":
@@ -417,4 +304,18 @@ if __name__ == "__main__":
 
     status, output = as_h.get_flights(flight_number="UA549")
 
+    # stream the (large) airplanes dataset straight into Postgres
+    import models_sql
+
+    def airplane_pages():
+        for status, data in as_h.get_airplanes():
+            if not status:
+                log.error("Fetching airplanes failed: %s", data)
+                return
+            yield data
+
+    models_sql.upsert_pages(models_sql.Airplane,
+                            airplane_pages(),
+                            date_fields=["delivery_date", "first_flight_date"])
+
     bla = 0
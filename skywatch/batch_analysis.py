@@ -0,0 +1,756 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Headless batch analysis of recorded SBS traffic
+
+# Runs the SkyWatch stages (tokenize, distance to base, aggregation, alert
+# rules) over recorded logs or Parquet archives, without Redis, Discord or
+# the live socket. Data is processed in chunks of a few hundred thousand
+# messages, column by column:
+#
+#   tokenize     Arrow's CSV reader with the schema of parquet_archive.py,
+#                or the Parquet archive directly. Only 'MSG' rows with a
+#                hex_ident are kept, as in sbs_message.tokenize.
+#   distance     haversine over the whole chunk with numpy (the live path
+#                uses geopy's geodesic; the difference is below 0.5%).
+#   aggregation  the Redis aggregate (sbs_message.merge_fields) is the last
+#                non-empty value of each field per aircraft. It is computed
+#                as a forward fill grouped by aircraft, carried over chunks.
+#   alert rules  every condition of a rule is turned into a mask over the
+#                chunk, using the rule's own predicates on the distinct
+#                values of a column. The few rows left are checked with the
+#                rule itself and de-duplicated per aircraft with dedup_sec
+#                in message time. 'designator' conditions are only checked
+#                in that last step.
+#
+# Outputs (in --output):
+#
+#   aircraft.csv     one row per aircraft
+#   alerts.csv       alert candidates
+#   summary.json     totals, max-range stats and per-rule counts
+#
+# Usage:
+#
+#   python batch_analysis.py aircraft_log.csv --home-lat 37.7 --home-lon -122.2
+#   python batch_analysis.py archive/ --home-lat 37.7 --home-lon -122.2 --rules alert_rules.json --radius 10
+
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+import logging
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import log_index
+import parquet_archive
+import sbs_message
+from alert_rules import Alert_Rule_Engine, Rule_Context
+from cpa_predictor import EARTH_RADIUS_KM
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# read for every run, to filter and time the messages
+BASE_FIELDS = [
+    "message_type",
+    "hex_ident",
+    "generated_date",
+    "generated_time",
+    "logged_date",
+    "logged_time"
+]
+
+# used by the summary, rule fields are added to these
+SUMMARY_FIELDS = [
+    "callsign",
+    "altitude",
+    "ground_speed",
+    "latitude",
+    "longitude",
+    "squawk",
+    "emergency"
+]
+
+# aggregated per aircraft for the summary
+SUMMARY_STATE_FIELDS = ["callsign", "squawk"]
+
+NUMERIC_FIELDS = frozenset(
+    field for field, converter in sbs_message.FIELD_TYPES.items() if converter in (int, float)
+)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def group_rows(group):
+    """
+        Rows sorted by group, keeping their order within a group.
+    """
+
+    order = np.argsort(group, kind="stable")
+    sorted_group = group[order]
+    positions = np.arange(len(group))
+
+    starts = np.ones(len(group), dtype=bool)
+    starts[1:] = sorted_group[1:] != sorted_group[:-1]
+
+    ends = np.ones(len(group), dtype=bool)
+    ends[:-1] = starts[1:]
+
+    group_start = np.maximum.accumulate(np.where(starts, positions, 0))
+
+    return order, sorted_group, group_start, ends
+
+
+def forward_fill(grouping, values, valid, carry):
+    """
+        Last valid value per row within its group, up to and including the
+        row. Rows before the first valid value of their group take
+        carry[group]. carry is updated with the last value of each group.
+    """
+
+    order, sorted_group, group_start, ends = grouping
+
+    if len(order) == 0:
+        return values.copy()
+
+    positions = np.arange(len(order))
+    last = np.maximum.accumulate(np.where(valid[order], positions, -1))
+
+    filled_sorted = np.where(last >= group_start,
+                             values[order][np.maximum(last, 0)],
+                             carry[sorted_group])
+
+    carry[sorted_group[ends]] = filled_sorted[ends]
+
+    filled = np.empty_like(filled_sorted)
+    filled[order] = filled_sorted
+    return filled
+
+
+def grow(array, size, fill):
+
+    if len(array) >= size:
+        return array
+
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class Batch_Analysis():
+
+    def __init__(self, home_lat, home_lon, alert_rules, get_designator=None):
+
+        self.home_lat = home_lat
+        self.home_lon = home_lon
+        self.alert_rules = alert_rules
+        self.get_designator = get_designator
+
+        # fields the rules look at, in the message and in the aggregate
+        self.rule_fields = set()
+        self.state_fields = set(SUMMARY_STATE_FIELDS)
+
+        for rule in alert_rules.rules:
+            conditions = rule.conditions + [condition for group in rule.any_conditions for condition in group]
+            for field, _, _, _ in conditions:
+                if field.startswith("state."):
+                    self.state_fields.add(field[len("state."):])
+                elif field not in ("distance_km", "designator"):
+                    self.rule_fields.add(field)
+
+        self.value_fields = list(dict.fromkeys(SUMMARY_FIELDS + sorted(self.rule_fields | self.state_fields)))
+        self.fields = BASE_FIELDS + [field for field in self.value_fields if field not in BASE_FIELDS]
+
+        # field -> (value -> code, values); codes are shared by all chunks
+        self.dictionaries = {}
+
+        # per aircraft, indexed by the code of hex_ident
+        self.aircraft = {
+            "messages": np.zeros(0, dtype=np.int64),
+            "positions": np.zeros(0, dtype=np.int64),
+            "first_seen": np.zeros(0),
+            "last_seen": np.zeros(0),
+            "min_altitude": np.zeros(0),
+            "max_altitude": np.zeros(0),
+            "max_ground_speed": np.zeros(0),
+            "min_distance_km": np.zeros(0),
+            "max_distance_km": np.zeros(0),
+            "emergency": np.zeros(0, dtype=bool),
+        }
+        self.aircraft_fill = {
+            "messages": 0,
+            "positions": 0,
+            "first_seen": np.inf,
+            "last_seen": -np.inf,
+            "min_altitude": np.nan,
+            "max_altitude": np.nan,
+            "max_ground_speed": np.nan,
+            "min_distance_km": np.nan,
+            "max_distance_km": np.nan,
+            "emergency": False,
+        }
+
+        # aggregate carried between chunks: field -> per aircraft value
+        self.carry = {}
+
+        self.date_epochs = {}
+        self.last_alert = {}        # (rule, aircraft) -> message time
+        self.alerts = []
+        self.rule_counts = {rule.name: {"candidates": 0, "alerts": 0} for rule in alert_rules.rules}
+
+        self.message_count = 0
+        self.position_count = 0
+        self.chunk_count = 0
+        self.duration = 0.0
+
+        self.max_range = (None, None, None)     # km, aircraft code, time
+        self.hourly_range = {}                  # hour start (epoch) -> km
+
+    ###############################################################################
+
+    def dictionary(self, field):
+
+        if field not in self.dictionaries:
+            self.dictionaries[field] = ({}, [])
+        return self.dictionaries[field]
+
+
+    def encode(self, field, array):
+        """
+            Arrow column -> int64 codes into the dictionary of the field, -1 if missing.
+        """
+
+        index, values = self.dictionary(field)
+
+        if pa.types.is_boolean(array.type):
+            if not values:
+                index.update({False: 0, True: 1})
+                values.extend((False, True))
+            return pc.fill_null(pc.cast(array, pa.int64()), -1).to_numpy(zero_copy_only=False)
+
+        if pa.types.is_string(array.type):
+            array = pc.utf8_trim_whitespace(array)
+        else:
+            array = pc.cast(array, pa.string())
+
+        encoded = pc.dictionary_encode(array)
+
+        mapping = []
+        for value in encoded.dictionary.to_pylist():
+            value = sbs_message.parse_value(field, value) if field in sbs_message.FIELD_TYPES else (value or None)
+            if value is None:
+                mapping.append(-1)
+                continue
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(values)
+                values.append(value)
+            mapping.append(code)
+        mapping.append(-1)
+
+        indices = pc.fill_null(encoded.indices, len(mapping) - 1).to_numpy(zero_copy_only=False)
+        return np.array(mapping, dtype=np.int64)[indices]
+
+
+    def decode(self, field, code):
+
+        return self.dictionary(field)[1][code] if code >= 0 else None
+
+
+    @staticmethod
+    def number(field, value):
+        """
+            Element of a numeric column as the live path types it.
+        """
+
+        if np.isnan(value):
+            return None
+        if sbs_message.FIELD_TYPES.get(field) is int:
+            return int(value)
+        return float(value)
+
+
+    @staticmethod
+    def numbers(array):
+        """
+            float64 values, NaN for missing and malformed ones.
+        """
+
+        values, _ = parquet_archive.cast_column(array, pa.float64())
+        return values.to_numpy(zero_copy_only=False)
+
+
+    def load_column(self, field, array):
+
+        if field in NUMERIC_FIELDS:
+            return self.numbers(array)
+        return self.encode(field, array)
+
+
+    def timestamps(self, date_array, time_array):
+        """
+            Epoch seconds of date and time fields, NaN if missing.
+        """
+
+        # few distinct dates and minutes, parsed once each
+        date_codes = self.encode("date", date_array)
+        epochs = np.array([self.epoch(value) for value in self.dictionary("date")[1]] + [np.nan])
+
+        time_array = pc.utf8_trim_whitespace(time_array)
+        minute_codes = self.encode("minute", pc.utf8_slice_codeunits(time_array, 0, 5))
+        offsets = np.array([self.minute_offset(value) for value in self.dictionary("minute")[1]] + [np.nan])
+
+        seconds = self.numbers(pc.utf8_slice_codeunits(time_array, 6, 20))
+
+        return epochs[date_codes] + offsets[minute_codes] + seconds
+
+
+    def epoch(self, date_str):
+
+        if date_str not in self.date_epochs:
+            try:
+                self.date_epochs[date_str] = datetime.strptime(date_str, "%Y/%m/%d").timestamp()
+            except ValueError:
+                self.date_epochs[date_str] = np.nan
+        return self.date_epochs[date_str]
+
+
+    @staticmethod
+    def minute_offset(minute_str):
+        """
+            '22:48' -> seconds since midnight
+        """
+
+        try:
+            hours, minutes = minute_str.split(":")
+            return int(hours) * 3600 + int(minutes) * 60
+        except ValueError:
+            return np.nan
+
+    ###############################################################################
+
+    def process(self, batch):
+
+        start_time = time.perf_counter()
+
+        # tokenize: MSG lines with a hex_ident
+        hex_array = pc.utf8_trim_whitespace(batch.column("hex_ident"))
+        keep = pc.and_(pc.equal(batch.column("message_type"), "MSG"),
+                       pc.greater(pc.utf8_length(hex_array), 0))
+        keep = pc.fill_null(keep, False)
+        if not pc.all(keep).as_py():
+            batch = batch.filter(keep)
+
+        count = batch.num_rows
+        if count == 0:
+            return
+
+        aircraft = self.encode("hex_ident", batch.column("hex_ident"))
+        aircraft_count = len(self.dictionary("hex_ident")[1])
+
+        for name, array in self.aircraft.items():
+            self.aircraft[name] = grow(array, aircraft_count, self.aircraft_fill[name])
+
+        columns = {
+            field: self.load_column(field, batch.column(field))
+            for field in self.value_fields
+        }
+
+        timestamp = self.timestamps(batch.column("generated_date"), batch.column("generated_time"))
+        missing = np.isnan(timestamp)
+        if missing.any():
+            logged = self.timestamps(batch.column("logged_date"), batch.column("logged_time"))
+            timestamp = np.where(missing, logged, timestamp)
+
+        # distance to base
+        latitude = columns["latitude"]
+        longitude = columns["longitude"]
+        distance = haversine_km(self.home_lat, self.home_lon, latitude, longitude)
+
+        # aggregation
+        grouping = group_rows(aircraft)
+        state = {}
+        for field in self.state_fields:
+            values = columns[field]
+            if field in NUMERIC_FIELDS:
+                carry = self.carry.setdefault(field, np.full(0, np.nan))
+                carry = self.carry[field] = grow(carry, aircraft_count, np.nan)
+                state[field] = forward_fill(grouping, values, ~np.isnan(values), carry)
+            else:
+                carry = self.carry.setdefault(field, np.full(0, -1, dtype=np.int64))
+                carry = self.carry[field] = grow(carry, aircraft_count, -1)
+                state[field] = forward_fill(grouping, values, values >= 0, carry)
+
+        self.summarize(aircraft, timestamp, columns, distance)
+        self.evaluate_rules(aircraft, timestamp, columns, distance, state)
+
+        self.message_count += count
+        self.chunk_count += 1
+        self.duration += time.perf_counter() - start_time
+
+
+    def summarize(self, aircraft, timestamp, columns, distance):
+
+        stats = self.aircraft
+        has_position = ~np.isnan(distance)
+
+        stats["messages"] += np.bincount(aircraft, minlength=len(stats["messages"]))
+        stats["positions"] += np.bincount(aircraft[has_position], minlength=len(stats["positions"]))
+        np.fmin.at(stats["first_seen"], aircraft, timestamp)
+        np.fmax.at(stats["last_seen"], aircraft, timestamp)
+        np.fmin.at(stats["min_altitude"], aircraft, columns["altitude"])
+        np.fmax.at(stats["max_altitude"], aircraft, columns["altitude"])
+        np.fmax.at(stats["max_ground_speed"], aircraft, columns["ground_speed"])
+        np.fmin.at(stats["min_distance_km"], aircraft, distance)
+        np.fmax.at(stats["max_distance_km"], aircraft, distance)
+
+        _, flags = self.dictionary("emergency")
+        emergency_codes = [code for code, value in enumerate(flags) if value]
+        if emergency_codes:
+            stats["emergency"][aircraft[np.isin(columns["emergency"], emergency_codes)]] = True
+
+        self.position_count += int(has_position.sum())
+
+        if not has_position.any():
+            return
+
+        # max range, overall and per hour
+        row = int(np.nanargmax(distance))
+        if self.max_range[0] is None or distance[row] > self.max_range[0]:
+            self.max_range = (float(distance[row]), int(aircraft[row]), float(timestamp[row]))
+
+        hours = np.floor(timestamp[has_position] / 3600) * 3600
+        valid = ~np.isnan(hours)
+        unique_hours, inverse = np.unique(hours[valid], return_inverse=True)
+        hourly = np.full(len(unique_hours), np.nan)
+        np.fmax.at(hourly, inverse, distance[has_position][valid])
+
+        for hour, km in zip(unique_hours.tolist(), hourly.tolist()):
+            self.hourly_range[hour] = max(km, self.hourly_range.get(hour, 0.0))
+
+    ###############################################################################
+
+    def condition_mask(self, field, test, columns, distance, state):
+        """
+            Rows where the condition holds, or None if it cannot be
+            checked on the chunk (designator).
+        """
+
+        if field == "designator":
+            return None
+
+        if field == "distance_km":
+            name, values = field, distance
+        elif field.startswith("state."):
+            name = field[len("state."):]
+            values = state[name]
+        else:
+            name, values = field, columns[field]
+
+        if name in NUMERIC_FIELDS or name == "distance_km":
+            unique, inverse = np.unique(values, return_inverse=True)
+            table = np.array([test(self.number(name, value)) for value in unique.tolist()], dtype=bool)
+            return table[inverse]
+
+        # codes: the last entry is the missing value, indexed by -1
+        _, dictionary = self.dictionary(name)
+        table = np.array([test(value) for value in dictionary] + [test(None)], dtype=bool)
+        return table[values]
+
+
+    def row_value(self, field, values, row):
+
+        if field in NUMERIC_FIELDS or field == "distance_km":
+            return self.number(field, values[row])
+        return self.decode(field, int(values[row]))
+
+
+    def conditions_mask(self, conditions, columns, distance, state):
+        """
+            Rows on which all the conditions hold, None if none of them
+            can be checked on the columns.
+        """
+
+        mask = None
+        for field, op, value, test in conditions:
+
+            if op in ("min", "max") and (field == "distance_km" or field in NUMERIC_FIELDS):
+                # numeric bound, NaN never satisfies it
+                values = distance if field == "distance_km" else columns[field]
+                condition = values >= float(value) if op == "min" else values <= float(value)
+            else:
+                condition = self.condition_mask(field, test, columns, distance, state)
+
+            if condition is not None:
+                mask = condition if mask is None else mask & condition
+
+        return mask
+
+
+    def evaluate_rules(self, aircraft, timestamp, columns, distance, state):
+
+        for rule in self.alert_rules.rules:
+
+            mask = self.conditions_mask(rule.conditions, columns, distance, state)
+
+            if rule.any_conditions:
+                # any entry may hold; an entry without a mask keeps every row
+                masks = [self.conditions_mask(group, columns, distance, state) for group in rule.any_conditions]
+                if all(group_mask is not None for group_mask in masks):
+                    any_mask = np.logical_or.reduce(masks)
+                    mask = any_mask if mask is None else mask & any_mask
+
+            rows = np.flatnonzero(mask) if mask is not None else np.arange(len(aircraft))
+            self.rule_counts[rule.name]["candidates"] += len(rows)
+
+            for row in rows.tolist():
+
+                code = int(aircraft[row])
+                message_time = float(timestamp[row])
+
+                last = self.last_alert.get((rule.name, code))
+                if last is not None and message_time - last < rule.dedup_sec:
+                    continue
+
+                # the rule itself decides, on the row and its aggregate
+                sbs_dict = {field: self.row_value(field, values, row) for field, values in columns.items()}
+                sbs_dict["hex_ident"] = self.decode("hex_ident", code)
+                sbs_dict["distance_km"] = self.row_value("distance_km", distance, row)
+                aggregate = {field: self.row_value(field, values, row) for field, values in state.items()}
+
+                hex_ident = sbs_dict["hex_ident"]
+                ctx = Rule_Context(sbs_dict,
+                                   get_state=lambda: aggregate,
+                                   get_designator=(lambda: self.get_designator(hex_ident)) if self.get_designator else None)
+                if not rule.matches(ctx):
+                    continue
+
+                self.last_alert[(rule.name, code)] = message_time
+                self.rule_counts[rule.name]["alerts"] += 1
+
+                self.alerts.append({
+                    "time": datetime.fromtimestamp(message_time).isoformat(sep=" ") if not np.isnan(message_time) else None,
+                    "rule": rule.name,
+                    "hex_ident": hex_ident,
+                    "callsign": aggregate.get("callsign"),
+                    "squawk": aggregate.get("squawk"),
+                    "altitude": sbs_dict.get("altitude"),
+                    "latitude": sbs_dict.get("latitude"),
+                    "longitude": sbs_dict.get("longitude"),
+                    "distance_km": round(sbs_dict["distance_km"], 2) if sbs_dict["distance_km"] is not None else None
+                })
+
+    ###############################################################################
+
+    def aircraft_rows(self):
+
+        stats = self.aircraft
+        _, hexes = self.dictionary("hex_ident")
+
+        def number(value, digits=None):
+            if not np.isfinite(value):
+                return None
+            return round(float(value), digits) if digits is not None else int(value)
+
+        def stamp(value):
+            return datetime.fromtimestamp(value).isoformat(sep=" ") if np.isfinite(value) else None
+
+        for code, hex_ident in enumerate(hexes):
+            yield {
+                "hex_ident": hex_ident,
+                "callsign": self.decode("callsign", int(self.carry["callsign"][code])),
+                "squawk": self.decode("squawk", int(self.carry["squawk"][code])),
+                "messages": int(stats["messages"][code]),
+                "positions": int(stats["positions"][code]),
+                "first_seen": stamp(stats["first_seen"][code]),
+                "last_seen": stamp(stats["last_seen"][code]),
+                "min_altitude": number(stats["min_altitude"][code]),
+                "max_altitude": number(stats["max_altitude"][code]),
+                "max_ground_speed": number(stats["max_ground_speed"][code], 1),
+                "min_distance_km": number(stats["min_distance_km"][code], 2),
+                "max_distance_km": number(stats["max_distance_km"][code], 2),
+                "emergency": bool(stats["emergency"][code]),
+            }
+
+
+    def summary(self):
+
+        max_km, max_code, max_time = self.max_range
+        _, hexes = self.dictionary("hex_ident")
+
+        return {
+            "messages": self.message_count,
+            "positions": self.position_count,
+            "aircraft": len(hexes),
+            "chunks": self.chunk_count,
+            "processing_sec": round(self.duration, 2),
+            "messages_per_sec": round(self.message_count / self.duration) if self.duration else None,
+            "max_range": {
+                "distance_km": round(max_km, 2) if max_km is not None else None,
+                "hex_ident": hexes[max_code] if max_code is not None else None,
+                "time": datetime.fromtimestamp(max_time).isoformat(sep=" ") if max_time is not None else None,
+            },
+            "max_range_by_hour": {
+                datetime.fromtimestamp(hour).strftime("%Y-%m-%d %H:00"): round(km, 2)
+                for hour, km in sorted(self.hourly_range.items())
+            },
+            "rules": self.rule_counts,
+        }
+
+
+    def write(self, directory):
+
+        os.makedirs(directory, exist_ok=True)
+
+        rows = list(self.aircraft_rows())
+        with open(os.path.join(directory, "aircraft.csv"), mode="w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["hex_ident"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+        fieldnames = ["time", "rule", "hex_ident", "callsign", "squawk", "altitude", "latitude", "longitude", "distance_km"]
+        with open(os.path.join(directory, "alerts.csv"), mode="w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(self.alerts)
+
+        with open(os.path.join(directory, "summary.json"), mode="w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=4)
+
+###############################################################################
+
+def read_batches(paths, columns, block_size=32*1024*1024):
+    """
+        Record batches from Parquet archives and CSV logs (plain or compressed).
+    """
+
+    # read as text and cast, so a malformed value is null instead of an error
+    convert_options = pa_csv.ConvertOptions(
+        column_types=parquet_archive.TEXT_SCHEMA,
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=True,
+        include_columns=columns
+    )
+
+    for path in paths:
+
+        if os.path.isdir(path):
+            parquet_files = sorted(glob.glob(os.path.join(path, "*.parquet")))
+            csv_files = log_index.expand_segments([path])
+        elif path.endswith(".parquet"):
+            parquet_files, csv_files = [path], []
+        else:
+            parquet_files, csv_files = [], log_index.expand_segments([path])
+
+        for parquet_path in parquet_files:
+            log.info("Reading %s", parquet_path)
+            yield from pq.ParquetFile(parquet_path).iter_batches(batch_size=500000, columns=columns)
+
+        for csv_path in csv_files:
+
+            with log_index.open_stream(csv_path) as f:
+                has_header = f.readline().startswith(log_index.HEADER_PREFIX)
+
+            read_options = pa_csv.ReadOptions(column_names=parquet_archive.SBS_SCHEMA.names,
+                                              skip_rows=1 if has_header else 0,
+                                              block_size=block_size)
+
+            log.info("Reading %s", csv_path)
+
+            invalid = 0
+            for batch in pa_csv.open_csv(pa.input_stream(csv_path, compression="detect"),
+                                         read_options=read_options,
+                                         parse_options=parquet_archive.PARSE_OPTIONS,
+                                         convert_options=convert_options):
+                batch, count = parquet_archive.cast_columns(batch)
+                invalid += count
+                yield batch
+
+            if invalid:
+                log.warning("%s: %d values could not be converted and were read as null", csv_path, invalid)
+
+
+def local_designator_lookup():
+    """
+        Designators from the local reference tables (Postgres), cached per aircraft.
+    """
+
+    import data_access
+    import aircraft_registry
+
+    cache = {}
+
+    def lookup(hex_ident):
+
+        hex_ident = hex_ident.strip().upper()
+        if hex_ident not in cache:
+            designator = None
+            airplane = data_access.get_airplane(hex_ident)
+            if airplane:
+                designator = airplane.get("iata_code_long")
+            else:
+                output = aircraft_registry.lookup(hex_ident)
+                if output:
+                    designator = output.get("ICAOTypeCode")
+            cache[hex_ident] = designator
+        return cache[hex_ident]
+
+    return lookup
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run SkyWatch analysis over recorded SBS logs or Parquet archives.")
+    parser.add_argument("paths", nargs="+", help="CSV log, rotated segment, Parquet file or archive directory")
+    parser.add_argument("--home-lat", type=float, required=True)
+    parser.add_argument("--home-lon", type=float, required=True)
+    parser.add_argument("--radius", type=float, default=10, help="alert_radius_km used by the rules")
+    parser.add_argument("--rules", default="alert_rules.json", help="alert rules file")
+    parser.add_argument("--designators", action="store_true", help="look up designators in the local database")
+    parser.add_argument("-o", "--output", default="batch_output", help="output directory")
+    args = parser.parse_args()
+
+    engine = Alert_Rule_Engine.load(args.rules, variables={"alert_radius_km": args.radius})
+
+    analysis = Batch_Analysis(args.home_lat,
+                              args.home_lon,
+                              engine,
+                              get_designator=local_designator_lookup() if args.designators else None)
+
+    start_time = time.perf_counter()
+
+    try:
+        for batch in read_batches(args.paths, analysis.fields):
+            analysis.process(batch)
+    except (OSError, pa.ArrowInvalid) as e:
+        log.error("Cannot read input: %s", e)
+        sys.exit(1)
+
+    analysis.write(args.output)
+
+    summary = analysis.summary()
+    duration = time.perf_counter() - start_time
+
+    log.info("Processed %d messages from %d aircraft in %.1f s (%.0f msg/sec, processing %.1f s)",
+             summary["messages"], summary["aircraft"], duration,
+             summary["messages"] / duration if duration else 0, summary["processing_sec"])
+    log.info("Max range: %s", summary["max_range"])
+    for name, counts in summary["rules"].items():
+        log.info("Rule %-20s %8d candidates, %6d alerts", name, counts["candidates"], counts["alerts"])
+    log.info("Results written to %s", args.output)
@@ -0,0 +1,30 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Build the designator -> shape table from ICAO Doc 8643
+
+# Re-run this whenever db/ICAO-doc8643-2019.csv or the icon tables in
+# get_aircraft_svg.py change:
+#
+#   python build_designator_shapes.py
+
+import os
+import logging
+
+import get_aircraft_svg
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+CSV_PATH = "db/ICAO-doc8643-2019.csv"
+OUT_PATH = "db/designator_shapes.json"
+
+
+if __name__ == "__main__":
+
+    designators = get_aircraft_svg.build_designator_shapes(CSV_PATH, OUT_PATH)
+
+    log.info("Wrote %d designators (%d shapes) to %s (%d bytes).",
+             len(designators),
+             len(set(designators.values())),
+             OUT_PATH,
+             os.path.getsize(OUT_PATH))
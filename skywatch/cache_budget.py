@@ -0,0 +1,240 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Memory budget for cached REST responses
+
+# REST responses are cached in Redis, most of them without a TTL. On a
+# memory-limited Pi this grows forever. A global 'maxmemory-policy' is not an
+# option, since it would also evict live 'aircraft_aggregate:*' state.
+#
+# Instead, every cached key is registered in a sorted index:
+#
+#   <prefix>:index  (zset)  cached key -> last access time (lru) or hit count (lfu)
+#   <prefix>:meta   (hash)  cached key -> "<namespace>|<size in bytes>"
+#   <prefix>:stats  (hash)  "<namespace>:keys" / "<namespace>:bytes" counters
+#
+# Once the budget is exceeded, keys with the lowest score are evicted.
+# Only keys registered through this class are ever deleted.
+
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+TOTAL = "_total"
+
+# KEYS: index, meta, stats
+# ARGV: key
+LUA_FORGET = """
+local old = redis.call('HGET', KEYS[2], ARGV[1])
+if not old then
+    return 0
+end
+local sep = string.find(old, '|', 1, true)
+local ns = string.sub(old, 1, sep - 1)
+local size = tonumber(string.sub(old, sep + 1))
+redis.call('HINCRBY', KEYS[3], ns .. ':bytes', -size)
+redis.call('HINCRBY', KEYS[3], ns .. ':keys', -1)
+redis.call('HINCRBY', KEYS[3], '_total:bytes', -size)
+redis.call('HINCRBY', KEYS[3], '_total:keys', -1)
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: index, meta, stats
+# ARGV: key, namespace, size, score, policy
+LUA_TRACK = """
+local old = redis.call('HGET', KEYS[2], ARGV[1])
+if old then
+    local sep = string.find(old, '|', 1, true)
+    local old_ns = string.sub(old, 1, sep - 1)
+    local old_size = tonumber(string.sub(old, sep + 1))
+    redis.call('HINCRBY', KEYS[3], old_ns .. ':bytes', -old_size)
+    redis.call('HINCRBY', KEYS[3], old_ns .. ':keys', -1)
+    redis.call('HINCRBY', KEYS[3], '_total:bytes', -old_size)
+    redis.call('HINCRBY', KEYS[3], '_total:keys', -1)
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2] .. '|' .. ARGV[3])
+redis.call('HINCRBY', KEYS[3], ARGV[2] .. ':bytes', ARGV[3])
+redis.call('HINCRBY', KEYS[3], ARGV[2] .. ':keys', 1)
+redis.call('HINCRBY', KEYS[3], '_total:bytes', ARGV[3])
+redis.call('HINCRBY', KEYS[3], '_total:keys', 1)
+if ARGV[5] == 'lfu' then
+    redis.call('ZINCRBY', KEYS[1], 1, ARGV[1])
+else
+    redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+end
+return 1
+"""
+
+# KEYS: index, meta, stats
+# ARGV: max_bytes, max_keys, max_evictions
+LUA_EVICT = """
+local max_bytes = tonumber(ARGV[1])
+local max_keys = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local evicted = 0
+while evicted < limit do
+    local total_bytes = tonumber(redis.call('HGET', KEYS[3], '_total:bytes') or '0')
+    local total_keys = tonumber(redis.call('HGET', KEYS[3], '_total:keys') or '0')
+    if total_bytes <= max_bytes and total_keys <= max_keys then
+        break
+    end
+    local popped = redis.call('ZPOPMIN', KEYS[1])
+    if #popped == 0 then
+        break
+    end
+    local key = popped[1]
+    local old = redis.call('HGET', KEYS[2], key)
+    if old then
+        local sep = string.find(old, '|', 1, true)
+        local ns = string.sub(old, 1, sep - 1)
+        local size = tonumber(string.sub(old, sep + 1))
+        redis.call('HINCRBY', KEYS[3], ns .. ':bytes', -size)
+        redis.call('HINCRBY', KEYS[3], ns .. ':keys', -1)
+        redis.call('HINCRBY', KEYS[3], '_total:bytes', -size)
+        redis.call('HINCRBY', KEYS[3], '_total:keys', -1)
+        redis.call('HDEL', KEYS[2], key)
+    end
+    redis.call('DEL', key)
+    evicted = evicted + 1
+end
+return evicted
+"""
+
+
+class Cache_Budget():
+
+    def __init__(self,
+                 redis_client,
+                 max_bytes=32*1024*1024,
+                 max_keys=50000,
+                 policy="lru",       # lru or lfu
+                 prefix="cache_budget",
+                 sweep_interval=300):
+
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unsupported eviction policy: {policy}")
+
+        self.r = redis_client
+        self.max_bytes = max_bytes
+        self.max_keys = max_keys
+        self.policy = policy
+        self.sweep_interval = sweep_interval
+
+        self.index_key = f"{prefix}:index"
+        self.meta_key = f"{prefix}:meta"
+        self.stats_key = f"{prefix}:stats"
+        self.keys = [self.index_key, self.meta_key, self.stats_key]
+
+        self.evicted_count = 0
+        self.last_sweep = 0
+
+        self.script_forget = self.r.register_script(LUA_FORGET)
+        self.script_track = self.r.register_script(LUA_TRACK)
+        self.script_evict = self.r.register_script(LUA_EVICT)
+
+
+    def track(self, key, namespace, size):
+        """
+            Register a cached key and evict the coldest keys if over budget.
+        """
+
+        self.script_track(keys=self.keys, args=[key, namespace, size, time.time(), self.policy])
+        self.enforce()
+
+
+    def touch(self, key):
+        """
+            Record a cache hit. Keys that are not tracked are left alone.
+        """
+
+        if self.policy == "lfu":
+            self.r.zadd(self.index_key, {key: 1}, xx=True, incr=True)
+        else:
+            self.r.zadd(self.index_key, {key: time.time()}, xx=True)
+
+
+    def forget(self, key):
+
+        return self.script_forget(keys=self.keys, args=[key])
+
+
+    def enforce(self, max_evictions=1000):
+
+        evicted = self.script_evict(keys=self.keys, args=[self.max_bytes, self.max_keys, max_evictions])
+        if evicted:
+            self.evicted_count += evicted
+            log.debug("Evicted %s cached keys", evicted)
+
+        return evicted
+
+
+    def sweep(self, batch=500):
+        """
+            Drop index entries whose keys have expired on their own (TTL).
+        """
+
+        removed = 0
+        cursor = 0
+
+        while True:
+
+            cursor, entries = self.r.zscan(self.index_key, cursor=cursor, count=batch)
+
+            members = [member for member, _ in entries]
+            if members:
+                pipe = self.r.pipeline(transaction=False)
+                for member in members:
+                    pipe.exists(member)
+                exists = pipe.execute()
+
+                for member, found in zip(members, exists):
+                    if not found:
+                        removed += self.forget(member)
+
+            if cursor == 0:
+                break
+
+        self.last_sweep = time.time()
+
+        return removed
+
+
+    def maybe_sweep(self):
+
+        if time.time() - self.last_sweep < self.sweep_interval:
+            return 0
+
+        return self.sweep()
+
+
+    def usage(self):
+        """
+            Return cache usage per namespace, for example:
+
+                {
+                    "hexdb": {"keys": 1204, "bytes": 310544},
+                    "planespotters": {"keys": 85, "bytes": 120331},
+                    "error": {"keys": 2, "bytes": 230}
+                }
+        """
+
+        stats = self.r.hgetall(self.stats_key)
+
+        usage = {}
+        for field, value in stats.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            namespace, _, metric = field.rpartition(":")
+            if namespace == TOTAL:
+                continue
+            usage.setdefault(namespace, {"keys": 0, "bytes": 0})
+            usage[namespace][metric] = int(value)
+
+        return {
+            namespace: counters
+            for namespace, counters in usage.items()
+            if counters["keys"] > 0
+        }
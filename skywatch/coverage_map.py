@@ -0,0 +1,288 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Receiver coverage by bearing and altitude band
+
+# max_observed_distance_km tells how far the receiver reached once, not in
+# which direction or at what altitude. The coverage map keeps, for every
+# cell (bearing bucket x altitude band):
+#
+#   max_range   farthest position received, km
+#   count       positions received
+#   histogram   positions per range bin, from which percentile ranges
+#               (p50, p95) are read
+#
+# Arrays have a fixed size (360 x 6 x 100 by default, about 1 MB), so an
+# update is a few index computations and increments, and months of data
+# take no more space than one hour. The arrays are saved periodically with
+# numpy and loaded back on start.
+#
+#   coverage.npz
+#
+# A position without altitude (surface positions, MSG,2) is not counted.
+
+import os
+import math
+import time
+import bisect
+import random
+import threading
+import logging
+
+import numpy as np
+
+from cpa_predictor import EARTH_RADIUS_KM
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# lower edges of the altitude bands, feet
+ALTITUDE_BANDS_FT = (0, 5000, 10000, 20000, 30000, 40000)
+
+
+class Coverage_Map():
+
+    def __init__(self,
+                 home_lat,
+                 home_lon,
+                 path="coverage.npz",
+                 bearing_buckets=360,
+                 altitude_bands_ft=ALTITUDE_BANDS_FT,
+                 range_bin_km=5,
+                 max_range_km=500,
+                 save_interval=300):
+
+        self.home_lat = home_lat
+        self.home_lon = home_lon
+        self.path = path
+        self.bearing_buckets = bearing_buckets
+        self.altitude_bands_ft = tuple(altitude_bands_ft)
+        self.range_bin_km = range_bin_km
+        self.range_bins = int(math.ceil(max_range_km / range_bin_km))
+        self.save_interval = save_interval
+
+        self.sin_home_lat = math.sin(math.radians(home_lat))
+        self.cos_home_lat = math.cos(math.radians(home_lat))
+        self.degrees_per_bucket = 360.0 / bearing_buckets
+
+        shape = (bearing_buckets, len(self.altitude_bands_ft))
+        self.max_range = np.zeros(shape, dtype=np.float32)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.histogram = np.zeros(shape + (self.range_bins,), dtype=np.uint32)
+
+        self.lock = threading.Lock()
+        self.since = time.time()
+        self.last_save = time.time()
+        self.observed_count = 0
+        self.skipped_count = 0
+        self.save_count = 0
+
+
+    def bearing(self, lat, lon):
+        """
+            Initial great-circle bearing from home, degrees [0, 360).
+        """
+
+        lat = math.radians(lat)
+        delta_lon = math.radians(lon - self.home_lon)
+
+        x = math.sin(delta_lon) * math.cos(lat)
+        y = self.cos_home_lat * math.sin(lat) - self.sin_home_lat * math.cos(lat) * math.cos(delta_lon)
+
+        return math.degrees(math.atan2(x, y)) % 360.0
+
+
+    def distance(self, lat, lon):
+
+        lat1 = math.radians(self.home_lat)
+        lat2 = math.radians(lat)
+
+        a = (math.sin((lat2 - lat1) / 2) ** 2 +
+             self.cos_home_lat * math.cos(lat2) * math.sin(math.radians(lon - self.home_lon) / 2) ** 2)
+
+        return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+    def observe(self, lat, lon, altitude_ft, distance_km=None):
+        """
+            Called from the consumer thread for every position.
+        """
+
+        if lat is None or lon is None or altitude_ft is None:
+            self.skipped_count += 1
+            return
+
+        if distance_km is None:
+            distance_km = self.distance(lat, lon)
+
+        bucket = int(self.bearing(lat, lon) / self.degrees_per_bucket) % self.bearing_buckets
+        band = max(bisect.bisect_right(self.altitude_bands_ft, altitude_ft) - 1, 0)
+        range_bin = min(int(distance_km / self.range_bin_km), self.range_bins - 1)
+
+        with self.lock:
+            self.count[bucket, band] += 1
+            self.histogram[bucket, band, range_bin] += 1
+            if distance_km > self.max_range[bucket, band]:
+                self.max_range[bucket, band] = distance_km
+
+        self.observed_count += 1
+
+
+    def observe_sbs(self, sbs_dict, distance_km=None):
+
+        try:
+            lat = float(sbs_dict["latitude"])
+            lon = float(sbs_dict["longitude"])
+            altitude_ft = float(sbs_dict["altitude"])
+        except (KeyError, TypeError, ValueError):
+            self.skipped_count += 1
+            return
+
+        self.observe(lat, lon, altitude_ft, distance_km)
+
+
+    def percentile(self, q):
+        """
+            Range (km) below which q percent of the positions of each cell
+            were received, at range-bin resolution. NaN for empty cells.
+        """
+
+        with self.lock:
+            cumulative = np.cumsum(self.histogram, axis=2, dtype=np.int64)
+            count = self.count.copy()
+
+        target = np.ceil(count * q / 100.0)[..., None]
+        first_bin = np.argmax(cumulative >= np.maximum(target, 1), axis=2)
+
+        result = (first_bin + 1) * float(self.range_bin_km)
+        return np.where(count > 0, result, np.nan)
+
+
+    def snapshot(self):
+        """
+            JSON-friendly view for the HTTP layer.
+        """
+
+        with self.lock:
+            max_range = self.max_range.copy()
+            count = self.count.copy()
+
+        def rounded(array):
+            return [[None if np.isnan(value) else round(float(value), 1) for value in row] for row in array]
+
+        return {
+            "home": [self.home_lat, self.home_lon],
+            "since": self.since,
+            "bearing_buckets": self.bearing_buckets,
+            "altitude_bands_ft": list(self.altitude_bands_ft),
+            "range_bin_km": self.range_bin_km,
+            "count": count.tolist(),
+            "max_range_km": rounded(np.where(count > 0, max_range, np.nan)),
+            "p50_range_km": rounded(self.percentile(50)),
+            "p95_range_km": rounded(self.percentile(95)),
+        }
+
+
+    def save(self):
+
+        with self.lock:
+            max_range = self.max_range.copy()
+            count = self.count.copy()
+            histogram = self.histogram.copy()
+
+        # np.savez appends .npz unless the name already ends with it
+        tmp_path = self.path + ".tmp.npz"
+        np.savez_compressed(tmp_path,
+                            max_range=max_range,
+                            count=count,
+                            histogram=histogram,
+                            altitude_bands_ft=np.array(self.altitude_bands_ft),
+                            range_bin_km=np.float64(self.range_bin_km),
+                            since=np.float64(self.since))
+        os.replace(tmp_path, self.path)
+
+        self.last_save = time.time()
+        self.save_count += 1
+
+
+    def maybe_save(self):
+
+        if time.time() - self.last_save < self.save_interval:
+            return
+
+        try:
+            self.save()
+        except OSError as e:
+            log.error("Cannot save coverage map to %s: %s", self.path, e)
+
+
+    def load(self):
+
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with np.load(self.path) as data:
+                arrays = {name: data[name] for name in data.files}
+            same_layout = (arrays["histogram"].shape == self.histogram.shape and
+                           tuple(arrays["altitude_bands_ft"].tolist()) == self.altitude_bands_ft and
+                           float(arrays["range_bin_km"]) == self.range_bin_km)
+        except (OSError, KeyError, ValueError) as e:
+            log.error("Cannot load coverage map from %s: %s", self.path, e)
+            return False
+
+        if not same_layout:
+            log.warning("Coverage map %s has a different layout, starting a new one.", self.path)
+            return False
+
+        with self.lock:
+            self.max_range = arrays["max_range"].astype(np.float32)
+            self.count = arrays["count"].astype(np.int64)
+            self.histogram = arrays["histogram"].astype(np.uint32)
+            self.since = float(arrays["since"])
+
+        log.info("Loaded coverage map from %s: %d positions", self.path, int(self.count.sum()))
+        return True
+
+
+    def stats(self):
+
+        with self.lock:
+            filled = int(np.count_nonzero(self.count))
+            max_range = float(self.max_range.max()) if self.max_range.size else 0.0
+            positions = int(self.count.sum())
+
+        return {
+            "positions": positions,
+            "observed": self.observed_count,
+            "skipped": self.skipped_count,
+            "cells_filled": filled,
+            "cells": int(self.count.size),
+            "max_range_km": round(max_range, 1),
+            "saves": self.save_count
+        }
+
+
+if __name__ == "__main__":
+
+    coverage = Coverage_Map(37.7, -122.2, path=os.path.join("/tmp", "coverage_bench.npz"))
+
+    positions = [
+        (37.7 + random.uniform(-2, 2), -122.2 + random.uniform(-2, 2), random.uniform(0, 45000))
+        for _ in range(200000)
+    ]
+
+    start_time = time.perf_counter()
+    for lat, lon, altitude in positions:
+        coverage.observe(lat, lon, altitude)
+    duration = time.perf_counter() - start_time
+
+    log.info("observe: %.2f us/position", duration / len(positions) * 1e6)
+
+    start_time = time.perf_counter()
+    coverage.save()
+    log.info("save: %.1f ms, %.1f KB", (time.perf_counter() - start_time) * 1000, os.path.getsize(coverage.path) / 1024)
+
+    start_time = time.perf_counter()
+    snapshot = coverage.snapshot()
+    log.info("snapshot: %.1f ms", (time.perf_counter() - start_time) * 1000)
+    log.info("stats: %s", coverage.stats())
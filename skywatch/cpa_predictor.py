@@ -0,0 +1,300 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Predict the closest point of approach (CPA) to home
+
+# Alerts fire once an aircraft is inside the alert radius. With a small radius
+# and jets at 250 kt, enrichment often completes after the aircraft has passed.
+#
+# The predictor keeps the last position and velocity of every tracked aircraft
+# in numpy arrays, in a local east/north frame centered on home (km). A
+# periodic pass extrapolates all aircraft to 'now' and computes, in one
+# vectorized step, the time and horizontal distance of closest approach:
+#
+#   p = position, v = velocity
+#   t_cpa = max(0, -(p . v) / (v . v))
+#   d_cpa = |p + v * t_cpa|
+#
+# The altitude at CPA is extrapolated with the vertical rate. Aircraft whose
+# CPA falls inside the alert radius within 'lookahead_sec' are reported as
+# approaching.
+#
+# Benchmark:
+#
+#   python cpa_predictor.py [number of aircraft]
+
+import sys
+import math
+import time
+import random
+import threading
+import logging
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KNOTS_TO_KM_PER_SEC = 1.852 / 3600
+
+
+class CPA_Predictor():
+
+    def __init__(self,
+                 home_lat,
+                 home_lon,
+                 alert_radius_km=10,
+                 lookahead_sec=180,   # report CPA up to this far ahead
+                 max_age_sec=60,      # forget aircraft not heard from
+                 capacity=1024):
+
+        self.home_lat = home_lat
+        self.home_lon = home_lon
+        self.alert_radius_km = alert_radius_km
+        self.lookahead_sec = lookahead_sec
+        self.max_age_sec = max_age_sec
+
+        # km per degree of latitude/longitude around home
+        self.km_per_deg_lat = math.radians(1) * EARTH_RADIUS_KM
+        self.km_per_deg_lon = self.km_per_deg_lat * math.cos(math.radians(home_lat))
+
+        self.lock = threading.Lock()
+        self.slots = {}           # hex_ident -> array index
+        self.hex_idents = []
+        self.free = []
+
+        self.x = self.y = self.pos_time = None
+        self.vx = self.vy = None
+        self.altitude = self.alt_time = self.vrate = None
+        self.last_seen = None
+        self.allocate(capacity)
+
+        self.tick_count = 0
+        self.tick_duration = 0.0
+
+
+    def allocate(self, capacity):
+
+        old = len(self.hex_idents)
+        grow = capacity - old
+
+        def extend(array, fill):
+            block = np.full(grow, fill, dtype=np.float64)
+            return block if array is None else np.concatenate([array, block])
+
+        self.x = extend(self.x, np.nan)                # km east of home
+        self.y = extend(self.y, np.nan)                # km north of home
+        self.pos_time = extend(self.pos_time, 0.0)
+        self.vx = extend(self.vx, np.nan)              # km/s east
+        self.vy = extend(self.vy, np.nan)              # km/s north
+        self.altitude = extend(self.altitude, np.nan)  # ft
+        self.alt_time = extend(self.alt_time, 0.0)
+        self.vrate = extend(self.vrate, 0.0)           # ft/s
+        self.last_seen = extend(self.last_seen, -np.inf)
+
+        self.hex_idents.extend([None] * grow)
+        self.free.extend(range(capacity - 1, old - 1, -1))
+
+
+    def slot(self, hex_ident):
+
+        index = self.slots.get(hex_ident)
+        if index is not None:
+            return index
+
+        if not self.free:
+            self.allocate(len(self.hex_idents) * 2)
+
+        index = self.free.pop()
+        self.slots[hex_ident] = index
+        self.hex_idents[index] = hex_ident
+
+        self.x[index] = self.y[index] = np.nan
+        self.vx[index] = self.vy[index] = np.nan
+        self.altitude[index] = np.nan
+        self.vrate[index] = 0.0
+
+        return index
+
+
+    def observe(self, sbs_dict, now=None):
+        """
+            Called for every SBS message. Position (MSG,3) and velocity
+            (MSG,4) arrive in different messages.
+        """
+
+        hex_ident = sbs_dict.get("hex_ident", None)
+        if not hex_ident:
+            return
+
+        now = time.time() if now is None else now
+
+        latitude = sbs_dict.get("latitude")
+        longitude = sbs_dict.get("longitude")
+        ground_speed = sbs_dict.get("ground_speed")
+        track = sbs_dict.get("track")
+        altitude = sbs_dict.get("altitude")
+        vertical_rate = sbs_dict.get("vertical_rate")
+
+        with self.lock:
+
+            index = self.slot(hex_ident)
+            self.last_seen[index] = now
+
+            try:
+                if latitude and longitude:
+                    self.x[index] = (float(longitude) - self.home_lon) * self.km_per_deg_lon
+                    self.y[index] = (float(latitude) - self.home_lat) * self.km_per_deg_lat
+                    self.pos_time[index] = now
+
+                if ground_speed and track:
+                    speed = float(ground_speed) * KNOTS_TO_KM_PER_SEC
+                    heading = math.radians(float(track))
+                    self.vx[index] = speed * math.sin(heading)
+                    self.vy[index] = speed * math.cos(heading)
+
+                if altitude:
+                    self.altitude[index] = float(altitude)
+                    self.alt_time[index] = now
+
+                if vertical_rate:
+                    self.vrate[index] = float(vertical_rate) / 60.0
+            except ValueError:
+                pass
+
+
+    def expire(self, now):
+
+        stale = np.nonzero(now - self.last_seen > self.max_age_sec)[0]
+
+        for index in stale:
+            hex_ident = self.hex_idents[index]
+            if hex_ident is None:
+                continue
+            del self.slots[hex_ident]
+            self.hex_idents[index] = None
+            self.last_seen[index] = -np.inf
+            self.free.append(int(index))
+
+
+    def predict(self, now=None):
+        """
+            Vectorized CPA for every aircraft with a recent position and velocity.
+            Returns (indices, t_cpa sec, d_cpa km, distance now km, altitude at CPA ft).
+        """
+
+        now = time.time() if now is None else now
+
+        dt = now - self.pos_time
+        valid = (dt <= self.max_age_sec) & ~np.isnan(self.x) & ~np.isnan(self.vx)
+        indices = np.nonzero(valid)[0]
+
+        vx = self.vx[indices]
+        vy = self.vy[indices]
+
+        # extrapolate the last position to now
+        px = self.x[indices] + vx * dt[indices]
+        py = self.y[indices] + vy * dt[indices]
+
+        vv = vx * vx + vy * vy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_cpa = np.where(vv > 0, -(px * vx + py * vy) / vv, 0.0)
+        t_cpa = np.maximum(t_cpa, 0.0)
+
+        d_cpa = np.hypot(px + vx * t_cpa, py + vy * t_cpa)
+        d_now = np.hypot(px, py)
+
+        alt_dt = now - self.alt_time[indices] + t_cpa
+        alt_cpa = np.maximum(self.altitude[indices] + self.vrate[indices] * alt_dt, 0.0)
+
+        return indices, t_cpa, d_cpa, d_now, alt_cpa
+
+
+    def approaching(self, now=None):
+        """
+            Aircraft outside the alert radius whose CPA falls inside it within
+            the lookahead window, soonest first.
+        """
+
+        now = time.time() if now is None else now
+        start_time = time.perf_counter()
+
+        with self.lock:
+
+            self.expire(now)
+
+            indices, t_cpa, d_cpa, d_now, alt_cpa = self.predict(now)
+
+            mask = ((t_cpa > 0) &
+                    (t_cpa <= self.lookahead_sec) &
+                    (d_cpa <= self.alert_radius_km) &
+                    (d_now > self.alert_radius_km))
+
+            selected = np.nonzero(mask)[0]
+            selected = selected[np.argsort(t_cpa[selected])]
+
+            result = [
+                {
+                    "hex_ident": self.hex_idents[indices[i]],
+                    "t_cpa_sec": float(t_cpa[i]),
+                    "d_cpa_km": float(d_cpa[i]),
+                    "distance_km": float(d_now[i]),
+                    "altitude_cpa_ft": None if np.isnan(alt_cpa[i]) else float(alt_cpa[i])
+                }
+                for i in selected
+            ]
+
+        self.tick_count += 1
+        self.tick_duration += time.perf_counter() - start_time
+
+        return result
+
+
+    def stats(self):
+
+        return {
+            "tracked": len(self.slots),
+            "capacity": len(self.hex_idents),
+            "ticks": self.tick_count,
+            "avg_tick_ms": round(self.tick_duration / self.tick_count * 1000, 3) if self.tick_count else None
+        }
+
+
+if __name__ == "__main__":
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    predictor = CPA_Predictor(home_lat=37.7749, home_lon=-122.4194, alert_radius_km=3)
+
+    now = time.time()
+    messages = []
+    for i in range(count):
+        hex_ident = f"{i:06X}"
+        messages.append({
+            "hex_ident": hex_ident,
+            "latitude": str(37.7749 + random.uniform(-3, 3)),
+            "longitude": str(-122.4194 + random.uniform(-3, 3)),
+            "altitude": str(random.randint(1000, 40000))
+        })
+        messages.append({
+            "hex_ident": hex_ident,
+            "ground_speed": str(random.randint(120, 500)),
+            "track": str(random.uniform(0, 360)),
+            "vertical_rate": str(random.choice([-1500, 0, 1500]))
+        })
+
+    start_time = time.perf_counter()
+    for sbs_dict in messages:
+        predictor.observe(sbs_dict, now=now)
+    observe_duration = time.perf_counter() - start_time
+
+    ticks = 100
+    approaching = []
+    for tick in range(ticks):
+        approaching = predictor.approaching(now=now + tick * 0.01)
+
+    log.info("Aircraft: %d, observe: %.2f us/msg, CPA pass: %.3f ms/tick, approaching: %d",
+             count,
+             observe_duration / len(messages) * 1e6,
+             predictor.stats()["avg_tick_ms"],
+             len(approaching))
@@ -1,18 +1,63 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Extract aircraft and time windows from the SBS log
 
-import csv
+# Uses the sidecar index of log_index.py, built on first use for every
+# segment, so only the lines of the requested aircraft are read.
+#
+# Usage:
+#
+#   python csv_filter.py aircraft_log.csv --hex A842E7
+#   python csv_filter.py aircraft_log.csv --hex A842E7 --hex AB1234 --start "2025-04-21 22:00" --end "2025-04-21 23:30"
+#   python csv_filter.py aircraft_log.csv --start "2025-04-21 22:00" --end "2025-04-21 22:05" -o window.csv
+#
+# A log path includes its rotated segments (aircraft_log.*.csv[.gz|.zst]).
 
-input_file = "aircraft_log_bak.csv"
-output_file = "filtered.csv"
-target_hex = "A842E7"
+import sys
+import time
+import argparse
+import logging
+from datetime import datetime
 
-with open(input_file, mode='r', newline='', encoding='utf-8') as infile, \
-     open(output_file, mode='w', newline='', encoding='utf-8') as outfile:
+import log_index
+import sbs_message
 
-    reader = csv.DictReader(infile)
-    writer = csv.DictWriter(outfile, fieldnames=reader.fieldnames)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
 
-    writer.writeheader()
 
-    for row in reader:
-        if row.get("hex_ident") == target_hex:
-            writer.writerow(row)
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Extract aircraft and time windows from the SBS log.")
+    parser.add_argument("paths", nargs="+", help="log file, rotated segment or directory")
+    parser.add_argument("--hex", dest="hex_idents", action="append", type=str.upper, help="hex_ident, repeatable")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="e.g. '2025-04-21 22:00'")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="e.g. '2025-04-21 23:30'")
+    parser.add_argument("-o", "--output", default="filtered.csv", help="'-' for stdout")
+    parser.add_argument("--gap", type=int, default=4096, help="index: bytes of other aircraft merged into one range")
+    parser.add_argument("--sample-every", type=int, default=1000, help="index: lines between time samples")
+    args = parser.parse_args()
+
+    if not args.hex_idents and not args.start and not args.end:
+        parser.error("give at least one --hex, --start or --end")
+
+    start_time = time.perf_counter()
+
+    outfile = sys.stdout.buffer if args.output == "-" else open(args.output, mode="wb")
+
+    count = 0
+    try:
+        outfile.write(",".join(sbs_message.SBS_FIELD_NAMES).encode() + b"\n")
+        for line in log_index.query_segments(args.paths,
+                                             hex_idents=args.hex_idents,
+                                             start=args.start,
+                                             end=args.end,
+                                             gap=args.gap,
+                                             sample_every=args.sample_every):
+            outfile.write(line + b"\n")
+            count += 1
+    finally:
+        if outfile is not sys.stdout.buffer:
+            outfile.close()
+
+    log.info("Extracted %d lines in %.2f s", count, time.perf_counter() - start_time)
@@ -1,54 +1,172 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Replay SBS logs into Redis aircraft aggregates
+
+# Rebuilds the per-aircraft hashes that SkyWatch keeps in
+# 'aircraft_aggregate:<hex>' from a recorded log, under a separate prefix
+# ('experiment_aircraft' by default) so experiments do not touch live state.
+#
+# Lines are split with str.split and merged in memory with the same rule as
+# SkyWatch.aggregate_sbs_messages (sbs_message.merge_fields). Redis only sees
+# the coalesced state, written with pipelined HSET + EXPIRE in batches: at the
+# end of the replay, or every --flush-every lines for the aircraft that changed.
+#
+# With --hex, --start or --end the log is read through the sidecar index of
+# log_index.py, so only the relevant lines are read at all.
+#
+# Usage:
+#
+#   python cvs_redis.py aircraft_log.csv
+#   python cvs_redis.py aircraft_log.csv --hex A842E7 --hex AB1234 --prefix replay
+#   python cvs_redis.py aircraft_log.csv --start "2025-04-21 22:00" --end "2025-04-21 23:00" --flush-every 100000
+#   python cvs_redis.py aircraft_log.csv --dry-run
+
+import sys
+import time
+import argparse
+import logging
+from datetime import datetime
+
 import redis
-import csv
-from datetime import timedelta
 
-# Connect to Redis (adjust host/port/db if needed)
-r = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+import log_index
+import sbs_message
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+
+class Redis_Replay():
+
+    def __init__(self,
+                 redis_client,
+                 prefix="experiment_aircraft",
+                 ttl_sec=30*60,          # 0 for no expiry
+                 batch_size=1000,        # aircraft per pipeline round trip
+                 flush_every=0):         # lines between periodic writes, 0 for final only
+
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl_sec = ttl_sec
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+
+        self.state = {}                 # hex_ident -> aggregate
+        self.dirty = set()
+
+        self.line_count = 0
+        self.merged_count = 0
+        self.written_count = 0
+        self.round_trips = 0
+
+
+    def feed(self, line):
+
+        self.line_count += 1
+
+        sbs_dict = sbs_message.tokenize(line)
+        if not sbs_dict:
+            return
+
+        hex_ident = sbs_dict["hex_ident"]
+        if not hex_ident:
+            return
+
+        state = self.state.get(hex_ident)
+        if state is None:
+            state = self.state[hex_ident] = {}
+
+        sbs_message.merge_fields(state, sbs_dict)
+        self.dirty.add(hex_ident)
+        self.merged_count += 1
+
+        if self.flush_every and self.line_count % self.flush_every == 0:
+            self.flush()
+
+
+    def flush(self):
+        """
+            Write the aggregates changed since the last flush.
+        """
+
+        dirty = sorted(self.dirty)
+        self.dirty = set()
+
+        if self.redis is None:
+            return
+
+        for i in range(0, len(dirty), self.batch_size):
+
+            pipe = self.redis.pipeline(transaction=False)
+
+            for hex_ident in dirty[i:i + self.batch_size]:
+                key = f"{self.prefix}:{hex_ident}"
+                pipe.hset(key, mapping=self.state[hex_ident])
+                if self.ttl_sec:
+                    pipe.expire(key, self.ttl_sec)
 
-# TTL in seconds (30 minutes)
-TTL_SECONDS = 30 * 60
+            pipe.execute()
 
-def update_aircraft_record(hex_ident, row, headers):
+            self.round_trips += 1
+            self.written_count += len(dirty[i:i + self.batch_size])
 
-    updates = {}
 
-    # Map row values to headers
-    for i, value in enumerate(row):
-        if value != "":
-            field = headers[i]
-            updates[field] = value
+def read_lines(paths, hex_idents=None, start=None, end=None):
 
-    key = f"experiment_aircraft:{hex_ident}"
+    if hex_idents or start or end:
+        for line in log_index.query_segments(paths, hex_idents, start, end):
+            yield line.decode("utf-8", errors="replace")
+        return
 
-    if updates:
-        r.hset(key, mapping=updates)
-        r.expire(key, TTL_SECONDS)
+    for path in log_index.expand_segments(paths):
+        with log_index.open_stream(path) as f:
+            for line in f:
+                yield line.decode("utf-8", errors="replace").rstrip("\r\n")
 
 
-def parse_sbs_line(line):
+if __name__ == "__main__":
 
-    reader = csv.reader([line])
-    row = next(reader)
-    return row
+    parser = argparse.ArgumentParser(description="Replay SBS logs into Redis aircraft aggregates.")
+    parser.add_argument("paths", nargs="+", help="log file, rotated segment or directory")
+    parser.add_argument("--hex", dest="hex_idents", action="append", type=str.upper, help="hex_ident, repeatable")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="e.g. '2025-04-21 22:00'")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="e.g. '2025-04-21 23:30'")
+    parser.add_argument("--prefix", default="experiment_aircraft", help="Redis key prefix")
+    parser.add_argument("--ttl", type=int, default=30*60, help="key expiry in seconds, 0 for none")
+    parser.add_argument("--batch-size", type=int, default=1000, help="aircraft per pipeline round trip")
+    parser.add_argument("--flush-every", type=int, default=0, help="write changed aircraft every N lines")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="merge only, do not write to Redis")
+    args = parser.parse_args()
 
-# Example usage with streamed SBS messages
-headers = [
-    "message_type", "transmission_type", "session_id", "aircraft_id", "hex_ident",
-    "flight_id", "generated_date", "generated_time", "logged_date", "logged_time",
-    "callsign", "altitude", "ground_speed", "track", "latitude", "longitude",
-    "vertical_rate", "squawk", "alert", "emergency", "spi", "is_on_ground"
-]
+    client = None
+    if not args.dry_run:
+        client = redis.Redis(host=args.host, port=args.port, db=args.db, decode_responses=True)
+        try:
+            client.ping()
+        except redis.RedisError as e:
+            log.error("Cannot connect to Redis at %s:%d: %s", args.host, args.port, e)
+            sys.exit(1)
 
-# Simulated loop (replace with live source)
-with open("filtered.csv", "r") as f:
+    replay = Redis_Replay(client,
+                          prefix=args.prefix,
+                          ttl_sec=args.ttl,
+                          batch_size=args.batch_size,
+                          flush_every=args.flush_every)
 
-    for line in f:
+    start_time = time.perf_counter()
 
-        if not line.strip().startswith("MSG"):
-            continue  # Skip headers or unrelated lines
+    for line in read_lines(args.paths, args.hex_idents, args.start, args.end):
+        replay.feed(line)
 
-        row = parse_sbs_line(line)
-        hex_ident = row[4]
+    read_duration = time.perf_counter() - start_time
+    replay.flush()
+    duration = time.perf_counter() - start_time
 
-        if hex_ident == "A842E7":
-            update_aircraft_record(hex_ident, row, headers)
+    log.info("Replayed %d lines (%d merged) into %d aircraft in %.2f s (%.0f lines/sec)",
+             replay.line_count, replay.merged_count, len(replay.state), duration,
+             replay.line_count / max(read_duration, 1e-6))
+    log.info("Wrote %d aggregates under '%s:*' in %d pipeline round trips",
+             replay.written_count, args.prefix, replay.round_trips)
@@ -0,0 +1,183 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Thread-safe lookups against the reference tables
+
+# Enrichment lookups used to go through one shared ORM session:
+#
+#   session.query(Model).filter_by(...).all()  ->  model_to_dict(obj)
+#
+# which is not thread-safe and pays for ORM identity-map bookkeeping and
+# column reflection on every call. The lookups below are Core 'select'
+# statements built once at import time (so SQLAlchemy's compiled cache is
+# always hit). Each call checks out a pooled connection and returns plain
+# dicts, so they can be used from any thread.
+#
+# Benchmark against the ORM path:
+#
+#   python data_access.py
+
+import time
+import random
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, bindparam
+
+import models_sql
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+airplanes = models_sql.Airplane.__table__
+airlines = models_sql.Airline.__table__
+countries = models_sql.Country.__table__
+icao_types = models_sql.ICAOType.__table__
+registry = models_sql.AircraftRegistry.__table__
+sbs_messages = models_sql.SBSMessage.__table__
+
+# limit(2) is enough to detect duplicates without reading them all
+airplane_by_hex = (
+    select(airplanes)
+    .where(airplanes.c.icao_code_hex == bindparam("icao_code_hex"))
+    .limit(2)
+)
+
+airline_by_iata = (
+    select(airlines)
+    .where(airlines.c.iata_code == bindparam("iata_code"))
+    .where(airlines.c.status == "active")
+    .limit(2)
+)
+
+country_by_iso2 = (
+    select(countries)
+    .where(countries.c.country_iso2 == bindparam("country_iso2"))
+    .limit(2)
+)
+
+icao_type_by_designator = (
+    select(icao_types)
+    .where(icao_types.c.designator == bindparam("designator"))
+    .limit(1)
+)
+
+registry_by_address = (
+    select(registry)
+    .where(registry.c.icao_address == bindparam("icao_address"))
+)
+
+# served by the (hex_ident, generated_datetime) btree on each partition
+track_by_hex = (
+    select(sbs_messages.c.generated_datetime,
+           sbs_messages.c.latitude,
+           sbs_messages.c.longitude,
+           sbs_messages.c.altitude)
+    .where(sbs_messages.c.hex_ident == bindparam("hex_ident"))
+    .where(sbs_messages.c.generated_datetime.between(bindparam("start"), bindparam("end")))
+    .where(sbs_messages.c.latitude.is_not(None))
+    .order_by(sbs_messages.c.generated_datetime)
+)
+
+# partition pruning plus the BRIN index on generated_datetime
+recent_aircraft = (
+    select(sbs_messages.c.hex_ident,
+           sbs_messages.c.generated_datetime,
+           sbs_messages.c.latitude,
+           sbs_messages.c.longitude,
+           sbs_messages.c.altitude)
+    .where(sbs_messages.c.generated_datetime >= bindparam("since"))
+    .where(sbs_messages.c.latitude.is_not(None))
+    .distinct(sbs_messages.c.hex_ident)
+    .order_by(sbs_messages.c.hex_ident, sbs_messages.c.generated_datetime.desc())
+)
+
+
+def fetch_first(stmt, params, label=None):
+
+    with models_sql.engine.connect() as conn:
+        rows = conn.execute(stmt, params).mappings().all()
+
+    if not rows:
+        return None
+
+    if len(rows) > 1 and label:
+        log.warning("Multiple %s found with %s", label, params)
+
+    return dict(rows[0])
+
+
+def get_airplane(icao_code_hex):
+
+    return fetch_first(airplane_by_hex, {"icao_code_hex": icao_code_hex}, "airplanes")
+
+
+def get_active_airline(iata_code):
+
+    return fetch_first(airline_by_iata, {"iata_code": iata_code}, "active airlines")
+
+
+def get_country(country_iso2):
+
+    return fetch_first(country_by_iso2, {"country_iso2": country_iso2}, "countries")
+
+
+def get_icao_type(designator):
+
+    return fetch_first(icao_type_by_designator, {"designator": designator})
+
+
+def get_registry(icao_address):
+
+    return fetch_first(registry_by_address, {"icao_address": icao_address})
+
+
+def get_track(hex_ident, start, end):
+    """
+        Positions of one aircraft between two datetimes, oldest first.
+    """
+
+    with models_sql.engine.connect() as conn:
+        rows = conn.execute(track_by_hex, {"hex_ident": hex_ident, "start": start, "end": end})
+        return [dict(row) for row in rows.mappings()]
+
+
+def get_recent_aircraft(minutes=5):
+    """
+        Last known position of every aircraft seen in the last N minutes.
+    """
+
+    since = datetime.now() - timedelta(minutes=minutes)
+
+    with models_sql.engine.connect() as conn:
+        rows = conn.execute(recent_aircraft, {"since": since})
+        return [dict(row) for row in rows.mappings()]
+
+
+if __name__ == "__main__":
+
+    session = models_sql.Session(bind=models_sql.engine)
+
+    hex_codes = [
+        hex_code for (hex_code,) in
+        session.query(models_sql.Airplane.icao_code_hex).limit(5000).all()
+        if hex_code
+    ]
+
+    # mix of hits and misses, like live traffic
+    sample = random.sample(hex_codes, min(len(hex_codes), 1000))
+    sample += [f"{random.randint(0, 0xFFFFFF):06X}" for _ in range(len(sample))]
+    random.shuffle(sample)
+
+    start_time = time.perf_counter()
+    for hex_code in sample:
+        results = session.query(models_sql.Airplane).filter_by(icao_code_hex=hex_code).all()
+        if results:
+            models_sql.model_to_dict(results[0])
+    orm_duration = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for hex_code in sample:
+        get_airplane(hex_code)
+    core_duration = time.perf_counter() - start_time
+
+    log.info("ORM  path: %d lookups, %.1f us/lookup", len(sample), orm_duration / max(len(sample), 1) * 1e6)
+    log.info("Core path: %d lookups, %.1f us/lookup", len(sample), core_duration / max(len(sample), 1) * 1e6)
@@ -14,6 +14,7 @@
 import os
 import getpass
 import logging
+import requests
 
 from rest_client import REST_API_Client
 
@@ -54,6 +55,77 @@ class Discord_Webhook(REST_API_Client):
         return True, output
 
 
+    def send_discord_embeds(self, content, embeds, timeout=10):
+        """
+            Post up to 10 embeds in one message.
+
+            Unlike send_discord_message, the response is not cached and the
+            rate-limit headers are returned, so the caller can honour them:
+
+                {
+                    "status_code": 429,
+                    "retry_after": 1.5,      # seconds, only set on 429
+                    "remaining": 0,          # X-RateLimit-Remaining
+                    "reset_after": 1.5,      # X-RateLimit-Reset-After
+                    "bucket": "abcd1234",    # X-RateLimit-Bucket
+                    "error": "..."
+                }
+        """
+
+        url = f"{self.baseurl}/{self.webhook_id}/{self.webhook_token}"
+
+        payload = {
+            "content": content,
+            "embeds": embeds[:10]
+        }
+
+        info = {
+            "status_code": None,
+            "retry_after": None,
+            "remaining": None,
+            "reset_after": None,
+            "bucket": None,
+            "error": None
+        }
+
+        try:
+            response = requests.post(url, headers=self.headers, json=payload, timeout=timeout)
+        except Exception as E:
+            info["error"] = str(E)
+            return False, info
+
+        headers = response.headers
+        info["status_code"] = response.status_code
+        info["bucket"] = headers.get("X-RateLimit-Bucket")
+
+        try:
+            if "X-RateLimit-Remaining" in headers:
+                info["remaining"] = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset-After" in headers:
+                info["reset_after"] = float(headers["X-RateLimit-Reset-After"])
+        except ValueError:
+            pass
+
+        if response.status_code == 429:
+            retry_after = headers.get("Retry-After")
+            try:
+                retry_after = float(response.json().get("retry_after", retry_after))
+            except Exception:
+                pass
+            try:
+                info["retry_after"] = float(retry_after) if retry_after is not None else 1.0
+            except ValueError:
+                info["retry_after"] = 1.0
+            info["error"] = "rate limited"
+            return False, info
+
+        if response.status_code >= 400:
+            info["error"] = f"Return code={response.status_code}\n{response.text}"
+            return False, info
+
+        return True, info
+
+
 if __name__ == "__main__":
 
     discord = Discord_Webhook(host="discord.com", base="api/webhooks")
@@ -0,0 +1,220 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Warm the enrichment cache when an aircraft is first seen
+
+# Enrichment used to start only once an aircraft was inside the alert radius,
+# so every alert waited on cold hexdb/planespotters lookups. The prefetcher
+# is notified of every SBS message. When a new hex_ident shows up it is queued
+# for enrichment, ordered by the predicted time until it reaches the alert
+# radius. A background thread then runs the fetchers, which warm the Redis
+# cache used by the REST clients.
+
+import time
+import heapq
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+KNOTS_TO_KM_PER_SEC = 1.852 / 3600
+
+
+class Enrichment_Prefetcher():
+
+    def __init__(self,
+                 fetchers,                # list of (name, callable(hex_ident))
+                 alert_radius_km=10,
+                 max_pending=1000,
+                 unknown_eta_sec=900,     # priority of aircraft without position/speed
+                 seen_ttl_sec=30*60):
+
+        self.fetchers = fetchers
+        self.alert_radius_km = alert_radius_km
+        self.max_pending = max_pending
+        self.unknown_eta_sec = unknown_eta_sec
+        self.seen_ttl_sec = seen_ttl_sec
+
+        self.running = False
+        self.thread = None
+
+        self.heap = []            # (eta, seq, hex_ident)
+        self.pending = {}         # hex_ident -> eta of the live heap entry
+        self.seen = {}            # hex_ident -> [last seen, distance_km, ground_speed]
+        self.has_eta = set()      # pending hex_idents with a kinematic eta
+        self.seq = 0
+        self.cond = threading.Condition()
+
+        self.enqueued_count = 0
+        self.completed_count = 0
+        self.dropped_count = 0
+        self.error_count = 0
+        self.last_prune = time.time()
+
+
+    def start(self):
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+
+    def predict_eta(self, distance_km, ground_speed):
+        """
+            Seconds until the aircraft could reach the alert radius, assuming
+            it heads straight for home at its current ground speed.
+        """
+
+        if distance_km is None:
+            return None
+
+        if distance_km <= self.alert_radius_km:
+            return 0.0
+
+        if not ground_speed or ground_speed <= 0:
+            return None
+
+        return (distance_km - self.alert_radius_km) / (ground_speed * KNOTS_TO_KM_PER_SEC)
+
+
+    def observe(self, sbs_dict):
+        """
+            Called for every SBS message. Cheap in the common case.
+        """
+
+        hex_ident = sbs_dict.get("hex_ident", None)
+        if not hex_ident:
+            return
+
+        now = time.time()
+
+        # position and speed arrive in different messages (MSG,3 and MSG,4)
+        state = self.seen.get(hex_ident)
+        first_sighting = state is None
+        if first_sighting:
+            state = [now, None, None]
+            self.seen[hex_ident] = state
+
+        state[0] = now
+
+        distance_km = sbs_dict.get("distance_km", None)
+        if distance_km is not None:
+            state[1] = distance_km
+
+        ground_speed = sbs_dict.get("ground_speed", None)
+        if ground_speed:
+            try:
+                state[2] = float(ground_speed)
+            except ValueError:
+                pass
+
+        if first_sighting:
+            self.push(hex_ident, self.predict_eta(state[1], state[2]))
+
+        elif hex_ident in self.pending and hex_ident not in self.has_eta:
+            # still queued with the default priority, refine it once we know more
+            eta = self.predict_eta(state[1], state[2])
+            if eta is not None:
+                self.push(hex_ident, eta)
+
+        if now - self.last_prune > 60:
+            self.prune(now)
+
+
+    def push(self, hex_ident, eta):
+
+        with self.cond:
+
+            if eta is None:
+                eta = self.unknown_eta_sec
+            else:
+                self.has_eta.add(hex_ident)
+
+            if hex_ident not in self.pending:
+                self.enqueued_count += 1
+
+            self.seq += 1
+            self.pending[hex_ident] = eta
+            heapq.heappush(self.heap, (eta, self.seq, hex_ident))
+
+            if len(self.pending) > self.max_pending:
+                self.drop_furthest()
+
+            self.cond.notify()
+
+
+    def drop_furthest(self):
+
+        hex_ident = max(self.pending, key=self.pending.get)
+        del self.pending[hex_ident]
+        self.has_eta.discard(hex_ident)
+        self.dropped_count += 1
+
+
+    def pop(self, timeout=1.0):
+
+        with self.cond:
+
+            while self.running:
+
+                while self.heap:
+                    eta, _, hex_ident = heapq.heappop(self.heap)
+                    # skip entries that were re-prioritized or dropped
+                    if self.pending.get(hex_ident) != eta:
+                        continue
+                    del self.pending[hex_ident]
+                    self.has_eta.discard(hex_ident)
+                    return hex_ident
+
+                self.cond.wait(timeout)
+
+        return None
+
+
+    def prune(self, now):
+
+        self.last_prune = now
+        expired = [
+            hex_ident for hex_ident, state in self.seen.items()
+            if now - state[0] > self.seen_ttl_sec
+        ]
+        for hex_ident in expired:
+            del self.seen[hex_ident]
+
+
+    def run(self):
+
+        while self.running:
+
+            hex_ident = self.pop()
+            if not hex_ident:
+                continue
+
+            for name, fetcher in self.fetchers:
+                try:
+                    fetcher(hex_ident)
+                except Exception as e:
+                    self.error_count += 1
+                    log.error("Prefetch '%s' failed for %s: %s", name, hex_ident, e)
+
+            self.completed_count += 1
+
+        log.info("Prefetch thread ended.")
+
+
+    def stats(self):
+
+        return {
+            "pending": len(self.pending),
+            "enqueued": self.enqueued_count,
+            "completed": self.completed_count,
+            "dropped": self.dropped_count,
+            "errors": self.error_count,
+        }
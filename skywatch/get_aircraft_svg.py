@@ -2,8 +2,13 @@
 # Ported to Python from:
 # https://github.com/flightaware/dump1090/blob/master/public_html/markers.js
 
+import os
+import csv
+import json
 import base64
-from typing import Dict, List
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 class AircraftIcon:
 
@@ -317,32 +322,46 @@ category_icons: Dict[str, str] = {
 }
 
 
-def get_base_marker(designator, description_code, description, wtc):
+def get_base_shape(designator, description_code, description, wtc) -> str:
     """
         designator=B737, description_code=L2J, description=LandPlane, wtc=M
+        returns the shape name, e.g. 'airliner'
     """
 
     if designator in type_designator_icons:
-        return shapes.get(type_designator_icons[designator], shapes['unknown'])
+        shape = type_designator_icons[designator]
+        return shape if shape in shapes else 'unknown'
 
     if description_code and len(description_code) == 3:
 
         if wtc and len(wtc) == 1:
             composite = f"{description_code}-{wtc}"
             if composite in type_description_icons:
-                return shapes.get(type_description_icons[composite], shapes['unknown'])
+                shape = type_description_icons[composite]
+                return shape if shape in shapes else 'unknown'
 
         if description_code in type_description_icons:
-            return shapes.get(type_description_icons[description_code], shapes['unknown'])
+            shape = type_description_icons[description_code]
+            return shape if shape in shapes else 'unknown'
 
         base_type = description_code[0]
         if base_type in type_description_icons:
-            return shapes.get(type_description_icons[base_type], shapes['unknown'])
+            shape = type_description_icons[base_type]
+            return shape if shape in shapes else 'unknown'
 
     if description in category_icons:
-        return shapes.get(category_icons[description], shapes['unknown'])
+        shape = category_icons[description]
+        return shape if shape in shapes else 'unknown'
+
+    return 'unknown'
+
+
+def get_base_marker(designator, description_code, description, wtc):
+    """
+        designator=B737, description_code=L2J, description=LandPlane, wtc=M
+    """
 
-    return shapes['unknown']
+    return shapes[get_base_shape(designator, description_code, description, wtc)]
 
 
 def svg_path_to_svg(svg, stroke, fill, selected_stroke):
@@ -361,6 +380,149 @@ def svg_path_to_uri(svg, stroke, fill, selected_stroke):
     return f"data:image/svg+xml;base64,{encoded}"
 
 
+def build_designator_shapes(csv_path: str, out_path: str) -> Dict[str, str]:
+    """
+        Resolve every ICAO Doc 8643 row once into designator -> shape name
+        and save it as a compact artifact:
+
+            {"shapes": ["airliner", ...], "designators": {"B737": 0, ...}}
+
+        When a designator appears more than once, the first row wins.
+    """
+
+    designators: Dict[str, str] = {}
+
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            designator = (row.get("designator") or "").strip().upper()
+            if not designator or designator in designators:
+                continue
+            designators[designator] = get_base_shape(designator,
+                                                     row.get("description_code"),
+                                                     row.get("aircraft_description"),
+                                                     row.get("wake_turbulence_category"))
+
+    shape_names = sorted(set(designators.values()))
+    shape_ids = {name: i for i, name in enumerate(shape_names)}
+
+    artifact = {
+        "shapes": shape_names,
+        "designators": {
+            designator: shape_ids[shape]
+            for designator, shape in sorted(designators.items())
+        }
+    }
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, separators=(",", ":"))
+
+    return designators
+
+
+def load_designator_shapes(path: str = "db/designator_shapes.json",
+                           csv_path: str = "db/ICAO-doc8643-2019.csv") -> Dict[str, str]:
+    """
+        Load the designator -> shape name table, building it first if needed.
+    """
+
+    if not os.path.exists(path):
+        return build_designator_shapes(csv_path, path)
+
+    with open(path, "r", encoding="utf-8") as f:
+        artifact = json.load(f)
+
+    shape_names = artifact["shapes"]
+
+    return {
+        designator: shape_names[shape_id]
+        for designator, shape_id in artifact["designators"].items()
+    }
+
+
+# colors of the rendered markers (markers.js: stroke, fill, selected outline)
+DEFAULT_STROKE = "#000000"
+DEFAULT_FILL = "#1abc9c"
+DEFAULT_SELECTED_STROKE = ""
+
+
+class Marker_Cache:
+    """
+        LRU-bounded cache of rendered markers:
+
+            (shape, stroke, fill, selected_stroke) -> (svg bytes, data-URI bytes)
+
+        Memory is counted as the byte length of the stored SVG and data-URI.
+    """
+
+    def __init__(self, max_renders: int = 1024):
+
+        self.max_renders = max_renders
+
+        self.renders: "OrderedDict[Tuple, Tuple[bytes, bytes]]" = OrderedDict()
+        self.render_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def render(self,
+               shape,
+               stroke=DEFAULT_STROKE,
+               fill=DEFAULT_FILL,
+               selected_stroke=DEFAULT_SELECTED_STROKE) -> Tuple[bytes, bytes]:
+        """
+            Returns (svg, data-URI) for a shape in the given colors.
+        """
+
+        key = (shape, stroke, fill, selected_stroke)
+
+        with self.lock:
+            rendered = self.renders.get(key)
+            if rendered is not None:
+                self.renders.move_to_end(key)
+                self.hits += 1
+                return rendered
+            self.misses += 1
+
+        icon = shapes.get(shape, shapes['unknown'])
+        svg = svg_path_to_svg(icon.svg, stroke, fill, selected_stroke).encode('utf-8')
+        uri = b"data:image/svg+xml;base64," + base64.b64encode(svg)
+        rendered = (svg, uri)
+
+        with self.lock:
+            if key not in self.renders:
+                self.render_bytes += len(svg) + len(uri)
+            self.renders[key] = rendered
+            while len(self.renders) > self.max_renders:
+                _, (old_svg, old_uri) = self.renders.popitem(last=False)
+                self.render_bytes -= len(old_svg) + len(old_uri)
+
+        return rendered
+
+
+    def precompute(self, colors: Optional[List[Tuple[str, str, str]]] = None) -> None:
+        """
+            Render every shape, in the default colors or in each of the
+            given (stroke, fill, selected_stroke).
+        """
+
+        for stroke, fill, selected_stroke in colors or [(DEFAULT_STROKE, DEFAULT_FILL, DEFAULT_SELECTED_STROKE)]:
+            for shape in shapes:
+                self.render(shape, stroke, fill, selected_stroke)
+
+
+    def memory_usage(self) -> Dict[str, int]:
+
+        with self.lock:
+            return {
+                "renders": len(self.renders),
+                "render_bytes": self.render_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
 if __name__ == "__main__":
 
     block_html = """
@@ -47,6 +47,20 @@ class HEXDB_REST_API_Client(REST_API_Client):
         return True, output
 
 
+    @staticmethod
+    def is_not_found(status, output):
+        """
+            True if hexdb.io answered that the aircraft is unknown (404 or
+            an empty / error body), as opposed to a transient failure such
+            as a timeout, 429 or 5xx.
+        """
+
+        if status:
+            return not output or "ModeS" not in output
+
+        return isinstance(output, str) and output.startswith("Return code=404")
+
+
     def get_airport_info_icao(self, icao_code):
         """
             Get airport info from ICAO code.
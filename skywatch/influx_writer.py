@@ -0,0 +1,532 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Buffered InfluxDB line-protocol writer
+
+# Aircraft state updates are converted to InfluxDB line protocol:
+#
+#   aircraft,hex_ident=AA8114 altitude=7950i,latitude=37.78368,longitude=-122.15441,distance_km=2.31 1745275738123
+#
+# and handed to a background thread that batches them by size and time,
+# gzips the payload and posts it to the InfluxDB v2 write endpoint.
+#
+# Memory is bounded: when a write fails, the batch is spilled to disk and the
+# writer backs off. While backing off, new batches go straight to disk. Once
+# the backoff expires the spill files are replayed, oldest first. Points are
+# only dropped when both the memory buffer and the spill directory are full.
+#
+# A 4xx answer other than 429 is permanent (bad line protocol): retrying the
+# same batch would fail forever and block the spill files behind it. The
+# batch is halved until the rejected points are isolated; they are dropped,
+# or moved to a dead-letter file ('<name>.rejected.gz', never replayed) when
+# they come from a spill file.
+#
+# Benchmark against a local stand-in for the write endpoint:
+#
+#   python influx_writer.py
+
+import os
+import sys
+import math
+import gzip
+import time
+import random
+import threading
+import logging
+from collections import deque
+
+import requests
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# sbs field -> line protocol type
+INFLUX_FIELDS = {
+    "altitude": "int",
+    "ground_speed": "float",
+    "track": "float",
+    "latitude": "float",
+    "longitude": "float",
+    "vertical_rate": "int",
+    "squawk": "string",
+    "callsign": "string",
+}
+
+# outcome of a write
+POST_OK = "ok"
+POST_RETRY = "retry"          # network error, 5xx, 429: back off and retry
+POST_REJECTED = "rejected"    # other 4xx, the payload itself is refused
+
+
+def escape_tag(value):
+
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def escape_string(value):
+
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def to_line_protocol(sbs_dict, measurement="aircraft", timestamp_ms=None):
+    """
+        One point per SBS message with the fields it carries, or None.
+    """
+
+    hex_ident = sbs_dict.get("hex_ident", None)
+    if not hex_ident:
+        return None
+
+    fields = []
+
+    for name, kind in INFLUX_FIELDS.items():
+
+        value = sbs_dict.get(name, None)
+        if not value:
+            continue
+
+        value = value.strip()
+        if not value:
+            continue
+
+        try:
+            if kind == "string":
+                fields.append(f'{name}="{escape_string(value)}"')
+                continue
+            number = float(value)
+        except ValueError:
+            continue
+
+        # line protocol has no NaN or infinity, Influx rejects the batch
+        if not math.isfinite(number):
+            continue
+
+        if kind == "int":
+            fields.append(f"{name}={int(number)}i")
+        else:
+            fields.append(f"{name}={number}")
+
+    distance_km = sbs_dict.get("distance_km", None)
+    if distance_km is not None and math.isfinite(distance_km):
+        fields.append(f"distance_km={round(distance_km, 3)}")
+
+    if not fields:
+        return None
+
+    # dump1090 stamps messages on reception, the local clock is equivalent
+    # and avoids parsing the date/time fields for every message
+    if timestamp_ms is None:
+        timestamp_ms = time.time_ns() // 1_000_000
+
+    return f"{measurement},hex_ident={escape_tag(hex_ident.strip())} {','.join(fields)} {timestamp_ms}"
+
+
+class Influx_Writer():
+
+    def __init__(self,
+                 url,                       # http://localhost:8086
+                 token,
+                 org,
+                 bucket,
+                 measurement="aircraft",
+                 batch_size=5000,           # points per write
+                 flush_interval=1.0,        # seconds
+                 max_buffer=100000,         # points held in memory
+                 spill_dir="influx_spill",  # None to drop instead of spilling
+                 max_spill_bytes=256*1024*1024,
+                 base_backoff_sec=1,
+                 max_backoff_sec=60,
+                 timeout=10):
+
+        self.write_url = f"{url.rstrip('/')}/api/v2/write"
+        self.params = {"org": org, "bucket": bucket, "precision": "ms"}
+        self.headers = {
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Encoding": "gzip",
+        }
+        if token:
+            self.headers["Authorization"] = f"Token {token}"
+
+        self.measurement = measurement
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.base_backoff_sec = base_backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.timeout = timeout
+
+        self.session = requests.Session()
+
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self.failures = 0            # consecutive failed writes
+        self.blocked_until = 0
+
+        self.written_count = 0
+        self.dropped_count = 0
+        self.spilled_count = 0
+        self.rejected_count = 0      # points Influx refused, isolated by halving
+        self.error_count = 0
+        self.flush_count = 0
+        self.bytes_sent = 0
+        self.latencies = deque(maxlen=256)
+        self.last_sample = (time.time(), 0)
+        self.write_rate = 0.0
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+
+    def start(self):
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self, timeout=10):
+        """
+            Flush what is buffered (or spill it) before returning.
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+        if self.thread:
+            self.thread.join(timeout)
+
+
+    def write_sbs(self, sbs_dict, timestamp_ms=None):
+
+        line = to_line_protocol(sbs_dict, self.measurement, timestamp_ms)
+        if line:
+            self.write(line)
+
+
+    def write(self, line):
+        """
+            Called from the ingest thread, never blocks.
+        """
+
+        with self.cond:
+
+            if len(self.buffer) >= self.max_buffer:
+                self.dropped_count += 1
+                return
+
+            self.buffer.append(line)
+
+            if len(self.buffer) >= self.batch_size:
+                self.cond.notify()
+
+
+    def take_batch(self):
+
+        with self.cond:
+
+            if len(self.buffer) < self.batch_size and self.running:
+                self.cond.wait(self.flush_interval)
+
+            count = min(len(self.buffer), self.batch_size)
+            return [self.buffer.popleft() for _ in range(count)]
+
+
+    def run(self):
+
+        while True:
+
+            batch = self.take_batch()
+
+            if batch and time.time() < self.blocked_until:
+                self.spill(batch)
+            elif batch:
+                rejected = []
+                pending = self.deliver(batch, rejected)
+                self.reject(rejected)
+                if pending:
+                    self.spill(pending)
+            elif time.time() >= self.blocked_until:
+                # Influx accepts writes: one spill file per loop next to
+                # the fresh batch, so a steady feed does not starve replay
+                self.replay(max_files=1)
+
+            self.sample_rate()
+
+            if not self.running and not self.buffer:
+                break
+
+        log.info("Influx writer thread ended.")
+
+
+    def deliver(self, batch, rejected):
+        """
+            Post a batch, halving it when Influx refuses its content, until
+            the offending points are isolated in 'rejected'. Returns the
+            points still to be sent after a temporary failure.
+        """
+
+        result = self.post(batch)
+
+        if result == POST_OK:
+            return []
+
+        if result == POST_RETRY:
+            return batch
+
+        if len(batch) == 1:
+            rejected.append(batch[0])
+            return []
+
+        middle = len(batch) // 2
+        pending = self.deliver(batch[:middle], rejected)
+        if pending:
+            return pending + batch[middle:]
+        return self.deliver(batch[middle:], rejected)
+
+
+    def reject(self, lines, path=None):
+        """
+            Count the refused points, and keep them in a dead-letter file
+            next to 'path' when they come from a spill file.
+        """
+
+        if not lines:
+            return
+
+        self.rejected_count += len(lines)
+
+        if path:
+            dead_letter = path[:-len(".lp.gz")] + ".rejected.gz"
+            with gzip.open(dead_letter, "at", encoding="utf-8", compresslevel=5) as f:
+                f.write("\n".join(lines) + "\n")
+            log.warning("Influx rejected %d spilled points, moved to %s", len(lines), dead_letter)
+        else:
+            log.warning("Influx rejected %d points, dropped. First: %s", len(lines), lines[0][:200])
+
+
+    def post(self, batch):
+        """
+            Returns POST_OK, POST_RETRY (the writer backs off) or POST_REJECTED.
+        """
+
+        payload = gzip.compress(("\n".join(batch) + "\n").encode("utf-8"), compresslevel=5)
+
+        start_time = time.perf_counter()
+
+        try:
+            response = self.session.post(self.write_url,
+                                         params=self.params,
+                                         headers=self.headers,
+                                         data=payload,
+                                         timeout=self.timeout)
+            status = response.status_code < 300
+            error = None if status else f"{response.status_code} {response.text[:200]}"
+            permanent = 400 <= response.status_code < 500 and response.status_code != 429
+        except requests.RequestException as e:
+            status = False
+            error = str(e)
+            permanent = False
+
+        duration = time.perf_counter() - start_time
+
+        if not status and permanent:
+            self.error_count += 1
+            log.debug("Influx refused %d points: %s", len(batch), error)
+            return POST_REJECTED
+
+        if not status:
+            self.error_count += 1
+            self.failures += 1
+            backoff = min(self.base_backoff_sec * (2 ** (self.failures - 1)), self.max_backoff_sec)
+            self.blocked_until = time.time() + backoff
+            log.error("Influx write of %d points failed, retrying in %.1f s: %s", len(batch), backoff, error)
+            return POST_RETRY
+
+        self.failures = 0
+        self.latencies.append(duration)
+        self.flush_count += 1
+        self.written_count += len(batch)
+        self.bytes_sent += len(payload)
+        return POST_OK
+
+
+    def spill_usage(self):
+
+        return sum(entry.stat().st_size for entry in os.scandir(self.spill_dir))
+
+
+    def spill(self, batch):
+
+        if not self.spill_dir:
+            # no spill directory: keep the batch in memory while there is room
+            with self.cond:
+                room = self.max_buffer - len(self.buffer)
+                keep = batch[:max(room, 0)]
+                self.buffer.extendleft(reversed(keep))
+                self.dropped_count += len(batch) - len(keep)
+            # wait out the backoff instead of spinning on the same batch
+            time.sleep(max(0, min(self.blocked_until - time.time(), self.flush_interval)))
+            return
+
+        if self.spill_usage() >= self.max_spill_bytes:
+            self.dropped_count += len(batch)
+            log.warning("Influx spill directory is full, dropping %d points.", len(batch))
+            return
+
+        path = os.path.join(self.spill_dir, f"{time.time_ns()}.lp.gz")
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=5) as f:
+            f.write("\n".join(batch) + "\n")
+
+        self.spilled_count += len(batch)
+
+
+    def replay(self, max_files=None):
+        """
+            Re-send spilled batches, oldest first, until one fails.
+        """
+
+        if not self.spill_dir:
+            return
+
+        filenames = sorted(filename for filename in os.listdir(self.spill_dir) if filename.endswith(".lp.gz"))
+
+        for filename in filenames[:max_files]:
+
+            path = os.path.join(self.spill_dir, filename)
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                batch = f.read().splitlines()
+
+            rejected = []
+            pending = self.deliver(batch, rejected)
+            self.reject(rejected, path)
+
+            if pending:
+                if len(pending) < len(batch):
+                    # keep only what was not written nor rejected
+                    tmp_path = path + ".tmp"
+                    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=5) as f:
+                        f.write("\n".join(pending) + "\n")
+                    os.replace(tmp_path, path)
+                    self.spilled_count -= len(batch) - len(pending)
+                return
+
+            os.remove(path)
+            self.spilled_count -= len(batch)
+            log.debug("Replayed %d spilled Influx points.", len(batch))
+
+
+    def sample_rate(self, interval=10.0):
+        """
+            Called from the writer thread only, so that stats() has no side
+            effects and the monitor and /metrics read the same rate.
+        """
+
+        now = time.time()
+        last_time, last_written = self.last_sample
+
+        if now - last_time >= interval:
+            self.write_rate = (self.written_count - last_written) / (now - last_time)
+            self.last_sample = (now, self.written_count)
+
+
+    def stats(self):
+
+        latencies = sorted(self.latencies)
+
+        stats = {
+            "buffered": len(self.buffer),
+            "written": self.written_count,
+            "points_per_sec": round(self.write_rate, 1),
+            "flushes": self.flush_count,
+            "kb_sent": round(self.bytes_sent / 1024, 1),
+            "spilled": self.spilled_count,
+            "dropped": self.dropped_count,
+            "rejected": self.rejected_count,
+            "errors": self.error_count,
+            "flush_avg_ms": None,
+            "flush_p95_ms": None
+        }
+
+        if latencies:
+            stats["flush_avg_ms"] = round(sum(latencies) / len(latencies) * 1000, 1)
+            stats["flush_p95_ms"] = round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1)
+
+        return stats
+
+
+if __name__ == "__main__":
+
+    import tempfile
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    fail_first = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    received = {"points": 0, "requests": 0}
+
+    class Write_Handler(BaseHTTPRequestHandler):
+        """
+            Stand-in for the InfluxDB v2 write endpoint. Fails the first
+            requests to exercise spill and replay.
+        """
+
+        def do_POST(self):
+
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received["requests"] += 1
+
+            if received["requests"] <= fail_first:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            lines = gzip.decompress(body).decode("utf-8").splitlines()
+            received["points"] += len(lines)
+
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Write_Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    writer = Influx_Writer(url=f"http://127.0.0.1:{server.server_port}",
+                           token="token",
+                           org="org",
+                           bucket="skywatch",
+                           spill_dir=tempfile.mkdtemp(prefix="influx_spill_"),
+                           base_backoff_sec=0.2)
+    writer.start()
+
+    count = 200000
+    start_time = time.perf_counter()
+
+    for i in range(count):
+        writer.write_sbs({
+            "hex_ident": f"{random.randint(0, 0xFFFF):06X}",
+            "altitude": str(random.randint(1000, 40000)),
+            "latitude": f"{37 + random.random():.5f}",
+            "longitude": f"{-122 + random.random():.5f}",
+            "distance_km": random.uniform(0, 300)
+        })
+
+    produce_duration = time.perf_counter() - start_time
+
+    # wait for the backlog and the spill files to drain
+    deadline = time.time() + 60
+    while received["points"] < count and time.time() < deadline:
+        time.sleep(0.1)
+
+    duration = time.perf_counter() - start_time
+    stats = writer.stats()
+    writer.stop()
+    server.shutdown()
+
+    log.info("Produced %d points in %.2f s (%.1f us/point)", count, produce_duration, produce_duration / count * 1e6)
+    log.info("Received %d points in %d requests, %.0f points/sec end to end", received["points"], received["requests"], received["points"] / duration)
+    log.info("Writer stats: %s", stats)
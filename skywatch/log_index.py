@@ -0,0 +1,453 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Sidecar index and memory-mapped queries over SBS log segments
+
+# Extracting one aircraft from the SBS log used to mean parsing every row of
+# a multi-GB CSV file. The index is built once per log segment and saved next
+# to it (aircraft_log.csv -> aircraft_log.csv.idx.npz):
+#
+#   hex_ident -> byte ranges of its lines. Lines of other aircraft that
+#                fall in a gap smaller than 'gap' bytes are included, so one
+#                aircraft needs a few hundred ranges instead of one per line.
+#   time      -> byte offset, sampled every 'sample_every' lines.
+#
+# A query maps the segment with mmap, reads only the ranges of the requested
+# aircraft inside the requested time window and checks the few candidate
+# lines. Segments whose time span does not overlap the window are skipped.
+#
+# An index is rebuilt when its segment has changed size. Compressed segments
+# (.gz/.zst, see sbs_logger.py) cannot be memory-mapped and are scanned as a
+# stream instead.
+#
+# Benchmark on a synthetic log:
+#
+#   python log_index.py [number of lines]
+
+import os
+import sys
+import io
+import csv
+import glob
+import gzip
+import mmap
+import time
+import random
+import bisect
+import tempfile
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+HEADER_PREFIX = b"message_type,"
+TIME_FORMAT = "%Y/%m/%d %H:%M:%S.%f"
+
+
+def parse_time(date_field, time_field):
+    """
+        b'2025/04/21', b'22:48:58.123' -> epoch seconds, or None
+    """
+
+    try:
+        stamp = f"{date_field.decode()} {time_field.decode()}"
+        if "." not in stamp:
+            stamp += ".0"
+        return datetime.strptime(stamp, TIME_FORMAT).timestamp()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def time_key(dt):
+    """
+        datetime -> b'2025/04/21 22:48:58.123', comparable with log fields.
+    """
+
+    return dt.strftime("%Y/%m/%d %H:%M:%S.%f")[:-3].encode()
+
+
+class Segment_Index():
+
+    def __init__(self, path):
+
+        self.path = path
+        self.index_path = path + ".idx.npz"
+
+        self.size = 0
+        self.hex_offsets = {}       # hex_ident -> (first range, last range + 1)
+        self.ranges = None          # int64 (n, 2): start, end
+        self.sample_times = None    # float64 epoch seconds
+        self.sample_offsets = None  # int64 byte offsets
+        self.first_time = None
+        self.last_time = None
+
+
+    def build(self, gap=4096, sample_every=1000, chunk_size=16*1024*1024):
+
+        start_time = time.perf_counter()
+
+        ranges = {}                 # hex_ident -> [start, end, start, end, ...]
+        sample_times = []
+        sample_offsets = []
+
+        offset = 0
+        count = 0
+        tail = b""
+
+        with open(self.path, "rb") as f:
+
+            while True:
+
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+
+                lines = (tail + chunk).split(b"\n")
+                tail = lines.pop()
+
+                for line in lines:
+
+                    line_end = offset + len(line) + 1
+                    fields = line.split(b",", 8)
+
+                    if len(fields) > 8 and not line.startswith(HEADER_PREFIX):
+
+                        hex_ident = fields[4]
+                        spans = ranges.get(hex_ident)
+                        if spans is None:
+                            ranges[hex_ident] = [offset, line_end]
+                        elif offset - spans[-1] <= gap:
+                            spans[-1] = line_end
+                        else:
+                            spans.append(offset)
+                            spans.append(line_end)
+
+                        if count % sample_every == 0:
+                            timestamp = parse_time(fields[6], fields[7])
+                            if timestamp is not None:
+                                sample_times.append(timestamp)
+                                sample_offsets.append(offset)
+
+                        count += 1
+
+                    offset = line_end
+
+        # a last line without newline is indexed on the next build
+
+        hexes = sorted(ranges)
+        bounds = [0]
+        flat = []
+        for hex_ident in hexes:
+            flat.extend(ranges[hex_ident])
+            bounds.append(len(flat) // 2)
+
+        self.size = offset
+        self.ranges = np.array(flat, dtype=np.int64).reshape(-1, 2)
+        self.hex_offsets = {
+            hex_ident.decode(): (bounds[i], bounds[i + 1]) for i, hex_ident in enumerate(hexes)
+        }
+        self.sample_times = np.array(sample_times, dtype=np.float64)
+        self.sample_offsets = np.array(sample_offsets, dtype=np.int64)
+        self.first_time = sample_times[0] if sample_times else None
+        self.last_time = self.last_line_time(offset)
+
+        np.savez(self.index_path,
+                 size=np.int64(self.size),
+                 hexes=np.array(list(self.hex_offsets), dtype="U8"),
+                 bounds=np.array(bounds, dtype=np.int64),
+                 ranges=self.ranges,
+                 sample_times=self.sample_times,
+                 sample_offsets=self.sample_offsets,
+                 span=np.array([self.first_time or np.nan, self.last_time or np.nan]))
+
+        log.info("Indexed %s: %d lines, %d aircraft, %d ranges in %.2f s",
+                 self.path, count, len(hexes), len(self.ranges), time.perf_counter() - start_time)
+
+
+    def last_line_time(self, size):
+
+        if size == 0:
+            return None
+
+        with open(self.path, "rb") as f:
+            f.seek(max(size - 4096, 0))
+            lines = f.read(size - f.tell()).split(b"\n")
+
+        for line in reversed(lines):
+            fields = line.split(b",", 8)
+            if len(fields) > 8 and not line.startswith(HEADER_PREFIX):
+                return parse_time(fields[6], fields[7])
+
+        return None
+
+
+    def load(self):
+        """
+            Load the sidecar index. False if missing or stale.
+        """
+
+        if not os.path.exists(self.index_path):
+            return False
+
+        data = np.load(self.index_path)
+
+        if int(data["size"]) != os.path.getsize(self.path):
+            return False
+
+        bounds = data["bounds"]
+        self.size = int(data["size"])
+        self.hex_offsets = {
+            str(hex_ident): (int(bounds[i]), int(bounds[i + 1])) for i, hex_ident in enumerate(data["hexes"])
+        }
+        self.ranges = data["ranges"]
+        self.sample_times = data["sample_times"]
+        self.sample_offsets = data["sample_offsets"]
+
+        first_time, last_time = data["span"]
+        self.first_time = None if np.isnan(first_time) else float(first_time)
+        self.last_time = None if np.isnan(last_time) else float(last_time)
+
+        return True
+
+
+    def open(self, **kwargs):
+
+        if not self.load():
+            self.build(**kwargs)
+
+
+    def byte_window(self, start=None, end=None):
+        """
+            Byte span that contains every line between two datetimes.
+        """
+
+        low, high = 0, self.size
+
+        if start is not None and len(self.sample_times):
+            i = bisect.bisect_right(self.sample_times, start.timestamp()) - 1
+            if i > 0:
+                low = int(self.sample_offsets[i])
+
+        if end is not None and len(self.sample_times):
+            i = bisect.bisect_right(self.sample_times, end.timestamp())
+            if i < len(self.sample_offsets):
+                high = int(self.sample_offsets[i])
+
+        return low, high
+
+
+    def overlaps(self, start=None, end=None):
+
+        if start is not None and self.last_time is not None and self.last_time < start.timestamp():
+            return False
+        if end is not None and self.first_time is not None and self.first_time > end.timestamp():
+            return False
+        return True
+
+
+    def candidate_ranges(self, hex_idents=None, start=None, end=None):
+
+        low, high = self.byte_window(start, end)
+
+        if not hex_idents:
+            return [(low, high)] if low < high else []
+
+        selected = []
+        for hex_ident in hex_idents:
+            bounds = self.hex_offsets.get(hex_ident)
+            if bounds:
+                selected.append(self.ranges[bounds[0]:bounds[1]])
+
+        if not selected:
+            return []
+
+        ranges = np.concatenate(selected)
+        ranges = ranges[(ranges[:, 1] > low) & (ranges[:, 0] < high)]
+        ranges = ranges[np.argsort(ranges[:, 0])]
+
+        # merge overlapping ranges of different aircraft
+        merged = []
+        for range_start, range_end in ranges.tolist():
+            if merged and range_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+
+        return merged
+
+
+    def query(self, hex_idents=None, start=None, end=None):
+        """
+            Yields the raw lines (bytes) of the requested aircraft and window.
+        """
+
+        if not self.overlaps(start, end):
+            return
+
+        ranges = self.candidate_ranges(hex_idents, start, end)
+        if not ranges:
+            return
+
+        wanted = {hex_ident.encode() for hex_ident in hex_idents} if hex_idents else None
+        start_key = time_key(start) if start else None
+        end_key = time_key(end) if end else None
+
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for range_start, range_end in ranges:
+                    for line in mm[range_start:min(range_end, self.size)].split(b"\n"):
+                        if match_line(line, wanted, start_key, end_key):
+                            yield line
+
+
+def match_line(line, wanted, start_key, end_key):
+
+    fields = line.split(b",", 8)
+    if len(fields) <= 8 or line.startswith(HEADER_PREFIX):
+        return False
+
+    if wanted is not None and fields[4] not in wanted:
+        return False
+
+    if start_key or end_key:
+        key = fields[6] + b" " + fields[7]
+        if start_key and key < start_key:
+            return False
+        if end_key and key > end_key:
+            return False
+
+    return True
+
+
+def open_stream(path):
+
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+
+    if path.endswith(".zst"):
+        if not zstandard:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")))
+
+    return open(path, "rb")
+
+
+def scan_compressed(path, hex_idents=None, start=None, end=None):
+
+    wanted = {hex_ident.encode() for hex_ident in hex_idents} if hex_idents else None
+    start_key = time_key(start) if start else None
+    end_key = time_key(end) if end else None
+
+    with open_stream(path) as f:
+        for line in f:
+            line = line.rstrip(b"\n")
+            if match_line(line, wanted, start_key, end_key):
+                yield line
+
+
+def expand_segments(paths):
+    """
+        A log path expands to its rotated segments (oldest first) plus itself.
+    """
+
+    segments = []
+
+    for path in paths:
+
+        if os.path.isdir(path):
+            candidates = glob.glob(os.path.join(path, "*.csv*"))
+        else:
+            base, ext = os.path.splitext(path)
+            candidates = glob.glob(f"{base}.*{ext}") + glob.glob(f"{base}.*{ext}.gz") + glob.glob(f"{base}.*{ext}.zst")
+            candidates = sorted(candidates) + ([path] if os.path.exists(path) else [])
+
+        for candidate in candidates:
+            if candidate.endswith((".idx.npz", ".tmp")) or candidate in segments:
+                continue
+            segments.append(candidate)
+
+    return segments
+
+
+def query_segments(paths, hex_idents=None, start=None, end=None, **build_kwargs):
+    """
+        Yields matching raw lines across all segments of the given logs.
+    """
+
+    for path in expand_segments(paths):
+
+        if path.endswith((".gz", ".zst")):
+            log.debug("%s is compressed, scanning without index.", path)
+            yield from scan_compressed(path, hex_idents, start, end)
+            continue
+
+        index = Segment_Index(path)
+        index.open(**build_kwargs)
+        yield from index.query(hex_idents, start, end)
+
+
+def synthetic_log(path, lines, aircraft=3000):
+
+    start = datetime(2025, 4, 21).timestamp()
+
+    with open(path, "w", encoding="utf-8", buffering=8*1024*1024) as f:
+        f.write("message_type,transmission_type,session_id,aircraft_id,hex_ident,flight_id,"
+                "generated_date,generated_time,logged_date,logged_time,callsign,altitude,"
+                "ground_speed,track,latitude,longitude,vertical_rate,squawk,alert,emergency,spi,is_on_ground\n")
+        for i in range(lines):
+            stamp = datetime.fromtimestamp(start + i * 0.005).strftime("%Y/%m/%d,%H:%M:%S.%f")[:-3]
+            hex_ident = f"{random.randint(0, aircraft):06X}"
+            f.write(f"MSG,3,1,1,{hex_ident},1,{stamp},{stamp},,{random.randint(1000, 40000)},,,"
+                    f"{37 + random.random():.5f},{-122 + random.random():.5f},,,0,,0,0\n")
+
+
+if __name__ == "__main__":
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+
+    path = os.path.join(tempfile.mkdtemp(prefix="sbs_log_"), "aircraft_log.csv")
+
+    start_time = time.perf_counter()
+    synthetic_log(path, count)
+    log.info("Generated %s: %d lines, %.1f MB in %.1f s",
+             path, count, os.path.getsize(path) / 1024 / 1024, time.perf_counter() - start_time)
+
+    index = Segment_Index(path)
+    start_time = time.perf_counter()
+    index.build()
+    log.info("Index build: %.2f s, %.1f MB on disk",
+             time.perf_counter() - start_time, os.path.getsize(index.index_path) / 1024 / 1024)
+
+    targets = ["00002A", "000B2F", "0003E8"]
+    window_start = datetime.fromtimestamp(index.first_time + 3600)
+    window_end = datetime.fromtimestamp(index.first_time + 3 * 3600)
+
+    # the previous approach: csv.DictReader over the whole file
+    start_time = time.perf_counter()
+    with open(path, newline="", encoding="utf-8") as f:
+        full_scan = sum(1 for row in csv.DictReader(f) if row["hex_ident"] == targets[0])
+    log.info("DictReader scan, one aircraft:    %8.1f ms (%d lines)", (time.perf_counter() - start_time) * 1000, full_scan)
+
+    start_time = time.perf_counter()
+    index = Segment_Index(path)
+    index.open()
+    log.info("Index load:                       %8.1f ms", (time.perf_counter() - start_time) * 1000)
+
+    start_time = time.perf_counter()
+    found = sum(1 for _ in index.query([targets[0]]))
+    log.info("Indexed query, one aircraft:      %8.1f ms (%d lines)", (time.perf_counter() - start_time) * 1000, found)
+
+    start_time = time.perf_counter()
+    found = sum(1 for _ in index.query(targets, window_start, window_end))
+    log.info("Indexed query, 3 aircraft / 2 h:  %8.1f ms (%d lines)", (time.perf_counter() - start_time) * 1000, found)
+
+    start_time = time.perf_counter()
+    found = sum(1 for _ in index.query(None, window_start, window_start + timedelta(minutes=5)))
+    log.info("Indexed query, all / 5 min:       %8.1f ms (%d lines)", (time.perf_counter() - start_time) * 1000, found)
@@ -0,0 +1,131 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Minimal HTTP endpoint for metrics and coverage
+
+# SkyWatch reported its state only through the monitor log. This server runs
+# on its own thread (standard library only) and serves:
+#
+#   GET /metrics     Prometheus text format, numeric values of the stats
+#   GET /<name>      JSON of any other registered route, e.g. /coverage
+#
+#   curl http://localhost:8080/metrics
+#   curl http://localhost:8080/coverage
+#
+# It listens on the loopback interface by default: /coverage reveals the
+# receiver location. Bind it to another address only behind a firewall.
+
+import re
+import json
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+
+def flatten(stats, prefix="skywatch"):
+    """
+        {"influx": {"written": 10}} -> {"skywatch_influx_written": 10}
+        Values that are not numbers are left out.
+    """
+
+    metrics = {}
+
+    for key, value in stats.items():
+
+        name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{key}")
+
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name))
+        elif isinstance(value, bool):
+            metrics[name] = int(value)
+        elif isinstance(value, (int, float)):
+            metrics[name] = value
+
+    return metrics
+
+
+def prometheus_text(metrics):
+
+    return "".join(f"{name} {value}\n" for name, value in sorted(metrics.items()))
+
+
+class Metrics_Server():
+
+    def __init__(self, host="127.0.0.1", port=8080):
+
+        self.host = host
+        self.port = port
+
+        self.metrics = None     # callable -> nested dict of stats
+        self.routes = {}        # path -> callable returning a JSON-able object
+
+        self.server = None
+        self.thread = None
+
+
+    def set_metrics(self, get_stats):
+
+        self.metrics = get_stats
+
+
+    def add_route(self, path, handler):
+
+        self.routes[path] = handler
+
+
+    def start(self):
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+
+                path = self.path.split("?", 1)[0].rstrip("/") or "/"
+
+                try:
+                    if path == "/metrics" and server.metrics:
+                        body = prometheus_text(flatten(server.metrics())).encode("utf-8")
+                        content_type = "text/plain; version=0.0.4"
+                    elif path in server.routes:
+                        body = json.dumps(server.routes[path]()).encode("utf-8")
+                        content_type = "application/json"
+                    else:
+                        self.send_error(404)
+                        return
+                except Exception as e:
+                    log.error("Cannot serve %s: %s", path, e)
+                    self.send_error(500)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug("HTTP %s", format % args)
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            log.error("Cannot start metrics server on %s:%d: %s", self.host, self.port, e)
+            return False
+
+        self.server.daemon_threads = True
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        log.info("Metrics server listening on %s:%d", self.host, self.port)
+        return True
+
+
+    def stop(self):
+
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
@@ -3,16 +3,29 @@
 # Email: mani.amoozadeh2@gmail.com
 # Description: model for interacting with Redis
 
+import os
 import redis
 import json
 import re
 import inspect
 import logging
+from dotenv import load_dotenv
+
+from cache_budget import Cache_Budget
 
 logging.basicConfig(level=logging.INFO)
 
+load_dotenv()
+
 r = redis.Redis(host='localhost', port=6379, db=0)
 
+# Bound the memory used by cached REST responses, independent of any
+# global maxmemory-policy (which would also evict live aircraft state).
+budget = Cache_Budget(r,
+                      max_bytes=int(os.getenv('CACHE_MAX_BYTES', 32*1024*1024)),
+                      max_keys=int(os.getenv('CACHE_MAX_KEYS', 50000)),
+                      policy=os.getenv('CACHE_POLICY', 'lru'))
+
 def sanitize_key(key_str):
 
     key_str = key_str.replace(" ", "_")  # Replace spaces
@@ -46,15 +59,17 @@ def get_from_cache(key):
 
     val = r.get(key)
     if val:
+        budget.touch(key)
         return json.loads(val)
     return None
 
 
-def set_to_cache(key, data, ttl=None):
+def set_to_cache(key, data, ttl=None, namespace="default"):
 
     try:
         value = json.dumps(data)
         r.set(key, value, ex=ttl)
+        budget.track(key, namespace, len(key) + len(value))
     except redis.RedisError as e:
         logging.error(f"Redis error: {e}")
     except (TypeError, ValueError) as e:
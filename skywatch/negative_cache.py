@@ -0,0 +1,146 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Bounded negative-lookup cache for unknown ICAO hex codes
+
+# Aircraft that hexdb.io does not know about used to be collected in an
+# unbounded set, and were retried on every alert. This cache remembers them
+# for a limited time (TTL) and a limited count (LRU), and short-circuits
+# repeated lookups.
+#
+# The cache is mirrored into a Redis sorted set (member = hex code,
+# score = expiry time) so that it survives restarts. Expired members are
+# trimmed on every add, so the set stays as small as the cache.
+
+import time
+import heapq
+import threading
+import logging
+from collections import OrderedDict
+
+import redis
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+
+class Negative_Cache():
+
+    def __init__(self,
+                 redis_client,
+                 key="negative_cache:icao_hex",
+                 max_size=5000,
+                 ttl_sec=6*3600):
+
+        self.r = redis_client
+        self.key = key
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+
+        self.entries = OrderedDict()   # hex_ident -> [expires_at, hits]
+        self.lock = threading.Lock()
+
+        self.short_circuit_count = 0
+
+
+    def load(self):
+        """
+            Restore unexpired entries from Redis.
+        """
+
+        now = time.time()
+
+        try:
+            self.r.zremrangebyscore(self.key, "-inf", now)
+            stored = self.r.zrange(self.key, -self.max_size, -1, withscores=True)
+        except redis.RedisError as e:
+            log.error("Cannot load negative cache: %s", e)
+            return 0
+
+        with self.lock:
+            for member, expires_at in stored:
+                if isinstance(member, bytes):
+                    member = member.decode()
+                self.entries[member] = [expires_at, 0]
+
+        log.info("Loaded %d unknown ICAO hex codes from negative cache.", len(stored))
+
+        return len(stored)
+
+
+    def add(self, hex_ident):
+
+        now = time.time()
+        expires_at = now + self.ttl_sec
+
+        with self.lock:
+
+            entry = self.entries.get(hex_ident)
+            if entry:
+                entry[0] = expires_at
+                self.entries.move_to_end(hex_ident)
+            else:
+                self.entries[hex_ident] = [expires_at, 0]
+
+            evicted = []
+            while len(self.entries) > self.max_size:
+                old_hex, _ = self.entries.popitem(last=False)
+                evicted.append(old_hex)
+
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            pipe.zremrangebyscore(self.key, "-inf", now)
+            pipe.zadd(self.key, {hex_ident: expires_at})
+            if evicted:
+                pipe.zrem(self.key, *evicted)
+            pipe.execute()
+        except redis.RedisError as e:
+            log.error("Cannot persist negative cache: %s", e)
+
+
+    def contains(self, hex_ident):
+        """
+            True if hex_ident is a known-unknown that has not expired yet.
+        """
+
+        with self.lock:
+
+            entry = self.entries.get(hex_ident)
+            if not entry:
+                return False
+
+            if entry[0] < time.time():
+                del self.entries[hex_ident]
+                return False
+
+            entry[1] += 1
+            self.entries.move_to_end(hex_ident)
+            self.short_circuit_count += 1
+
+            return True
+
+
+    def discard(self, hex_ident):
+
+        with self.lock:
+            self.entries.pop(hex_ident, None)
+
+        try:
+            self.r.zrem(self.key, hex_ident)
+        except redis.RedisError as e:
+            log.error("Cannot persist negative cache: %s", e)
+
+
+    def count(self):
+
+        return len(self.entries)
+
+
+    def top(self, n=5):
+        """
+            Most frequently short-circuited hex codes, as (hex_ident, hits).
+        """
+
+        with self.lock:
+            ranked = heapq.nlargest(n, self.entries.items(), key=lambda item: item[1][1])
+
+        return [(hex_ident, entry[1]) for hex_ident, entry in ranked]
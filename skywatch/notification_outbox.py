@@ -0,0 +1,227 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Durable outbox for Discord notifications
+
+# Alerts used to be posted to Discord synchronously, one message per aircraft,
+# from the ingest thread. A failure was only logged (and then cached for 30
+# seconds by the REST client), so the alert was lost.
+#
+# Now alerts are pushed to a Redis list and a sender thread drains it:
+#
+#   outbox:discord           pending alerts (LPUSH in, pop from the right)
+#   outbox:discord:inflight  batch currently being sent (recovered on restart)
+#   outbox:discord:dead      alerts that exhausted all retries
+#
+# Up to 10 embeds are packed into one webhook call, Discord rate-limit
+# headers are honoured, and failed batches are retried with exponential
+# backoff.
+
+import time
+import json
+import threading
+import logging
+
+import redis
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+
+class Discord_Outbox():
+
+    def __init__(self,
+                 redis_client,
+                 discord,
+                 key="outbox:discord",
+                 max_embeds=10,
+                 max_retries=8,
+                 base_backoff_sec=2,
+                 max_backoff_sec=300):
+
+        self.r = redis_client
+        self.discord = discord
+
+        self.key = key
+        self.inflight_key = f"{key}:inflight"
+        self.dead_key = f"{key}:dead"
+
+        self.max_embeds = min(max_embeds, 10)  # Discord limit per message
+        self.max_retries = max_retries
+        self.base_backoff_sec = base_backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+
+        self.running = False
+        self.thread = None
+        self.blocked_until = 0
+
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.retry_count = 0
+        self.rate_limited_count = 0
+        self.dead_count = 0
+
+
+    def start(self):
+
+        self.recover()
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+
+        self.running = False
+
+
+    def enqueue(self, embed, content):
+
+        item = {
+            "content": content,
+            "embed": embed,
+            "attempts": 0,
+            "enqueued": time.time()
+        }
+
+        try:
+            self.r.lpush(self.key, json.dumps(item))
+        except redis.RedisError as e:
+            log.error("Cannot enqueue Discord alert: %s", e)
+            return False
+
+        return True
+
+
+    def recover(self):
+        """
+            Put back a batch that was in flight when the process stopped.
+        """
+
+        count = 0
+        while self.r.lmove(self.inflight_key, self.key, "LEFT", "RIGHT"):
+            count += 1
+
+        if count:
+            log.info("Recovered %d in-flight Discord alerts.", count)
+
+
+    def take_batch(self, timeout=1):
+
+        first = self.r.blmove(self.key, self.inflight_key, timeout, "RIGHT", "LEFT")
+        if not first:
+            return []
+
+        batch = [first]
+        content = json.loads(first).get("content")
+
+        # only alerts with the same content can share a message
+        while len(batch) < self.max_embeds:
+            raw = self.r.lindex(self.key, -1)
+            if not raw or json.loads(raw).get("content") != content:
+                break
+            raw = self.r.lmove(self.key, self.inflight_key, "RIGHT", "LEFT")
+            if not raw:
+                break
+            batch.append(raw)
+
+        return batch
+
+
+    def requeue(self, batch, count_attempt=True):
+
+        pipe = self.r.pipeline()
+        dead = 0
+
+        # push back oldest-last, so the batch is sent first and in order
+        for raw in reversed(batch):
+            item = json.loads(raw)
+            if count_attempt:
+                item["attempts"] = item.get("attempts", 0) + 1
+            if item["attempts"] > self.max_retries:
+                pipe.lpush(self.dead_key, json.dumps(item))
+                dead += 1
+            else:
+                pipe.rpush(self.key, json.dumps(item))
+
+        pipe.delete(self.inflight_key)
+        pipe.execute()
+
+        if dead:
+            self.dead_count += dead
+            log.error("%d Discord alerts moved to %s after %d attempts.", dead, self.dead_key, self.max_retries)
+
+
+    def backoff_sec(self, batch):
+
+        attempts = max(json.loads(raw).get("attempts", 0) for raw in batch)
+        return min(self.base_backoff_sec * (2 ** attempts), self.max_backoff_sec)
+
+
+    def run(self):
+
+        while self.running:
+
+            wait = self.blocked_until - time.time()
+            if wait > 0:
+                time.sleep(min(wait, 1))
+                continue
+
+            try:
+                batch = self.take_batch()
+                if batch:
+                    self.send_batch(batch)
+            except redis.RedisError as e:
+                log.error("Discord outbox Redis error: %s", e)
+                time.sleep(1)
+
+        log.info("Discord outbox thread ended.")
+
+
+    def send_batch(self, batch):
+
+        items = [json.loads(raw) for raw in batch]
+        content = items[0].get("content")
+        embeds = [item["embed"] for item in items]
+
+        status, info = self.discord.send_discord_embeds(content=content, embeds=embeds)
+
+        # proactive: wait for the bucket to refill before the next call
+        if info.get("remaining") == 0 and info.get("reset_after"):
+            self.blocked_until = max(self.blocked_until, time.time() + info["reset_after"])
+
+        if status:
+            self.r.delete(self.inflight_key)
+            self.sent_messages += 1
+            self.sent_embeds += len(embeds)
+            return
+
+        if info.get("retry_after") is not None:
+            self.rate_limited_count += 1
+            self.blocked_until = time.time() + info["retry_after"]
+            log.warning("Discord rate limited, retrying in %.1f s.", info["retry_after"])
+            self.requeue(batch, count_attempt=False)
+            return
+
+        backoff = self.backoff_sec(batch)
+        self.retry_count += 1
+        self.blocked_until = time.time() + backoff
+        log.error("Failed to send msg to discord, retrying in %.1f s.\n%s", backoff, info.get("error"))
+        self.requeue(batch)
+
+
+    def stats(self):
+
+        try:
+            pending = self.r.llen(self.key)
+        except redis.RedisError:
+            pending = None
+
+        return {
+            "pending": pending,
+            "messages": self.sent_messages,
+            "embeds": self.sent_embeds,
+            "retries": self.retry_count,
+            "rate_limited": self.rate_limited_count,
+            "dead": self.dead_count
+        }
@@ -0,0 +1,246 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Pluggable notifiers with concurrent fan-out
+
+# An alert is published once and delivered to every registered sink
+# (Discord, X, a local file, a generic webhook). Each sink has its own bounded
+# queue and worker threads, so a slow or failing sink can neither delay
+# another sink nor the ingest loop. When a sink's queue is full, the alert is
+# dropped for that sink only and counted.
+#
+# An alert is a dict:
+#
+#   {
+#       "hex_ident": "AA8114",
+#       "content": "✈️ Nearby aircraft detected!",
+#       "text": "AA8114 UAL1791 detected 2.31 km from base at 7950 ft.",
+#       "embed": {...}          # Discord embed
+#   }
+
+import abc
+import json
+import time
+import queue
+import threading
+import logging
+from collections import deque
+
+import requests
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+
+class Notifier(abc.ABC):
+
+    name = "notifier"
+
+    @abc.abstractmethod
+    def send(self, alert):
+        """
+            Deliver one alert. Returns (status, output).
+        """
+
+
+class Discord_Notifier(Notifier):
+
+    name = "discord"
+
+    def __init__(self, outbox):
+
+        self.outbox = outbox
+
+
+    def send(self, alert):
+
+        # the outbox takes care of batching, rate limits and retries
+        status = self.outbox.enqueue(alert["embed"], content=alert["content"])
+        return status, None
+
+
+class Tweet_Notifier(Notifier):
+
+    name = "x"
+
+    def __init__(self, tweet_send):
+
+        self.tweet_send = tweet_send
+
+
+    def send(self, alert):
+
+        return self.tweet_send.tweet_text(alert["text"])
+
+
+class File_Notifier(Notifier):
+    """
+        Appends alerts as JSON lines. Handy as a local stand-in for tests.
+    """
+
+    name = "file"
+
+    def __init__(self, path):
+
+        self.path = path
+        self.lock = threading.Lock()
+
+
+    def send(self, alert):
+
+        line = json.dumps(alert, default=str)
+
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+        return True, None
+
+
+class Webhook_Notifier(Notifier):
+    """
+        POSTs each alert as JSON, e.g. to a home automation endpoint.
+    """
+
+    name = "webhook"
+
+    def __init__(self, url, timeout=10):
+
+        self.url = url
+        self.timeout = timeout
+
+
+    def send(self, alert):
+
+        try:
+            response = requests.post(self.url, json=alert, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as E:
+            return False, str(E)
+
+        return True, None
+
+
+class Sink():
+
+    def __init__(self, notifier, max_queue, concurrency, latency_window=256):
+
+        self.notifier = notifier
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.concurrency = concurrency
+        self.threads = []
+
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=latency_window)
+        self.sent_count = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+
+
+    def record(self, status, duration):
+
+        with self.lock:
+            self.latencies.append(duration)
+            if status:
+                self.sent_count += 1
+            else:
+                self.failed_count += 1
+
+
+    def stats(self):
+
+        with self.lock:
+            latencies = sorted(self.latencies)
+            sent = self.sent_count
+            failed = self.failed_count
+
+        stats = {
+            "queued": self.queue.qsize(),
+            "sent": sent,
+            "failed": failed,
+            "dropped": self.dropped_count,
+            "avg_ms": None,
+            "p95_ms": None,
+            "max_ms": None
+        }
+
+        if latencies:
+            stats["avg_ms"] = round(sum(latencies) / len(latencies) * 1000, 1)
+            stats["p95_ms"] = round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1)
+            stats["max_ms"] = round(latencies[-1] * 1000, 1)
+
+        return stats
+
+
+class Notifier_Fanout():
+
+    def __init__(self):
+
+        self.sinks = []
+        self.running = False
+
+
+    def add(self, notifier, max_queue=100, concurrency=1):
+
+        self.sinks.append(Sink(notifier, max_queue, concurrency))
+
+
+    def start(self):
+
+        self.running = True
+
+        for sink in self.sinks:
+            for i in range(sink.concurrency):
+                thread = threading.Thread(target=self.worker,
+                                          args=(sink,),
+                                          name=f"notifier-{sink.notifier.name}-{i}",
+                                          daemon=True)
+                thread.start()
+                sink.threads.append(thread)
+
+
+    def stop(self):
+
+        self.running = False
+
+
+    def publish(self, alert):
+        """
+            Never blocks: a full sink queue drops the alert for that sink only.
+        """
+
+        for sink in self.sinks:
+            try:
+                sink.queue.put_nowait(alert)
+            except queue.Full:
+                sink.dropped_count += 1
+                log.warning("Notifier '%s' queue is full, dropping alert.", sink.notifier.name)
+
+
+    def worker(self, sink):
+
+        while self.running:
+
+            try:
+                alert = sink.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            start_time = time.perf_counter()
+
+            try:
+                status, output = sink.notifier.send(alert)
+            except Exception as e:
+                status, output = False, str(e)
+
+            sink.record(status, time.perf_counter() - start_time)
+
+            if not status:
+                log.error("Notifier '%s' failed: %s", sink.notifier.name, output)
+
+
+    def stats(self):
+
+        return {
+            sink.notifier.name: sink.stats()
+            for sink in self.sinks
+        }
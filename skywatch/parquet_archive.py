@@ -0,0 +1,390 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Columnar Parquet archive of received SBS messages
+
+# The CSV log was written with csv.DictWriter on the consumer thread, one row
+# per message, into a single ever-growing file. Analysis scripts then had to
+# parse all of it as text.
+#
+# The archive hands the raw SBS lines to a background thread. Each batch is
+# parsed by Arrow's C++ CSV reader straight into typed columns, and written
+# as one row group of an hourly Parquet file (zstd). Columns are read as text
+# and cast to their types afterwards, so a value that does not convert (e.g.
+# '35000.5' as altitude) becomes null instead of failing the whole batch:
+#
+#   archive/sbs_20250421_22.parquet
+#
+# The file being written is hidden ('.sbs_20250421_22.parquet.tmp', which
+# Arrow datasets skip) and renamed once its footer is written, so readers only
+# ever see complete files:
+#
+#   pyarrow.parquet.read_table("archive", columns=["hex_ident", "altitude"])
+#
+# Benchmark against the CSV DictWriter log:
+#
+#   python parquet_archive.py [number of messages]
+
+import os
+import sys
+import io
+import csv
+import time
+import random
+import tempfile
+import threading
+import logging
+from datetime import datetime
+from collections import deque
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import sbs_message
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# same columns as sbs_message.SBS_FIELD_NAMES, typed
+SBS_SCHEMA = pa.schema([
+    ("message_type", pa.string()),
+    ("transmission_type", pa.int8()),
+    ("session_id", pa.string()),
+    ("aircraft_id", pa.string()),
+    ("hex_ident", pa.string()),
+    ("flight_id", pa.string()),
+    ("generated_date", pa.string()),
+    ("generated_time", pa.string()),
+    ("logged_date", pa.string()),
+    ("logged_time", pa.string()),
+    ("callsign", pa.string()),
+    ("altitude", pa.int32()),
+    ("ground_speed", pa.float32()),
+    ("track", pa.float32()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("vertical_rate", pa.int32()),
+    ("squawk", pa.string()),
+    ("alert", pa.bool_()),
+    ("emergency", pa.bool_()),
+    ("spi", pa.bool_()),
+    ("is_on_ground", pa.bool_())
+])
+
+assert SBS_SCHEMA.names == sbs_message.SBS_FIELD_NAMES
+
+# every column as text, cast to SBS_SCHEMA by cast_columns()
+TEXT_SCHEMA = pa.schema([(name, pa.string()) for name in SBS_SCHEMA.names])
+
+INTEGER_PATTERN = r"^[-+]?\d{1,18}$"
+FLOAT_PATTERN = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+TRUE_VALUES = pa.array(["-1", "1"])
+FALSE_VALUES = pa.array(["0"])
+
+READ_OPTIONS = pa_csv.ReadOptions(column_names=SBS_SCHEMA.names)
+PARSE_OPTIONS = pa_csv.ParseOptions(invalid_row_handler=lambda row: "skip")
+CONVERT_OPTIONS = pa_csv.ConvertOptions(
+    column_types=TEXT_SCHEMA,
+    strings_can_be_null=True,
+    quoted_strings_can_be_null=True
+)
+
+
+def cast_column(column, type_field):
+    """
+        Text column -> type_field. Values that do not convert become null.
+        Returns (column, number of such values).
+    """
+
+    if pa.types.is_string(type_field):
+        return column, 0
+
+    if pa.types.is_boolean(type_field):
+        flag = pc.if_else(pc.is_in(column, value_set=TRUE_VALUES), True,
+                          pc.if_else(pc.is_in(column, value_set=FALSE_VALUES), False, pa.scalar(None, pa.bool_())))
+        return flag, flag.null_count - column.null_count
+
+    try:
+        return column.cast(type_field), 0
+    except pa.ArrowInvalid:
+        pass
+
+    # slow path, only for the column that failed: null out the values that
+    # do not parse, then those out of the range of the type
+    is_integer = pa.types.is_integer(type_field)
+    parses = pc.match_substring_regex(column, INTEGER_PATTERN if is_integer else FLOAT_PATTERN)
+    values = pc.if_else(parses, column, pa.scalar(None, pa.string()))
+    values = values.cast(pa.int64() if is_integer else pa.float64())
+
+    if is_integer:
+        bits = type_field.bit_width
+        low, high = (-2 ** (bits - 1), 2 ** (bits - 1) - 1) if pa.types.is_signed_integer(type_field) else (0, 2 ** bits - 1)
+        in_range = pc.and_(pc.greater_equal(values, low), pc.less_equal(values, high))
+        values = pc.if_else(in_range, values, pa.scalar(None, pa.int64()))
+
+    values = values.cast(type_field, safe=False)
+    return values, values.null_count - column.null_count
+
+
+def cast_columns(data, schema=SBS_SCHEMA):
+    """
+        Table or record batch of text columns -> the types of schema.
+        Returns (table or record batch, number of values set to null).
+    """
+
+    fields = [schema.field(name) for name in data.schema.names]
+
+    columns = []
+    invalid = 0
+    for column, field in zip(data.columns, fields):
+        column, count = cast_column(column, field.type)
+        columns.append(column)
+        invalid += count
+
+    return type(data).from_arrays(columns, schema=pa.schema(fields)), invalid
+
+
+def parse_lines(lines):
+    """
+        Raw SBS lines -> (Arrow table with SBS_SCHEMA, number of values set to null).
+    """
+
+    data = ("\n".join(lines) + "\n").encode("utf-8")
+
+    table = pa_csv.read_csv(io.BytesIO(data),
+                            read_options=READ_OPTIONS,
+                            parse_options=PARSE_OPTIONS,
+                            convert_options=CONVERT_OPTIONS)
+
+    return cast_columns(table)
+
+
+class Parquet_Archive():
+
+    def __init__(self,
+                 directory="archive",
+                 prefix="sbs",
+                 batch_size=50000,       # rows per row group
+                 flush_interval=60,      # seconds
+                 max_buffer=500000,      # lines held in memory
+                 compression="zstd"):
+
+        self.directory = directory
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.compression = compression
+
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self.writer = None
+        self.writer_hour = None
+        self.writer_path = None
+
+        self.written_count = 0
+        self.skipped_count = 0
+        self.invalid_count = 0      # values that did not convert, stored as null
+        self.dropped_count = 0
+        self.file_count = 0
+        self.write_duration = 0.0
+        self.bytes_written = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def start(self):
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self, timeout=30):
+        """
+            Write what is buffered and close the current file.
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+        if self.thread:
+            self.thread.join(timeout)
+
+
+    def write_line(self, line):
+        """
+            Called from the consumer thread with the raw SBS line.
+        """
+
+        with self.cond:
+
+            if len(self.buffer) >= self.max_buffer:
+                self.dropped_count += 1
+                return
+
+            self.buffer.append(line)
+
+            if len(self.buffer) >= self.batch_size:
+                self.cond.notify()
+
+
+    def take_batch(self):
+
+        with self.cond:
+
+            if len(self.buffer) < self.batch_size and self.running:
+                self.cond.wait(self.flush_interval)
+
+            count = min(len(self.buffer), self.batch_size)
+            return [self.buffer.popleft() for _ in range(count)]
+
+
+    def run(self):
+
+        while True:
+
+            batch = self.take_batch()
+
+            try:
+                self.rotate()
+                if batch:
+                    self.write_batch(batch)
+            except Exception as e:
+                log.error("Parquet archive write failed, %d lines lost: %s", len(batch), e)
+
+            if not self.running and not self.buffer:
+                break
+
+        self.close()
+
+        log.info("Parquet archive thread ended.")
+
+
+    def rotate(self):
+
+        hour = datetime.now().strftime("%Y%m%d_%H")
+        if hour == self.writer_hour:
+            return
+
+        self.close()
+
+        path = os.path.join(self.directory, f"{self.prefix}_{hour}.parquet")
+        if os.path.exists(path):
+            # restarted within the hour, keep the finished file
+            path = os.path.join(self.directory, f"{self.prefix}_{hour}_{int(time.time())}.parquet")
+
+        self.writer_path = path
+        self.writer_hour = hour
+        self.writer = pq.ParquetWriter(self.tmp_path(path), SBS_SCHEMA, compression=self.compression)
+
+
+    @staticmethod
+    def tmp_path(path):
+
+        directory, filename = os.path.split(path)
+        return os.path.join(directory, f".{filename}.tmp")
+
+
+    def close(self):
+
+        if not self.writer:
+            return
+
+        self.writer.close()
+        os.replace(self.tmp_path(self.writer_path), self.writer_path)
+
+        self.bytes_written += os.path.getsize(self.writer_path)
+        self.file_count += 1
+        log.info("Archived %s (%.1f KB)", self.writer_path, os.path.getsize(self.writer_path) / 1024)
+
+        self.writer = None
+        self.writer_hour = None
+        self.writer_path = None
+
+
+    def write_batch(self, batch):
+
+        start_time = time.perf_counter()
+
+        table, invalid = parse_lines(batch)
+        self.writer.write_table(table, row_group_size=len(batch))
+
+        self.write_duration += time.perf_counter() - start_time
+        self.written_count += table.num_rows
+        self.skipped_count += len(batch) - table.num_rows
+        self.invalid_count += invalid
+
+
+    def stats(self):
+
+        return {
+            "buffered": len(self.buffer),
+            "written": self.written_count,
+            "skipped": self.skipped_count,
+            "invalid": self.invalid_count,
+            "dropped": self.dropped_count,
+            "files": self.file_count,
+            "rows_per_sec": round(self.written_count / self.write_duration, 1) if self.write_duration else None,
+            "mb_on_disk": round(self.bytes_written / 1024 / 1024, 2)
+        }
+
+
+def synthetic_line(i):
+
+    hex_ident = f"{random.randint(0, 300):06X}"
+    stamp = f"2025/04/21,22:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}.{i % 1000:03d}"
+    kind = i % 3
+
+    if kind == 0:
+        return (f"MSG,3,1,1,{hex_ident},1,{stamp},{stamp},,{random.randint(1000, 40000)},,,"
+                f"{37 + random.random():.5f},{-122 + random.random():.5f},,,0,,0,0")
+    if kind == 1:
+        return (f"MSG,4,1,1,{hex_ident},1,{stamp},{stamp},,,{random.randint(120, 500)},"
+                f"{random.uniform(0, 360):.1f},,,{random.choice([-1500, 0, 1500])},,0,,0,0")
+    return f"MSG,5,1,1,{hex_ident},1,{stamp},{stamp},,{random.randint(1000, 40000)},,,,,,,0,,0,0"
+
+
+if __name__ == "__main__":
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lines = [synthetic_line(i) for i in range(count)]
+    directory = tempfile.mkdtemp(prefix="sbs_archive_")
+
+    # CSV DictWriter, as done on the consumer thread
+    csv_path = os.path.join(tempfile.mkdtemp(prefix="sbs_csv_"), "aircraft_log.csv")
+    start_time = time.perf_counter()
+    with open(csv_path, mode="w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=sbs_message.SBS_FIELD_NAMES)
+        writer.writeheader()
+        for line in lines:
+            writer.writerow(sbs_message.tokenize(line))
+    csv_duration = time.perf_counter() - start_time
+    csv_size = os.path.getsize(csv_path)
+
+    archive = Parquet_Archive(directory=directory)
+    archive.start()
+
+    start_time = time.perf_counter()
+    for line in lines:
+        archive.write_line(line)
+    handoff_duration = time.perf_counter() - start_time
+
+    archive.stop()
+    parquet_duration = time.perf_counter() - start_time
+    parquet_size = archive.bytes_written
+
+    start_time = time.perf_counter()
+    table = pq.read_table(directory, columns=["hex_ident", "altitude"])
+    read_duration = time.perf_counter() - start_time
+
+    log.info("CSV    : %.0f msg/sec on the consumer thread, %.1f MB", count / csv_duration, csv_size / 1024 / 1024)
+    log.info("Parquet: %.0f msg/sec end to end (handoff %.2f us/msg), %.1f MB",
+             count / parquet_duration, handoff_duration / count * 1e6, parquet_size / 1024 / 1024)
+    log.info("Parquet: read 2 columns of %d rows in %.1f ms", table.num_rows, read_duration * 1000)
@@ -0,0 +1,64 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Thread-safe token bucket rate limiter
+
+import time
+import threading
+
+
+class Rate_Limiter():
+
+    def __init__(self, rate_per_sec, burst=1):
+
+        if rate_per_sec <= 0:
+            raise ValueError("rate_per_sec must be positive")
+
+        self.rate_per_sec = rate_per_sec
+        self.burst = max(burst, 1)
+
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def __refill(self):
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate_per_sec)
+        self.last_refill = now
+
+
+    def try_acquire(self, tokens=1):
+
+        with self.lock:
+            self.__refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+            Block until tokens are available.
+            Returns False if the timeout expired first.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+
+            with self.lock:
+                self.__refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate_per_sec
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+
+            time.sleep(wait)
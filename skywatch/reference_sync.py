@@ -0,0 +1,238 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Incremental sync of the reference tables
+
+# Reference tables (airlines, airplanes, airports, ...) used to be loaded only
+# when empty, so the only way to refresh them was to wipe the database.
+#
+# A sync pulls the records from a local JSON file or from aviationstack,
+# diffs them against the table by primary key and content hash, and applies
+# only the inserts, updates and deletes, in batches. In-memory caches that
+# registered a listener for the table are told about the affected keys.
+#
+# Usage:
+#
+#   python reference_sync.py                          # all tables from db/*.json
+#   python reference_sync.py airlines --source aviationstack
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import logging
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+import models_sql
+import utility
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# table name -> (model, json file, aviationstack endpoint, date fields)
+REFERENCE_TABLES = {
+    "aircraft_types": (models_sql.AircraftType, "db/aircraft_types.json", "aircraft_types", None),
+    "airlines": (models_sql.Airline, "db/airlines.json", "airlines", None),
+    "airplanes": (models_sql.Airplane, "db/airplanes.json", "airplanes", ["delivery_date", "first_flight_date"]),
+    "airports": (models_sql.Airport, "db/airports.json", "airports", None),
+    "cities": (models_sql.City, "db/cities.json", "cities", None),
+    "countries": (models_sql.Country, "db/countries.json", "countries", None),
+}
+
+# table name -> list of callback(upserted_records, deleted_keys)
+listeners = {}
+
+
+def register_listener(table_name, callback):
+
+    listeners.setdefault(table_name, []).append(callback)
+
+
+def notify_listeners(table_name, upserted, deleted):
+
+    for callback in listeners.get(table_name, []):
+        try:
+            callback(upserted, deleted)
+        except Exception as e:
+            log.error("Reference cache listener for %s failed: %s", table_name, e)
+
+
+def json_source(filepath):
+
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    yield from data
+
+
+def aviationstack_source(client, endpoint):
+
+    for status, data in client.iter_pages(endpoint):
+        if not status:
+            raise RuntimeError(f"Fetching {endpoint} failed: {data}")
+        yield from data
+
+
+def row_hash(record, columns):
+
+    digest = hashlib.sha1()
+    for name in columns:
+        value = record.get(name)
+        digest.update(b"" if value is None else str(value).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def load_hashes(table, columns, primary_keys):
+
+    hashes = {}
+
+    with models_sql.engine.connect() as conn:
+        result = conn.execution_options(yield_per=5000).execute(select(table))
+        for row in result.mappings():
+            key = tuple(row[name] for name in primary_keys)
+            hashes[key] = row_hash(row, columns)
+
+    return hashes
+
+
+def sync_table(table_name, records, batch_size=1000, delete_missing=True):
+    """
+        Diff 'records' against the table and apply only the changes.
+        Returns (status, stats).
+    """
+
+    model, _, _, date_fields = REFERENCE_TABLES[table_name]
+
+    start_time = time.time()
+
+    table = model.__table__
+    columns = [column.name for column in table.columns]
+    primary_keys = [column.name for column in table.primary_key.columns]
+    update_columns = [name for name in columns if name not in primary_keys]
+
+    models_sql.Base.metadata.create_all(models_sql.engine, tables=[table])
+
+    existing = load_hashes(table, columns, primary_keys)
+    remaining = set(existing)
+
+    inserts = []
+    updates = []
+    unchanged = 0
+
+    # The diff is computed completely before anything is written, so that a
+    # source failing halfway through does not delete the rows it did not reach.
+    try:
+        for item in records:
+
+            if date_fields:
+                models_sql.convert_date_fields(item, date_fields)
+
+            record = {name: item.get(name) for name in columns}
+            key = tuple(record[name] for name in primary_keys)
+
+            old_hash = existing.get(key)
+            remaining.discard(key)
+
+            if old_hash is None:
+                inserts.append(record)
+            elif old_hash != row_hash(record, columns):
+                updates.append(record)
+            else:
+                unchanged += 1
+
+    except Exception as e:
+        log.error("Sync of %s aborted: %s", table_name, e)
+        return False, str(e)
+
+    deletes = list(remaining) if delete_missing else []
+    upserts = inserts + updates
+
+    with models_sql.engine.begin() as conn:
+
+        for i in range(0, len(upserts), batch_size):
+            chunk = {
+                tuple(record[name] for name in primary_keys): record
+                for record in upserts[i:i + batch_size]
+            }
+            stmt = insert(table).values(list(chunk.values()))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=primary_keys,
+                set_={name: stmt.excluded[name] for name in update_columns}
+            )
+            conn.execute(stmt)
+
+        pk_columns = [table.c[name] for name in primary_keys]
+        for i in range(0, len(deletes), batch_size):
+            chunk = deletes[i:i + batch_size]
+            conn.execute(table.delete().where(tuple_(*pk_columns).in_(chunk)))
+
+    if upserts or deletes:
+        notify_listeners(table_name, upserts, deletes)
+
+    stats = {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(deletes),
+        "unchanged": unchanged
+    }
+
+    duration = time.time() - start_time
+    elapsed = utility.elapsed_format(duration)
+    log.info("Synced %s in %s: %s", table_name, elapsed, stats)
+
+    return True, stats
+
+
+def sync_from_files(table_names=None, delete_missing=True):
+
+    results = {}
+
+    for table_name in table_names or REFERENCE_TABLES:
+
+        _, filepath, _, _ = REFERENCE_TABLES[table_name]
+        if not os.path.exists(filepath):
+            log.debug("%s does not exist, skipping %s.", filepath, table_name)
+            continue
+
+        results[table_name] = sync_table(table_name, json_source(filepath), delete_missing=delete_missing)
+
+    return results
+
+
+def sync_from_aviationstack(client, table_names=None, delete_missing=True):
+
+    results = {}
+
+    for table_name in table_names or REFERENCE_TABLES:
+        _, _, endpoint, _ = REFERENCE_TABLES[table_name]
+        results[table_name] = sync_table(table_name, aviationstack_source(client, endpoint), delete_missing=delete_missing)
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Incrementally sync the reference tables.")
+    parser.add_argument("tables", nargs="*", help=f"tables to sync (default: all of {', '.join(REFERENCE_TABLES)})")
+    parser.add_argument("--source", choices=["file", "aviationstack"], default="file")
+    parser.add_argument("--keep-missing", action="store_true", help="do not delete rows missing from the source")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.tables if name not in REFERENCE_TABLES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+
+    delete_missing = not args.keep_missing
+
+    if args.source == "aviationstack":
+        from aviation_stack_api import Aviation_Stack_REST_API_Client
+        as_h = Aviation_Stack_REST_API_Client(host="api.aviationstack.com", api_ver="v1")
+        results = sync_from_aviationstack(as_h, args.tables, delete_missing)
+    else:
+        results = sync_from_files(args.tables, delete_missing)
+
+    if not all(status for status, _ in results.values()):
+        sys.exit(1)
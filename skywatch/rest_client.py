@@ -9,6 +9,7 @@ import json
 import logging
 import requests
 import inspect
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 import models_redis
 
@@ -71,11 +72,27 @@ class REST_API_Client():
         return False
 
 
+    @staticmethod
+    def __cache_namespace(url):
+        """
+            Namespace used for cache accounting, e.g.
+            https://api.planespotters.net/pub/... -> planespotters
+        """
+
+        hostname = urlparse(url).hostname or ""
+        labels = hostname.split(".")
+        if len(labels) >= 2:
+            return labels[-2]
+
+        return hostname or "default"
+
+
     def request(self, method, url, timeout=10, verify=True, stream=False, decode=True, backoff_ttl=30, **kwargs):
 
         frame = inspect.currentframe()
         key = models_redis.get_key(frame)
         key_error = f"error:{key}"
+        namespace = REST_API_Client.__cache_namespace(url)
 
         cached = models_redis.get_from_cache(key)
         if cached:
@@ -87,7 +104,7 @@ class REST_API_Client():
 
         status, output = self.__request(method, url, timeout, verify, stream, decode, **kwargs)
         if not status:
-            models_redis.set_to_cache(key_error, f"Skipping request to '{url}' for {backoff_ttl} seconds due to recent failure.", ttl=backoff_ttl)
+            models_redis.set_to_cache(key_error, f"Skipping request to '{url}' for {backoff_ttl} seconds due to recent failure.", ttl=backoff_ttl, namespace="error")
             return False, output
 
         # Terms of use: API responses must not be stored for more than 24 hours.
@@ -96,11 +113,20 @@ class REST_API_Client():
         else:
             ttl = None
 
-        models_redis.set_to_cache(key, output, ttl=ttl)
+        models_redis.set_to_cache(key, output, ttl=ttl, namespace=namespace)
 
         return True, output
 
 
+    def request_uncached(self, method, url, timeout=10, verify=True, stream=False, decode=True, **kwargs):
+        """
+            Bypasses the Redis cache, for responses read once (e.g. the pages
+            of a bulk download) that would otherwise fill it.
+        """
+
+        return self.__request(method, url, timeout, verify, stream, decode, **kwargs)
+
+
     def __request(self, method, url, timeout, verify, stream, decode, **kwargs):
 
         try:
@@ -0,0 +1,429 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Bulk writer for the sbs_messages table
+
+# A busy receiver produces hundreds of SBS messages per second, far more than
+# per-row ORM inserts can keep up with. Messages are converted to rows on the
+# ingest thread (cheap string work only) and buffered. A background thread
+# flushes them with a single
+#
+#   COPY sbs_messages (...) FROM STDIN WITH (FORMAT csv)
+#
+# per batch, bounded by size and time. Date and time fields are combined into
+# ISO strings ('2025-04-21 22:48:58.123') that Postgres parses itself, so no
+# datetime objects are built in Python; a regex rejects malformed fields
+# before they reach the database.
+#
+# A row Postgres still refuses (e.g. 2025-02-30, an integer out of range, a
+# NOT NULL or CHECK violation, no partition for its time) fails the whole
+# COPY with a DataError or IntegrityError. The batch is then split in halves
+# and retried until the bad rows are isolated and dropped, so one line does
+# not hold back the rows around it.
+#
+# Benchmark against the local Postgres (docker-compose):
+#
+#   python sbs_copy_writer.py [number of rows]
+
+import io
+import re
+import sys
+import csv
+import time
+import random
+import threading
+import logging
+from datetime import datetime
+from collections import deque
+
+import psycopg2
+
+import models_sql
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+COPY_COLUMNS = [
+    "hex_ident",
+    "msg_type",
+    "transmission_type",
+    "session_id",
+    "aircraft_id",
+    "flight_id",
+    "generated_datetime",
+    "logged_datetime",
+    "callsign",
+    "altitude",
+    "ground_speed",
+    "track",
+    "latitude",
+    "longitude",
+    "vertical_rate",
+    "squawk",
+    "alert",
+    "emergency",
+    "spi",
+    "is_on_ground"
+]
+
+FLAGS = {"-1": "t", "1": "t", "0": "f"}
+
+DATE_PATTERN = re.compile(r"\d{4}/(0[1-9]|1[0-2])/(0[1-9]|[12]\d|3[01])")
+TIME_PATTERN = re.compile(r"([01]\d|2[0-3]):[0-5]\d:[0-5]\d(\.\d{1,6})?")
+
+
+def to_datetime(date_str, time_str):
+    """
+        date_str=2025/04/21, time_str=22:48:58.123 -> '2025-04-21 22:48:58.123'
+        Raises ValueError on a malformed date or time.
+    """
+
+    if not date_str or not time_str:
+        return None
+
+    if not DATE_PATTERN.fullmatch(date_str) or not TIME_PATTERN.fullmatch(time_str):
+        raise ValueError(f"Invalid timestamp '{date_str} {time_str}'")
+
+    return f"{date_str.replace('/', '-')} {time_str}"
+
+
+def to_number(value, integer=False):
+
+    value = (value or "").strip()
+    if not value:
+        return None
+
+    try:
+        return int(float(value)) if integer else float(value)
+    except (ValueError, OverflowError):
+        return None
+
+
+def to_row(sbs_dict):
+    """
+        One tuple per message, in COPY_COLUMNS order. None becomes NULL.
+        Raises ValueError on a malformed timestamp.
+    """
+
+    hex_ident = (sbs_dict.get("hex_ident") or "").strip()
+    if not hex_ident:
+        return None
+
+    generated = to_datetime(sbs_dict.get("generated_date"), sbs_dict.get("generated_time"))
+    logged = to_datetime(sbs_dict.get("logged_date"), sbs_dict.get("logged_time"))
+
+    # generated_datetime is the partition key and cannot be NULL
+    generated = generated or logged or datetime.now().isoformat(sep=" ")
+
+    return (
+        hex_ident,
+        None,   # msg_type is an integer column, the SBS message type is 'MSG'
+        to_number(sbs_dict.get("transmission_type"), integer=True),
+        sbs_dict.get("session_id") or None,
+        sbs_dict.get("aircraft_id") or None,
+        sbs_dict.get("flight_id") or None,
+        generated,
+        logged,
+        (sbs_dict.get("callsign") or "").strip() or None,
+        to_number(sbs_dict.get("altitude"), integer=True),
+        to_number(sbs_dict.get("ground_speed")),
+        to_number(sbs_dict.get("track")),
+        to_number(sbs_dict.get("latitude")),
+        to_number(sbs_dict.get("longitude")),
+        to_number(sbs_dict.get("vertical_rate"), integer=True),
+        sbs_dict.get("squawk") or None,
+        FLAGS.get(sbs_dict.get("alert")),
+        FLAGS.get(sbs_dict.get("emergency")),
+        FLAGS.get(sbs_dict.get("spi")),
+        FLAGS.get(sbs_dict.get("is_on_ground"))
+    )
+
+
+class SBS_Copy_Writer():
+
+    def __init__(self,
+                 table="sbs_messages",
+                 batch_size=5000,       # rows per COPY
+                 flush_interval=2.0,    # seconds
+                 max_buffer=200000,     # rows held in memory
+                 base_backoff_sec=1,
+                 max_backoff_sec=60):
+
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.base_backoff_sec = base_backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+
+        self.copy_sql = f"COPY {table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.failures = 0
+
+        self.written_count = 0
+        self.dropped_count = 0
+        self.invalid_count = 0     # malformed timestamps, never buffered
+        self.rejected_count = 0    # rows Postgres refused, isolated by splitting
+        self.error_count = 0
+        self.flush_count = 0
+        self.latencies = deque(maxlen=256)
+        self.last_sample = (time.time(), 0)
+        self.write_rate = 0.0
+
+
+    def start(self):
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self, timeout=10):
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+        if self.thread:
+            self.thread.join(timeout)
+
+
+    def write_sbs(self, sbs_dict):
+
+        try:
+            row = to_row(sbs_dict)
+        except ValueError as e:
+            self.invalid_count += 1
+            log.debug("Dropping SBS message: %s", e)
+            return
+
+        if row:
+            self.write(row)
+
+
+    def write(self, row):
+        """
+            Called from the ingest thread, never blocks.
+        """
+
+        with self.cond:
+
+            if len(self.buffer) >= self.max_buffer:
+                self.dropped_count += 1
+                return
+
+            self.buffer.append(row)
+
+            if len(self.buffer) >= self.batch_size:
+                self.cond.notify()
+
+
+    def take_batch(self):
+
+        with self.cond:
+
+            if len(self.buffer) < self.batch_size and self.running:
+                self.cond.wait(self.flush_interval)
+
+            count = min(len(self.buffer), self.batch_size)
+            return [self.buffer.popleft() for _ in range(count)]
+
+
+    def run(self):
+
+        while True:
+
+            batch = self.take_batch()
+
+            pending = self.flush(batch) if batch else None
+
+            if pending:
+                self.requeue(pending)
+                if not self.running:
+                    break
+                backoff = min(self.base_backoff_sec * (2 ** (self.failures - 1)), self.max_backoff_sec)
+                time.sleep(backoff)
+
+            self.sample_rate()
+
+            if not self.running and not self.buffer:
+                break
+
+        log.info("SBS copy writer thread ended.")
+
+
+    def requeue(self, batch):
+
+        # oldest rows first; whatever does not fit is dropped
+        with self.cond:
+            room = self.max_buffer - len(self.buffer)
+            keep = batch[:max(room, 0)]
+            self.buffer.extendleft(reversed(keep))
+            self.dropped_count += len(batch) - len(keep)
+
+
+    def copy(self, batch):
+
+        data = io.StringIO()
+        csv.writer(data).writerows(batch)
+        data.seek(0)
+
+        conn = models_sql.engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(self.copy_sql, data)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+    def flush(self, batch):
+        """
+            Returns the rows still to be written: none on success, the
+            rows not yet committed when the database is unavailable.
+        """
+
+        start_time = time.perf_counter()
+
+        try:
+            self.copy(batch)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            if len(batch) == 1:
+                self.rejected_count += 1
+                log.warning("Dropping row rejected by %s: %s %s", self.table, batch[0], str(e).strip())
+                return []
+            # split until the bad rows are isolated
+            middle = len(batch) // 2
+            pending = self.flush(batch[:middle])
+            if pending:
+                return pending + batch[middle:]
+            return self.flush(batch[middle:])
+        except Exception as e:
+            # connection errors (OperationalError, InterfaceError): retry later
+            self.error_count += 1
+            self.failures += 1
+            log.error("COPY of %d rows into %s failed: %s", len(batch), self.table, e)
+            return batch
+
+        self.failures = 0
+        self.latencies.append(time.perf_counter() - start_time)
+        self.flush_count += 1
+        self.written_count += len(batch)
+        return []
+
+
+    def sample_rate(self, interval=10.0):
+        """
+            Called from the writer thread only, so that stats() has no side
+            effects and the monitor and /metrics read the same rate.
+        """
+
+        now = time.time()
+        last_time, last_written = self.last_sample
+
+        if now - last_time >= interval:
+            self.write_rate = (self.written_count - last_written) / (now - last_time)
+            self.last_sample = (now, self.written_count)
+
+
+    def stats(self):
+
+        latencies = sorted(self.latencies)
+
+        stats = {
+            "buffered": len(self.buffer),
+            "written": self.written_count,
+            "rows_per_sec": round(self.write_rate, 1),
+            "flushes": self.flush_count,
+            "dropped": self.dropped_count,
+            "invalid": self.invalid_count,
+            "rejected": self.rejected_count,
+            "errors": self.error_count,
+            "flush_avg_ms": None,
+            "flush_p95_ms": None
+        }
+
+        if latencies:
+            stats["flush_avg_ms"] = round(sum(latencies) / len(latencies) * 1000, 1)
+            stats["flush_p95_ms"] = round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1)
+
+        return stats
+
+
+def synthetic_message(i):
+
+    return {
+        "message_type": "MSG",
+        "transmission_type": "3",
+        "session_id": "1",
+        "aircraft_id": "1",
+        "hex_ident": f"{random.randint(0, 0xFFFF):06X}",
+        "flight_id": "1",
+        "generated_date": "2025/04/21",
+        "generated_time": f"22:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}.{i % 1000:03d}",
+        "logged_date": "2025/04/21",
+        "logged_time": f"22:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}.{i % 1000:03d}",
+        "callsign": "",
+        "altitude": str(random.randint(1000, 40000)),
+        "ground_speed": "",
+        "track": "",
+        "latitude": f"{37 + random.random():.5f}",
+        "longitude": f"{-122 + random.random():.5f}",
+        "vertical_rate": "",
+        "squawk": "",
+        "alert": "0",
+        "emergency": "0",
+        "spi": "0",
+        "is_on_ground": "0"
+    }
+
+
+if __name__ == "__main__":
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    models_sql.Base.metadata.create_all(models_sql.engine, tables=[models_sql.SBSMessage.__table__])
+
+    messages = [synthetic_message(i) for i in range(count)]
+
+    # per-row ORM inserts, on a sample
+    sample = messages[:2000]
+    session = models_sql.Session(bind=models_sql.engine)
+    start_time = time.perf_counter()
+    for sbs_dict in sample:
+        row = dict(zip(COPY_COLUMNS, to_row(sbs_dict)))
+        for name in ("generated_datetime", "logged_datetime"):
+            row[name] = datetime.strptime(row[name], "%Y-%m-%d %H:%M:%S.%f")
+        for name in ("alert", "emergency", "spi", "is_on_ground"):
+            row[name] = row[name] == "t"
+        session.add(models_sql.SBSMessage(**row))
+        session.commit()
+    orm_duration = time.perf_counter() - start_time
+    session.close()
+
+    writer = SBS_Copy_Writer()
+    writer.start()
+
+    start_time = time.perf_counter()
+    for sbs_dict in messages:
+        writer.write_sbs(sbs_dict)
+    produce_duration = time.perf_counter() - start_time
+
+    deadline = time.time() + 300
+    while writer.written_count + writer.dropped_count < count and time.time() < deadline:
+        time.sleep(0.05)
+    copy_duration = time.perf_counter() - start_time
+
+    stats = writer.stats()
+    writer.stop()
+
+    log.info("ORM : %d rows, %.0f rows/sec", len(sample), len(sample) / orm_duration)
+    log.info("COPY: %d rows, %.0f rows/sec (row conversion %.1f us/row)",
+             count, count / copy_duration, produce_duration / count * 1e6)
+    log.info("Writer stats: %s", stats)
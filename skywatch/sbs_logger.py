@@ -0,0 +1,267 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Rotating, compressed SBS text log on a dedicated writer thread
+
+# The CSV log used to be one file opened forever, with every message encoded
+# by csv.DictWriter on the consumer thread and flushed from the monitor thread.
+#
+# SBS lines already are CSV rows with the sbs_field_names columns, so the
+# logger writes the received line as is. The consumer thread only appends it
+# to a deque (thread-safe without a lock). The writer thread drains the deque
+# into a file opened with a large buffer.
+#
+# The active segment is rotated by size or age:
+#
+#   aircraft_log.csv                          active segment
+#   aircraft_log.20250421_224858.csv.gz       closed segments
+#
+# Closed segments are compressed on a separate thread (zstd when the
+# 'zstandard' package is installed, gzip otherwise) and the original removed.
+
+import os
+import gzip
+import time
+import shutil
+import threading
+import logging
+from datetime import datetime
+from collections import deque
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import sbs_message
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+HEADER = ",".join(sbs_message.SBS_FIELD_NAMES) + "\n"
+
+
+class SBS_Logger():
+
+    def __init__(self,
+                 path="aircraft_log.csv",
+                 max_bytes=256*1024*1024,    # rotate after this many bytes
+                 max_age_sec=24*3600,        # or after this long
+                 compression="auto",         # 'auto', 'zstd', 'gzip' or None
+                 buffer_size=1024*1024,
+                 flush_interval=1.0,
+                 max_pending=200000):        # lines waiting for the writer
+
+        if compression == "auto":
+            compression = "zstd" if zstandard else "gzip"
+
+        if compression == "zstd" and not zstandard:
+            log.warning("zstandard is not installed, compressing log segments with gzip.")
+            compression = "gzip"
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.pending = deque()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+        self.file = None
+        self.file_bytes = 0
+        self.file_opened = 0
+
+        self.compress_queue = deque()
+        self.compress_event = threading.Event()
+        self.compress_thread = None
+
+        self.written_count = 0
+        self.written_bytes = 0
+        self.dropped_count = 0
+        self.rotated_count = 0
+        self.compressed_in = 0
+        self.compressed_out = 0
+
+
+    def start(self):
+
+        self.open()
+
+        # segments left uncompressed by a previous run
+        for path in self.closed_segments():
+            self.compress_queue.append(path)
+
+        self.running = True
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        self.compress_thread = threading.Thread(target=self.compress_run, daemon=True)
+        self.compress_thread.start()
+        self.compress_event.set()
+
+
+    def stop(self, timeout=10):
+
+        self.running = False
+        self.wakeup.set()
+        self.compress_event.set()
+
+        if self.thread:
+            self.thread.join(timeout)
+
+
+    def write(self, line):
+        """
+            Called from the consumer thread with the raw SBS line.
+        """
+
+        if len(self.pending) >= self.max_pending:
+            self.dropped_count += 1
+            return
+
+        self.pending.append(line)
+
+
+    def open(self):
+
+        self.file = open(self.path, mode="a", encoding="utf-8", newline="", buffering=self.buffer_size)
+        self.file_bytes = self.file.tell()
+        self.file_opened = time.time()
+
+        if self.file_bytes == 0:
+            self.file.write(HEADER)
+            self.file_bytes = len(HEADER)
+
+
+    def rotate(self):
+
+        self.file.close()
+
+        base, ext = os.path.splitext(self.path)
+        closed_path = f"{base}.{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+        os.replace(self.path, closed_path)
+
+        self.rotated_count += 1
+        log.info("Rotated SBS log to %s", closed_path)
+
+        self.open()
+
+        self.compress_queue.append(closed_path)
+        self.compress_event.set()
+
+
+    def closed_segments(self):
+
+        directory = os.path.dirname(self.path) or "."
+        base, ext = os.path.splitext(os.path.basename(self.path))
+
+        return sorted(
+            os.path.join(directory, filename)
+            for filename in os.listdir(directory)
+            if filename.startswith(base + ".") and filename.endswith(ext) and filename != os.path.basename(self.path)
+        )
+
+
+    def run(self):
+
+        while True:
+
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+
+            try:
+                self.drain()
+                self.file.flush()
+                if (self.file_bytes >= self.max_bytes or
+                        time.time() - self.file_opened >= self.max_age_sec):
+                    self.rotate()
+            except OSError as e:
+                log.error("Cannot write SBS log: %s", e)
+
+            if not self.running:
+                break
+
+        self.drain()
+        self.file.close()
+
+        log.info("SBS logger thread ended.")
+
+
+    def drain(self):
+
+        lines = []
+        pending = self.pending
+
+        while pending:
+            lines.append(pending.popleft())
+
+        if not lines:
+            return
+
+        data = "\n".join(lines) + "\n"
+        self.file.write(data)
+
+        self.file_bytes += len(data)
+        self.written_bytes += len(data)
+        self.written_count += len(lines)
+
+
+    def compress_run(self):
+
+        while self.running:
+
+            self.compress_event.wait()
+            self.compress_event.clear()
+
+            while self.compress_queue:
+                path = self.compress_queue.popleft()
+                try:
+                    self.compress(path)
+                except OSError as e:
+                    log.error("Cannot compress %s: %s", path, e)
+
+
+    def compress(self, path):
+
+        start_time = time.time()
+
+        if self.compression == "zstd":
+            out_path = path + ".zst"
+            with open(path, "rb") as src, open(out_path + ".tmp", "wb") as dst:
+                zstandard.ZstdCompressor(level=6).copy_stream(src, dst)
+        elif self.compression == "gzip":
+            out_path = path + ".gz"
+            with open(path, "rb") as src, gzip.open(out_path + ".tmp", "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, length=self.buffer_size)
+        else:
+            return
+
+        os.replace(out_path + ".tmp", out_path)
+
+        size_in = os.path.getsize(path)
+        size_out = os.path.getsize(out_path)
+        os.remove(path)
+
+        self.compressed_in += size_in
+        self.compressed_out += size_out
+
+        log.info("Compressed %s: %.1f MB -> %.1f MB in %.1f s",
+                 path, size_in / 1024 / 1024, size_out / 1024 / 1024, time.time() - start_time)
+
+
+    def stats(self):
+
+        return {
+            "pending": len(self.pending),
+            "written": self.written_count,
+            "mb_written": round(self.written_bytes / 1024 / 1024, 2),
+            "segment_mb": round(self.file_bytes / 1024 / 1024, 2),
+            "rotated": self.rotated_count,
+            "dropped": self.dropped_count,
+            "compression_ratio": round(self.compressed_in / self.compressed_out, 1) if self.compressed_out else None
+        }
@@ -0,0 +1,156 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: SBS-1 (BaseStation) message fields and typed parsing
+
+# dump1090 emits one comma-separated line per message on port 30003:
+#
+#   MSG,3,1,1,AA8114,1,2025/04/21,22:48:58.123,2025/04/21,22:48:58.150,,7950,,,37.78368,-122.15441,,,0,,0,0
+#
+# Fields are kept as strings in the live path. The helpers below convert
+# them to typed values where needed (rule evaluation, database writers).
+
+from datetime import datetime
+
+SBS_FIELD_NAMES = [
+    "message_type",
+    "transmission_type",
+    "session_id",
+    "aircraft_id",
+    "hex_ident",
+    "flight_id",
+    "generated_date",
+    "generated_time",
+    "logged_date",
+    "logged_time",
+    "callsign",
+    "altitude",
+    "ground_speed",
+    "track",
+    "latitude",
+    "longitude",
+    "vertical_rate",
+    "squawk",
+    "alert",
+    "emergency",
+    "spi",
+    "is_on_ground"
+]
+
+
+def to_flag(value):
+    """
+        SBS flags are '-1' (or '1') for true and '0' for false.
+    """
+
+    if value in ("-1", "1"):
+        return True
+    if value == "0":
+        return False
+    return None
+
+
+# field name -> converter; fields not listed stay strings
+FIELD_TYPES = {
+    "transmission_type": int,
+    "altitude": int,
+    "ground_speed": float,
+    "track": float,
+    "latitude": float,
+    "longitude": float,
+    "vertical_rate": int,
+    "alert": to_flag,
+    "emergency": to_flag,
+    "spi": to_flag,
+    "is_on_ground": to_flag,
+}
+
+
+EMERGENCY_SQUAWKS = frozenset(("7500", "7600", "7700"))
+
+
+def is_priority(line):
+    """
+        Cheap pre-classification on the raw line: emergency squawk or the
+        alert/emergency flag set. Only the last fields are split off.
+    """
+
+    fields = line.rsplit(',', 5)
+    if len(fields) < 6:
+        return False
+
+    # squawk, alert, emergency, spi, is_on_ground
+    return (fields[1] in EMERGENCY_SQUAWKS or
+            fields[2] in ("-1", "1") or
+            fields[3] in ("-1", "1"))
+
+
+def tokenize(line):
+
+    if not line.startswith("MSG"):
+        return None
+
+    fields = line.split(',')
+    if len(fields) < 22:
+        return None
+
+    return dict(zip(SBS_FIELD_NAMES, fields))
+
+
+def merge_fields(state, sbs_dict):
+    """
+        Aggregate of one aircraft: every non-empty field overwrites the
+        previous value, empty fields keep it.
+    """
+
+    for field, value in sbs_dict.items():
+        if value:
+            state[field] = value
+
+    return state
+
+
+def parse_value(field, value):
+    """
+        Typed value of one field, or None if empty or malformed.
+    """
+
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+
+    converter = FIELD_TYPES.get(field)
+    if converter is None:
+        return value
+
+    if not isinstance(value, str):
+        return value
+
+    try:
+        if converter is int:
+            return int(float(value))
+        return converter(value)
+    except ValueError:
+        return None
+
+
+def parse_datetime(date_str, time_str):
+    """
+        date_str=2025/04/21, time_str=22:48:58.123
+    """
+
+    if not date_str or not time_str:
+        return None
+
+    try:
+        return datetime.strptime(f"{date_str} {time_str}", "%Y/%m/%d %H:%M:%S.%f")
+    except ValueError:
+        pass
+
+    try:
+        return datetime.strptime(f"{date_str} {time_str}", "%Y/%m/%d %H:%M:%S")
+    except ValueError:
+        return None
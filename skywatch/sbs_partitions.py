@@ -0,0 +1,336 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Partition maintenance for the sbs_messages table
+
+# sbs_messages is range partitioned on generated_datetime (see models_sql),
+# one partition per day (or per hour on very busy receivers):
+#
+#   sbs_messages
+#   ├── sbs_messages_p20250420
+#   ├── sbs_messages_p20250421
+#   ├── ...
+#   └── sbs_messages_default     rows outside every range
+#
+# Future partitions are created ahead of time, and retention drops whole
+# partitions instead of running DELETE over hundreds of millions of rows.
+#
+# Postgres refuses to create a partition while the default partition holds
+# rows of its range. When it does (maintenance did not run, a late replay),
+# the default is detached, the partition created, the rows moved into it and
+# the default attached again, in one transaction. Ranges found only in the
+# default are created too, so their rows are pruned and expire like the rest.
+#
+# Indexes are declared on the parent and created on every partition:
+#
+#   btree (hex_ident, generated_datetime)   track of one aircraft between T1 and T2
+#   brin  (generated_datetime)              everything in the last N minutes
+#
+# Rows are appended in time order, so the BRIN index stays tiny and
+# partition pruning does most of the work for time-range queries.
+#
+# Benchmark partitioned vs. plain table:
+#
+#   python sbs_partitions.py --rows 5000000 --days 7
+
+import time
+import argparse
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+import models_sql
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+# granularity -> (suffix format, partition width)
+GRANULARITIES = {
+    "day": ("%Y%m%d", timedelta(days=1)),
+    "hour": ("%Y%m%d%H", timedelta(hours=1)),
+}
+
+
+def floor_time(dt, granularity):
+
+    if granularity == "hour":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(table, start, granularity):
+
+    suffix_format, _ = GRANULARITIES[granularity]
+    return f"{table}_p{start.strftime(suffix_format)}"
+
+
+def relkind(conn, table):
+    """
+        'p' for a partitioned table, 'r' for a plain one, None if missing.
+    """
+
+    return conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :table AND relkind IN ('p', 'r')"),
+        {"table": table}
+    ).scalar()
+
+
+def check_partitioned(table="sbs_messages"):
+    """
+        create_all() does not alter an existing table. Warn if the table was
+        created before partitioning was introduced.
+    """
+
+    with models_sql.engine.connect() as conn:
+        kind = relkind(conn, table)
+
+    if kind == "r":
+        log.warning("Table '%s' is not partitioned. Rename it (ALTER TABLE %s RENAME TO %s_old) "
+                    "and restart to create the partitioned table.", table, table, table)
+        return False
+
+    return kind == "p"
+
+
+def list_partitions(conn, table, granularity):
+    """
+        [(name, start)] of the range partitions, oldest first.
+    """
+
+    rows = conn.execute(
+        text("SELECT child.relname FROM pg_inherits "
+             "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+             "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+             "WHERE parent.relname = :table"),
+        {"table": table}
+    ).scalars().all()
+
+    suffix_format, _ = GRANULARITIES[granularity]
+    prefix = f"{table}_p"
+
+    partitions = []
+    for name in rows:
+        if not name.startswith(prefix):
+            continue
+        try:
+            start = datetime.strptime(name[len(prefix):], suffix_format)
+        except ValueError:
+            continue
+        partitions.append((name, start))
+
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def default_starts(conn, table, granularity):
+    """
+        Period starts of the rows held by the default partition.
+    """
+
+    return conn.execute(text(
+        f"SELECT DISTINCT date_trunc('{granularity}', generated_datetime) FROM {table}_default"
+    )).scalars().all()
+
+
+def create_partition(conn, table, name, start, end):
+    """
+        Returns the number of rows moved out of the default partition.
+    """
+
+    create_sql = (f"CREATE TABLE {name} PARTITION OF {table} "
+                  f"FOR VALUES FROM ('{start.isoformat(sep=' ')}') TO ('{end.isoformat(sep=' ')}')")
+    bounds = {"start": start, "end": end}
+
+    in_default = conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {table}_default "
+        f"WHERE generated_datetime >= :start AND generated_datetime < :end)"
+    ), bounds).scalar()
+
+    if not in_default:
+        conn.execute(text(create_sql))
+        return 0
+
+    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {table}_default"))
+    conn.execute(text(create_sql))
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM {table}_default "
+        f"               WHERE generated_datetime >= :start AND generated_datetime < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds).rowcount
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {table}_default DEFAULT"))
+
+    return moved
+
+
+def ensure_partitions(table="sbs_messages", granularity="day", ahead=3, behind=1, now=None):
+    """
+        Create the partitions from 'behind' to 'ahead' periods around now,
+        those of older rows held by the default partition, and the default
+        partition itself.
+    """
+
+    _, width = GRANULARITIES[granularity]
+    now = now or datetime.now()
+    current = floor_time(now, granularity)
+
+    created = []
+
+    with models_sql.engine.begin() as conn:
+
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+
+        existing = {name for name, _ in list_partitions(conn, table, granularity)}
+
+        last = current + ahead * width
+        starts = {current + offset * width for offset in range(-behind, ahead + 1)}
+        starts.update(start for start in default_starts(conn, table, granularity) if start <= last)
+
+        for start in sorted(starts):
+
+            name = partition_name(table, start, granularity)
+            if name in existing:
+                continue
+
+            # a savepoint, so one overlapping range does not abort the rest
+            try:
+                with conn.begin_nested():
+                    moved = create_partition(conn, table, name, start, start + width)
+                created.append(name)
+                if moved:
+                    log.info("Moved %d rows from %s_default into %s", moved, table, name)
+            except Exception as e:
+                log.error("Cannot create partition %s: %s", name, e)
+
+    return created
+
+
+def drop_expired(table="sbs_messages", granularity="day", retention_days=30, now=None):
+    """
+        Drop partitions whose whole range is older than the retention.
+    """
+
+    _, width = GRANULARITIES[granularity]
+    now = now or datetime.now()
+    cutoff = now - timedelta(days=retention_days)
+
+    dropped = []
+
+    with models_sql.engine.begin() as conn:
+        for name, start in list_partitions(conn, table, granularity):
+            if start + width > cutoff:
+                break
+            conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+
+    return dropped
+
+
+def maintain(table="sbs_messages", granularity="day", ahead=3, retention_days=30):
+
+    start_time = time.time()
+
+    created = ensure_partitions(table, granularity, ahead=ahead)
+    dropped = drop_expired(table, granularity, retention_days=retention_days)
+
+    if created or dropped:
+        log.info("Partitions of %s: created %s, dropped %s (%.2f s)",
+                 table, created or "none", dropped or "none", time.time() - start_time)
+
+    return created, dropped
+
+
+###############################################################################
+
+def fill(conn, table, rows, aircraft, start, span_sec):
+    """
+        Server-side synthetic data in time order, like live ingestion.
+    """
+
+    conn.execute(text(
+        f"INSERT INTO {table} (hex_ident, generated_datetime, logged_datetime, altitude, latitude, longitude) "
+        f"SELECT upper(lpad(to_hex((g % {aircraft})::int), 6, '0')), ts, ts, "
+        f"       (random() * 40000)::int, 37 + random(), -122 + random() "
+        f"FROM (SELECT g, timestamp '{start.isoformat(sep=' ')}' + g * ({span_sec} / {rows}::float) * interval '1 second' AS ts "
+        f"      FROM generate_series(0, {rows - 1}) g) s"
+    ))
+
+
+def timed(conn, sql, params, repeat=5):
+
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        count = len(conn.execute(text(sql), params).all())
+        duration = time.perf_counter() - start_time
+        best = duration if best is None else min(best, duration)
+    return best, count
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark partitioned sbs_messages")
+    parser.add_argument("--rows", type=int, default=5000000)
+    parser.add_argument("--aircraft", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark tables")
+    args = parser.parse_args()
+
+    models_sql.Base.metadata.create_all(models_sql.engine, tables=[models_sql.SBSMessage.__table__])
+
+    heap_table = "bench_sbs_heap"
+    part_table = "bench_sbs_part"
+
+    end = floor_time(datetime.now(), "hour")
+    start = end - timedelta(days=args.days)
+    span_sec = args.days * 86400
+
+    with models_sql.engine.begin() as conn:
+
+        conn.execute(text(f"DROP TABLE IF EXISTS {heap_table}, {part_table} CASCADE"))
+
+        conn.execute(text(f"CREATE TABLE {heap_table} (LIKE sbs_messages INCLUDING DEFAULTS)"))
+        conn.execute(text(f"CREATE INDEX ON {heap_table} (hex_ident, generated_datetime)"))
+
+        conn.execute(text(f"CREATE TABLE {part_table} (LIKE sbs_messages INCLUDING DEFAULTS) "
+                          f"PARTITION BY RANGE (generated_datetime)"))
+        conn.execute(text(f"CREATE INDEX ON {part_table} (hex_ident, generated_datetime)"))
+        conn.execute(text(f"CREATE INDEX ON {part_table} USING brin (generated_datetime)"))
+
+    ensure_partitions(part_table, "day", ahead=1, behind=args.days + 1, now=end)
+
+    with models_sql.engine.begin() as conn:
+        for table in (heap_table, part_table):
+            start_time = time.perf_counter()
+            fill(conn, table, args.rows, args.aircraft, start, span_sec)
+            log.info("Loaded %d rows into %s in %.1f s", args.rows, table, time.perf_counter() - start_time)
+        conn.execute(text(f"ANALYZE {heap_table}"))
+        conn.execute(text(f"ANALYZE {part_table}"))
+
+    track_sql = ("SELECT generated_datetime, latitude, longitude, altitude FROM {table} "
+                 "WHERE hex_ident = :hex_ident AND generated_datetime BETWEEN :t1 AND :t2 "
+                 "ORDER BY generated_datetime")
+    recent_sql = ("SELECT DISTINCT ON (hex_ident) hex_ident, generated_datetime, latitude, longitude, altitude "
+                  "FROM {table} WHERE generated_datetime >= :since "
+                  "ORDER BY hex_ident, generated_datetime DESC")
+
+    track_params = {"hex_ident": "00002A", "t1": end - timedelta(hours=6), "t2": end - timedelta(hours=2)}
+    recent_params = {"since": end - timedelta(minutes=5)}
+
+    with models_sql.engine.connect() as conn:
+        for table in (heap_table, part_table):
+            duration, count = timed(conn, track_sql.format(table=table), track_params)
+            log.info("%-16s track of one aircraft over 4 h: %6.2f ms (%d rows)", table, duration * 1000, count)
+            duration, count = timed(conn, recent_sql.format(table=table), recent_params)
+            log.info("%-16s aircraft in the last 5 min:    %6.2f ms (%d aircraft)", table, duration * 1000, count)
+
+        start_time = time.perf_counter()
+        conn.execute(text(f"EXPLAIN ANALYZE DELETE FROM {heap_table} WHERE generated_datetime < :cutoff"),
+                     {"cutoff": start + timedelta(days=1)})
+        conn.rollback()
+        log.info("%-16s retention by DELETE of one day: %.2f s", heap_table, time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    dropped = drop_expired(part_table, "day", retention_days=args.days - 1, now=end)
+    log.info("%-16s retention by dropping %d partition(s): %.3f s", part_table, len(dropped), time.perf_counter() - start_time)
+
+    if not args.keep:
+        with models_sql.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {heap_table}, {part_table} CASCADE"))
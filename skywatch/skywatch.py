@@ -11,18 +11,38 @@ import socket
 import gc
 import queue
 import threading
-import csv
 import json
 import logging
 import time
+from collections import deque
 import redis
 from geopy.distance import geodesic
 from gpsdclient import GPSDClient
 
 import models_sql
+import models_redis
+import data_access
+import reference_sync
+import aircraft_registry
+import sbs_message
+import sbs_partitions
 from hexdb_api import HEXDB_REST_API_Client
 from plane_spotters_api import Plane_Spotters_REST_API_Client
 from discord_webhook import Discord_Webhook
+from notification_outbox import Discord_Outbox
+from notifiers import Notifier_Fanout, Discord_Notifier, Tweet_Notifier, File_Notifier, Webhook_Notifier
+from airline_resolver import Airline_Resolver
+from enrichment_prefetch import Enrichment_Prefetcher
+from rate_limiter import Rate_Limiter
+from negative_cache import Negative_Cache
+from alert_rules import Alert_Rule_Engine
+from cpa_predictor import CPA_Predictor
+from influx_writer import Influx_Writer
+from track_decimator import Track_Decimator
+from sbs_copy_writer import SBS_Copy_Writer
+from sbs_logger import SBS_Logger
+from coverage_map import Coverage_Map
+from metrics_http import Metrics_Server
 import get_aircraft_svg
 import utility
 
@@ -42,6 +62,21 @@ class SkyWatch():
                  dump1090_port=30003,
                  csv_save=True,
                  csv_path="aircraft_log.csv",
+                 log_format="parquet",   # message log with csv_save: 'parquet' or 'csv'
+                 archive_dir="archive",
+                 postgres_save=True,
+                 retention_days=30,      # sbs_messages partitions older than this are dropped
+                 prefetch=True,
+                 reference_sync=True,
+                 alert_log_path=None,
+                 alert_rules_path="alert_rules.json",
+                 cpa_lookahead_sec=120,  # 'approaching' alert this far ahead, 0 to disable
+                 cpa_interval=1,
+                 track_tolerance_m=50,   # decimate stored tracks, 0 to store every position
+                 coverage_path="coverage.npz",  # range by bearing and altitude, None to disable
+                 metrics_port=8080,      # /metrics and /coverage, 0 to disable
+                 hexdb_rate_per_sec=1.0,
+                 planespotters_rate_per_sec=0.5,
                  monitor_interval=10):
 
         self.alert_radius_km = alert_radius_km
@@ -56,47 +91,40 @@ class SkyWatch():
 
         self.csv_save = csv_save
         self.csv_path = csv_path
+        self.log_format = log_format
+        self.archive_dir = archive_dir
+
+        self.retention_days = retention_days
 
         self.monitor_interval = monitor_interval
+        self.cpa_lookahead_sec = cpa_lookahead_sec
+        self.cpa_interval = cpa_interval
+
+        self.reference_sync = reference_sync
+        self.alert_log_path = alert_log_path
+        self.alert_rules_path = alert_rules_path
 
         ########
 
         self.running = True
 
-        self.csv_file = None
-        self.csv_writer = None
+        self.sbs_logger = None
+        self.archive = None
 
         self.msg_queue = queue.Queue(maxsize=100)
+        self.msg_dropped = 0
+
+        # emergency squawks and alert/emergency flags: unbounded, never
+        # dropped and always consumed first. Items are (line, enqueue time).
+        self.priority_queue = queue.Queue()
+        self.priority_count = 0
+        self.priority_latencies = deque(maxlen=256)
         self.msg_rate_produce = 0
         self.msg_rate_consume = 0
 
-        self.icao_code_hex_missing = set()
         self.max_observed_distance_km = 0
 
-        self.sbs_field_names = [
-            "message_type",
-            "transmission_type",
-            "session_id",
-            "aircraft_id",
-            "hex_ident",
-            "flight_id",
-            "generated_date",
-            "generated_time",
-            "logged_date",
-            "logged_time",
-            "callsign",
-            "altitude",
-            "ground_speed",
-            "track",
-            "latitude",
-            "longitude",
-            "vertical_rate",
-            "squawk",
-            "alert",
-            "emergency",
-            "spi",
-            "is_on_ground"
-        ]
+        self.sbs_field_names = sbs_message.SBS_FIELD_NAMES
 
         ########
 
@@ -109,16 +137,103 @@ class SkyWatch():
 
         log.info("Latitude: %s, Longitude: %s", self.home_lat, self.home_lon)
 
-        if self.csv_save:
-            self.init_csv()
+        if self.csv_save and self.log_format == "parquet":
+            from parquet_archive import Parquet_Archive
+            self.archive = Parquet_Archive(directory=self.archive_dir)
+        elif self.csv_save:
+            self.sbs_logger = SBS_Logger(path=self.csv_path)
 
         self.redis = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
-        self.postgresql_session = models_sql.Session(bind=models_sql.engine)
+
+        self.alert_rules = Alert_Rule_Engine.load(self.alert_rules_path,
+                                                  variables={"alert_radius_km": self.alert_radius_km})
+
+        # ICAO hex codes that hexdb.io could not resolve
+        self.unknown_hex = Negative_Cache(self.redis)
+        self.unknown_hex.load()
+        self.airline_resolver = Airline_Resolver()
+        self.airline_resolver.load(models_sql.ScopedSession())
+        reference_sync.register_listener("airlines", self.airline_resolver.apply_changes)
+
+        # static designator -> shape table, see build_designator_shapes.py
+        self.designator_shapes = get_aircraft_svg.load_designator_shapes()
+
+        # rendered SVG markers, every shape in the default colors
+        self.marker_cache = get_aircraft_svg.Marker_Cache()
+        self.marker_cache.precompute()
+        log.info("Marker cache: %s", self.marker_cache.memory_usage())
 
         self.hexdb = HEXDB_REST_API_Client(host="hexdb.io/api", api_ver="v1")
         self.ps_h = Plane_Spotters_REST_API_Client(host="api.planespotters.net/pub")
 
         self.discord = Discord_Webhook(host="discord.com", base="api/webhooks")
+        self.discord_outbox = Discord_Outbox(self.redis, self.discord)
+
+        self.notifiers = Notifier_Fanout()
+        self.notifiers.add(Discord_Notifier(self.discord_outbox))
+
+        if os.getenv("X_API_KEY", None):
+            from tweet_send import Tweet_Send
+            self.notifiers.add(Tweet_Notifier(Tweet_Send()), max_queue=20)
+
+        alert_webhook_url = os.getenv("ALERT_WEBHOOK_URL", None)
+        if alert_webhook_url:
+            self.notifiers.add(Webhook_Notifier(alert_webhook_url))
+
+        if self.alert_log_path:
+            self.notifiers.add(File_Notifier(self.alert_log_path))
+
+        self.prefetcher = None
+        if prefetch:
+            self.hexdb_limiter = Rate_Limiter(hexdb_rate_per_sec)
+            self.planespotters_limiter = Rate_Limiter(planespotters_rate_per_sec)
+            self.prefetcher = Enrichment_Prefetcher(
+                fetchers=[
+                    ("airplane", self.prefetch_airplane),
+                    ("picture", self.prefetch_picture)
+                ],
+                alert_radius_km=self.alert_radius_km)
+
+        # time-series output, enabled when INFLUX_URL is set
+        self.influx = None
+        if os.getenv("INFLUX_URL", None):
+            self.influx = Influx_Writer(url=os.getenv("INFLUX_URL"),
+                                        token=os.getenv("INFLUX_TOKEN", None),
+                                        org=os.getenv("INFLUX_ORG", None),
+                                        bucket=os.getenv("INFLUX_BUCKET", "skywatch"))
+
+        # sbs_messages table, bulk loaded with COPY
+        self.sbs_writer = None
+        self.sbs_partitioned = False
+        if postgres_save:
+            self.sbs_partitioned = sbs_partitions.check_partitioned()
+            if self.sbs_partitioned:
+                sbs_partitions.maintain(retention_days=self.retention_days)
+            self.sbs_writer = SBS_Copy_Writer()
+
+        # in front of the storage writers
+        self.decimator = None
+        if track_tolerance_m:
+            self.decimator = Track_Decimator(self.home_lat, self.home_lon, tolerance_m=track_tolerance_m)
+
+        self.cpa_predictor = None
+        if self.cpa_lookahead_sec:
+            self.cpa_predictor = CPA_Predictor(self.home_lat,
+                                               self.home_lon,
+                                               alert_radius_km=self.alert_radius_km,
+                                               lookahead_sec=self.cpa_lookahead_sec)
+
+        self.coverage = None
+        if coverage_path:
+            self.coverage = Coverage_Map(self.home_lat, self.home_lon, path=coverage_path)
+            self.coverage.load()
+
+        self.metrics_server = None
+        if metrics_port:
+            self.metrics_server = Metrics_Server(port=metrics_port)
+            self.metrics_server.set_metrics(self.metrics)
+            if self.coverage:
+                self.metrics_server.add_route("/coverage", self.coverage.snapshot)
 
     ###############################################################################
 
@@ -138,20 +253,42 @@ class SkyWatch():
                     return lat, lon
 
 
-    def init_csv(self):
+    ###############################################################################
+
+    def start(self):
 
-        log.info("Initializing CSV.")
+        if self.prefetcher:
+            self.prefetcher.start()
 
-        self.csv_file = open(self.csv_path, mode='a', newline='')
-        self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=self.sbs_field_names)
+        if self.archive:
+            self.archive.start()
 
-        # Write header if file is new
-        if os.stat(self.csv_path).st_size == 0:
-            self.csv_writer.writeheader()
+        if self.sbs_logger:
+            self.sbs_logger.start()
 
-    ###############################################################################
+        self.discord_outbox.start()
+        self.notifiers.start()
 
-    def start(self):
+        if self.influx:
+            self.influx.start()
+
+        if self.sbs_writer:
+            self.sbs_writer.start()
+
+        if self.cpa_predictor:
+            cpa_thread = threading.Thread(target=self.cpa_thr, daemon=True)
+            cpa_thread.start()
+
+        if self.sbs_partitioned:
+            partition_thread = threading.Thread(target=self.partition_thr, daemon=True)
+            partition_thread.start()
+
+        if self.reference_sync:
+            sync_thread = threading.Thread(target=self.reference_sync_thr, daemon=True)
+            sync_thread.start()
+
+        if self.metrics_server:
+            self.metrics_server.start()
 
         monitor_thread = threading.Thread(target=self.monitor_queue)
         monitor_thread.start()
@@ -167,6 +304,21 @@ class SkyWatch():
         log.info("Stopping SkyWatch...")
         self.running = False
 
+        if self.prefetcher:
+            self.prefetcher.stop()
+
+        self.discord_outbox.stop()
+        self.notifiers.stop()
+
+        if self.influx:
+            self.influx.stop()
+
+        if self.sbs_writer:
+            self.sbs_writer.stop()
+
+        if self.metrics_server:
+            self.metrics_server.stop()
+
 
     def monitor_queue(self):
 
@@ -185,15 +337,148 @@ class SkyWatch():
                 self.max_observed_distance_km
             )
 
-            if self.icao_code_hex_missing:
-                log.info("[Monitor] Aircraft with non-matching ICAO Hex Code: %s", sorted(self.icao_code_hex_missing))
+            if self.priority_count:
+                log.info("[Monitor] Priority lane: %s  Dropped from main queue: %d",
+                         self.priority_stats(), self.msg_dropped)
+            elif self.msg_dropped:
+                log.info("[Monitor] Dropped from main queue: %d", self.msg_dropped)
+
+            if self.unknown_hex.count():
+                log.info("[Monitor] Aircraft with non-matching ICAO Hex Code: %d  Top: %s  Short-circuited: %d",
+                         self.unknown_hex.count(),
+                         ", ".join(f"{hex_ident} ({hits})" for hex_ident, hits in self.unknown_hex.top()),
+                         self.unknown_hex.short_circuit_count)
+
+            if self.prefetcher:
+                log.info("[Monitor] Prefetch: %s", self.prefetcher.stats())
 
-            if self.running and self.csv_file:
-                self.csv_file.flush()
+            if self.cpa_predictor:
+                log.info("[Monitor] CPA: %s", self.cpa_predictor.stats())
+
+            if self.decimator:
+                log.info("[Monitor] Track decimation: %s", self.decimator.stats())
+
+            if self.influx:
+                log.info("[Monitor] Influx: %s", self.influx.stats())
+
+            if self.sbs_writer:
+                log.info("[Monitor] Postgres sbs_messages: %s", self.sbs_writer.stats())
+
+            if self.archive:
+                log.info("[Monitor] Parquet archive: %s", self.archive.stats())
+
+            if self.sbs_logger:
+                log.info("[Monitor] SBS log: %s", self.sbs_logger.stats())
+
+            if self.coverage:
+                log.info("[Monitor] Coverage: %s", self.coverage.stats())
+                self.coverage.maybe_save()
+
+            log.info("[Monitor] Discord outbox: %s", self.discord_outbox.stats())
+
+            for name, stats in self.notifiers.stats().items():
+                log.info("[Monitor] Notifier %s: %s", name, stats)
+
+            for name, stats in self.alert_rules.stats().items():
+                log.info("[Monitor] Alert rule %s: %s", name, stats)
+
+            self.monitor_cache()
 
         log.info("Monitor thread ended.")
 
 
+    def metrics(self):
+        """
+            Numeric state for /metrics, see metrics_http.flatten.
+        """
+
+        stats = {
+            "queue_size": self.msg_queue.qsize(),
+            "receive_rate": self.msg_rate_produce,
+            "process_rate": self.msg_rate_consume,
+            "max_observed_distance_km": self.max_observed_distance_km,
+            "dropped": self.msg_dropped,
+            "priority": self.priority_stats(),
+            "discord_outbox": self.discord_outbox.stats(),
+            "alert_rule": self.alert_rules.stats(),
+        }
+
+        components = {
+            "prefetch": self.prefetcher,
+            "cpa": self.cpa_predictor,
+            "decimator": self.decimator,
+            "influx": self.influx,
+            "sbs_writer": self.sbs_writer,
+            "archive": self.archive,
+            "sbs_log": self.sbs_logger,
+            "coverage": self.coverage,
+        }
+
+        for name, component in components.items():
+            if component:
+                stats[name] = component.stats()
+
+        return stats
+
+
+    def monitor_cache(self):
+
+        try:
+            models_redis.budget.maybe_sweep()
+            usage = models_redis.budget.usage()
+        except redis.RedisError as e:
+            log.error("Cannot read cache usage: %s", e)
+            return
+
+        if not usage:
+            return
+
+        usage_str = "  ".join(
+            f"{namespace}: {counters['keys']} keys / {counters['bytes'] / 1024:.1f} KB"
+            for namespace, counters in sorted(usage.items())
+        )
+
+        log.info("[Monitor] Cache usage: %s  (evicted: %d)", usage_str, models_redis.budget.evicted_count)
+
+
+    def reference_sync_thr(self):
+
+        # refresh reference tables from db/*.json without delaying startup
+        reference_sync.sync_from_files()
+
+        log.info("Reference sync thread ended.")
+
+
+    def cpa_thr(self):
+
+        while self.running:
+
+            time.sleep(self.cpa_interval)
+
+            try:
+                for approach in self.cpa_predictor.approaching():
+                    self.send_approaching_alert(approach)
+            except Exception as e:
+                log.error("CPA prediction failed: %s", e)
+
+        log.info("CPA thread ended.")
+
+
+    def partition_thr(self, interval=3600):
+
+        # create upcoming partitions and drop expired ones
+        while self.running:
+
+            time.sleep(interval)
+
+            try:
+                sbs_partitions.maintain(retention_days=self.retention_days)
+            except Exception as e:
+                log.error("Partition maintenance failed: %s", e)
+
+        log.info("Partition thread ended.")
+
+
     def receive_thr(self):
 
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -218,10 +503,16 @@ class SkyWatch():
                         line = line.strip()
                         if not line:
                             continue
-                        self.msg_queue.put(line, timeout=2)
                         count += 1
-                except queue.Full:
-                    pass
+                        if sbs_message.is_priority(line):
+                            self.priority_queue.put((line, time.monotonic()))
+                            continue
+                        # never block here: a full bulk queue must not hold
+                        # back the priority lines that follow in the stream
+                        try:
+                            self.msg_queue.put_nowait(line)
+                        except queue.Full:
+                            self.msg_dropped += 1
                 except Exception as e:
                     log.error("Error:", e)
 
@@ -245,9 +536,12 @@ class SkyWatch():
 
             while self.running:
 
+                count += self.consume_priority()
+
                 try:
 
-                    data = self.msg_queue.get(timeout=2)
+                    # short timeout, so priority lines never wait long
+                    data = self.msg_queue.get(timeout=0.05)
                     if data:
                         count += 1
                         self.process_sbs_line(data)
@@ -264,10 +558,56 @@ class SkyWatch():
 
         finally:
 
-            log.info("Closing CSV file.")
+            # the archive and log writers flush on their own threads
+            if self.archive:
+                self.archive.stop()
 
-            if self.csv_file:
-                self.csv_file.close()
+            if self.sbs_logger:
+                self.sbs_logger.stop()
+
+            if self.coverage:
+                try:
+                    self.coverage.save()
+                except OSError as e:
+                    log.error("Cannot save coverage map: %s", e)
+
+
+    def consume_priority(self):
+
+        count = 0
+
+        while True:
+
+            try:
+                line, enqueued = self.priority_queue.get_nowait()
+            except queue.Empty:
+                return count
+
+            self.priority_latencies.append(time.monotonic() - enqueued)
+            self.priority_count += 1
+            count += 1
+
+            self.process_sbs_line(line)
+
+
+    def priority_stats(self):
+
+        latencies = sorted(self.priority_latencies)
+
+        stats = {
+            "processed": self.priority_count,
+            "queued": self.priority_queue.qsize(),
+            "avg_ms": None,
+            "p95_ms": None,
+            "max_ms": None
+        }
+
+        if latencies:
+            stats["avg_ms"] = round(sum(latencies) / len(latencies) * 1000, 2)
+            stats["p95_ms"] = round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2)
+            stats["max_ms"] = round(latencies[-1] * 1000, 2)
+
+        return stats
 
 
     def process_sbs_line(self, line):
@@ -278,8 +618,11 @@ class SkyWatch():
 
         log.debug("Received a SBS message.")
 
-        if self.csv_writer:
-            self.csv_writer.writerow(sbs_dict)
+        if self.archive:
+            # raw line, parsed in batches on the archive thread
+            self.archive.write_line(line)
+        elif self.sbs_logger:
+            self.sbs_logger.write(line)
 
         ######
 
@@ -288,27 +631,27 @@ class SkyWatch():
 
         if distance_km:
             self.max_observed_distance_km = max(distance_km, self.max_observed_distance_km)
+            if self.coverage:
+                self.coverage.observe_sbs(sbs_dict, distance_km)
+
+        if self.prefetcher:
+            self.prefetcher.observe(sbs_dict)
+
+        if self.cpa_predictor:
+            self.cpa_predictor.observe(sbs_dict)
 
         ######
 
         self.aggregate_sbs_messages(sbs_dict)
 
-        self.send_to_influx(sbs_dict)
+        self.store(sbs_dict)
 
         self.send_alert(sbs_dict)
 
 
     def tokenize_fields(self, line):
 
-        if not line.startswith("MSG"):
-            return None
-
-        fields = line.split(',')
-        if len(fields) < 22:
-            return None
-
-        sbs_dict = dict(zip(self.sbs_field_names, fields))
-        return sbs_dict
+        return sbs_message.tokenize(line)
 
 
     def calculate_distance_to_base(self, sbs_dict):
@@ -341,9 +684,7 @@ class SkyWatch():
         if not hex_ident:
             return
 
-        sbs_dict_clean = {
-            k: v for k, v in sbs_dict.items() if v
-        }
+        sbs_dict_clean = sbs_message.merge_fields({}, sbs_dict)
 
         key = f"aircraft_aggregate:{hex_ident}"
         self.redis.hset(key, mapping=sbs_dict_clean)
@@ -351,19 +692,30 @@ class SkyWatch():
 
     ###############################################################################
 
-    def send_to_influx(self, sbs_dict):
+    def store(self, sbs_dict):
 
-        hex_ident = sbs_dict.get("hex_ident", None)
-        if not hex_ident:
+        if not self.influx and not self.sbs_writer:
             return
 
-        # find the corresponding aggregate key for this hex_ident
-        key = f"aircraft_aggregate:{hex_ident}"
-        sbs_dict_aggregate = self.redis.hgetall(key)
-        if not sbs_dict_aggregate:
-            return
+        if self.decimator:
+            # positions that add nothing to the track are not stored
+            points = self.decimator.process(sbs_dict)
+        else:
+            points = [(None, sbs_dict)]
 
-        # TODO
+        for timestamp_ms, point in points:
+
+            if self.influx:
+                self.send_to_influx(point, timestamp_ms)
+
+            if self.sbs_writer:
+                self.sbs_writer.write_sbs(point)
+
+
+    def send_to_influx(self, sbs_dict, timestamp_ms=None):
+
+        # buffered, the write happens on the writer thread
+        self.influx.write_sbs(sbs_dict, timestamp_ms)
 
     ###############################################################################
 
@@ -373,39 +725,118 @@ class SkyWatch():
         if not hex_ident:
             return
 
-        distance_km = sbs_dict.get("distance_km", None)
-        if not distance_km:
+        # find the corresponding aggregate key for this hex_ident
+        key = f"aircraft_aggregate:{hex_ident}"
+
+        matched, ctx = self.alert_rules.evaluate(
+            sbs_dict,
+            get_state=lambda: self.redis.hgetall(key),
+            get_designator=lambda: self.lookup_designator(hex_ident))
+
+        if not matched:
             return
 
-        alert_needed = distance_km <= self.alert_radius_km
-        if not alert_needed:
+        # nothing to send without the aggregate, keep the dedup keys free
+        sbs_dict_aggregate = dict(ctx.state())
+        if not sbs_dict_aggregate:
             return
 
-        key_alert = f"alerted:{hex_ident}"
-        if self.redis.exists(key_alert):
+        # atomic set-if-absent, so each rule alerts once per aircraft
+        rules = [rule for rule in matched
+                 if self.redis.set(f"alerted:{rule.name}:{hex_ident}", 1, ex=rule.dedup_sec, nx=True)]
+        if not rules:
             return
 
-        # find the corresponding aggregate key for this hex_ident
-        key = f"aircraft_aggregate:{hex_ident}"
-        sbs_dict_aggregate = self.redis.hgetall(key)
-        if not sbs_dict_aggregate:
+        # enriched once per message, shared by the rules it triggered
+        self.enrich_sbs_message(sbs_dict_aggregate)
+
+        text = self.format_sbs_text(sbs_dict_aggregate)
+
+        for rule in rules:
+
+            log.info("Sending alert '%s' for aircraft %s!", rule.name, hex_ident)
+
+            embed = self.format_sbs_embed(sbs_dict_aggregate)
+            if rule.color is not None:
+                embed["color"] = rule.color
+
+            alert = {
+                "hex_ident": hex_ident,
+                "rule": rule.name,
+                "content": rule.content,
+                "text": text,
+                "embed": embed
+            }
+
+            # delivered to every sink on its own threads
+            self.notifiers.publish(alert)
+
+
+    def send_approaching_alert(self, approach):
+
+        hex_ident = approach["hex_ident"]
+
+        key_alert = f"alerted:approaching:{hex_ident}"
+        if not self.redis.set(key_alert, 1, ex=600, nx=True):
             return
 
-        callsign = sbs_dict_aggregate.get("callsign", None)
-        if not callsign:
+        # warm hexdb/planespotters before the aircraft enters the radius
+        if self.prefetcher:
+            self.prefetcher.push(hex_ident, 0.0)
+
+        sbs_dict_aggregate = self.redis.hgetall(f"aircraft_aggregate:{hex_ident}")
+        if not sbs_dict_aggregate:
             return
 
-        log.info("Sending alert for aircraft %s!", hex_ident)
+        log.info("Aircraft %s approaching, CPA %.2f km in %.0f s!",
+                 hex_ident, approach["d_cpa_km"], approach["t_cpa_sec"])
 
-        self.redis.set(key_alert, 1, ex=600)  # 10 minutes expiration
+        sbs_dict_aggregate["distance_km"] = approach["distance_km"]
 
-        self.enrich_sbs_message(sbs_dict_aggregate)
+        # in-memory lookups only, the full enrichment follows with the nearby alert
+        sbs_dict_aggregate["enrich"] = {
+            "airline": self.airline_resolver.resolve(sbs_dict_aggregate.get("callsign", None))
+        }
+
+        altitude_cpa = approach["altitude_cpa_ft"]
+        altitude_cpa = f"{altitude_cpa:.0f}" if altitude_cpa is not None else "Unknown"
 
         embed = self.format_sbs_embed(sbs_dict_aggregate)
+        embed["description"] = (
+            f"Closest approach {approach['d_cpa_km']:.2f} km from base "
+            f"in {approach['t_cpa_sec']:.0f} s at {altitude_cpa} ft."
+        )
+
+        alert = {
+            "hex_ident": hex_ident,
+            "rule": "approaching",
+            "content": "🛬 Aircraft approaching!",
+            "text": self.format_sbs_text(sbs_dict_aggregate),
+            "embed": embed
+        }
 
-        status, response = self.discord.send_discord_message(content="✈️ Nearby aircraft detected!", embed=embed)
-        if not status:
-            log.error(f"Failed to send msg to discord.\n{response}")
+        self.notifiers.publish(alert)
+
+
+    def format_sbs_text(self, sbs_dict):
+
+        icao_hex = sbs_dict.get("hex_ident") or "Unknown"
+        callsign = (sbs_dict.get("callsign") or "Unknown").strip()
+        altitude = sbs_dict.get("altitude") or "Unknown"
+
+        distance_km = sbs_dict.get("distance_km")
+        if distance_km:
+            distance_km = round(float(distance_km), 2)
+        else:
+            distance_km = "Unknown"
+
+        airline_name = utility.get_value(sbs_dict, ["enrich", "airline", "airline_name"])
+
+        text = f"✈️ {callsign} ({icao_hex}) detected {distance_km} km from base at {altitude} ft."
+        if airline_name:
+            text += f" Airline: {airline_name}."
+
+        return text
 
 
     def format_sbs_embed(self, sbs_dict):
@@ -501,8 +932,12 @@ class SkyWatch():
         hex_ident = sbs_dict.get("hex_ident", None)
         sbs_dict["enrich"]["airplane"] = self.enrich_sbs_message_airplane(hex_ident)
 
-        airline_iata = utility.get_value(sbs_dict, ["enrich", "airplane", "airline_iata_code"])
-        sbs_dict["enrich"]["airline"] = self.enrich_sbs_message_airline(airline_iata)
+        # fast path: ICAO airline designator carried in the callsign (UAL1791)
+        airline = self.airline_resolver.resolve(sbs_dict.get("callsign", None))
+        if not airline:
+            airline_iata = utility.get_value(sbs_dict, ["enrich", "airplane", "airline_iata_code"])
+            airline = self.enrich_sbs_message_airline(airline_iata)
+        sbs_dict["enrich"]["airline"] = airline
 
         country_iso2 = utility.get_value(sbs_dict, ["enrich", "airline", "country_iso2"])
         sbs_dict["enrich"]["country"] = self.enrich_sbs_message_country(country_iso2)
@@ -525,48 +960,102 @@ class SkyWatch():
 
         hex_ident = hex_ident.strip().upper()
 
-        results = self.postgresql_session.query(models_sql.Airplane).filter_by(icao_code_hex=hex_ident).all()
-        if results:
-            if len(results) > 1:
-                log.warning("Multiple airplanes found with hex_ident %s", hex_ident)
-            return models_sql.model_to_dict(results[0])
+        airplane = data_access.get_airplane(hex_ident)
+        if airplane:
+            return airplane
+
+        # offline registry is consulted before going to the network
+        output = aircraft_registry.lookup(hex_ident)
+        if output:
+            return self.hexdb_to_airplane(output)
+
+        if self.unknown_hex.contains(hex_ident):
+            return None
 
         status, output = self.hexdb.get_aircraft_information(hex_ident)
 
-        if status:
+        if self.hexdb.is_not_found(status, output):
+            self.unknown_hex.add(hex_ident)
+            return None
+
+        if not status:
+            # transient (timeout, 429, 5xx): try again next time
+            log.debug("get_aircraft_information failed: %s", output)
+            return None
 
-            output["icao_code_hex"] = output.pop("ModeS")
-            output["registration_number"] = output.pop("Registration")
-            # output["?"] = output.pop("Manufacturer")  # Airbus
-            output["iata_code_long"] = output.pop("ICAOTypeCode")
-            output["iata_type"] = output.pop("Type")    # 'A319 111', 'Global 5000'
-            output["plane_owner"] = output.pop("RegisteredOwners")  # easyJet UK
-            # output["?"] = output.pop("OperatorFlagCode")          # EZY
+        return self.hexdb_to_airplane(output)
 
-            return output
 
-        else:
+    def lookup_designator(self, hex_ident):
+        """
+            ICAO type designator (B772) for alert rules. Local tables only,
+            rules are evaluated per message and must not go to the network.
+        """
 
-            log.debug("get_aircraft_information failed: %s", output)
+        hex_ident = hex_ident.strip().upper()
+
+        airplane = data_access.get_airplane(hex_ident)
+        if airplane:
+            return airplane.get("iata_code_long")
+
+        output = aircraft_registry.lookup(hex_ident)
+        if output:
+            return output.get("ICAOTypeCode")
 
-        self.icao_code_hex_missing.add(hex_ident)
         return None
 
 
+    def hexdb_to_airplane(self, output):
+
+        output = dict(output)
+
+        output["icao_code_hex"] = output.pop("ModeS")
+        output["registration_number"] = output.pop("Registration")
+        # output["?"] = output.pop("Manufacturer")  # Airbus
+        output["iata_code_long"] = output.pop("ICAOTypeCode")
+        output["iata_type"] = output.pop("Type")    # 'A319 111', 'Global 5000'
+        output["plane_owner"] = output.pop("RegisteredOwners")  # easyJet UK
+        # output["?"] = output.pop("OperatorFlagCode")          # EZY
+
+        return output
+
+
+    def prefetch_airplane(self, hex_ident):
+        """
+            Runs on the prefetch thread. Warms the hexdb cache unless the
+            aircraft is already known locally.
+        """
+
+        hex_ident = hex_ident.strip().upper()
+
+        if data_access.get_airplane(hex_ident):
+            return
+
+        if aircraft_registry.lookup(hex_ident):
+            return
+
+        if self.unknown_hex.contains(hex_ident):
+            return
+
+        self.hexdb_limiter.acquire()
+        status, output = self.hexdb.get_aircraft_information(hex_ident)
+        if self.hexdb.is_not_found(status, output):
+            self.unknown_hex.add(hex_ident)
+
+
+    def prefetch_picture(self, hex_ident):
+
+        self.planespotters_limiter.acquire()
+        self.ps_h.get_aircraft_picture(hex_ident)
+
+
     def enrich_sbs_message_airline(self, airline_iata):
 
         if not airline_iata:
             return None
 
         airline_iata = airline_iata.strip().upper()
-        results = self.postgresql_session.query(models_sql.Airline).filter_by(iata_code=airline_iata, status="active").all()
-        if not results:
-            return None
-
-        if len(results) > 1:
-            log.warning("Multiple active airlines found with airline_iata %s", airline_iata)
-
-        return models_sql.model_to_dict(results[0])
+        return data_access.get_active_airline(airline_iata)
 
 
     def enrich_sbs_message_country(self, country_iso2):
@@ -575,14 +1064,7 @@ class SkyWatch():
             return None
 
         country_iso2 = country_iso2.strip().upper()
-        results = self.postgresql_session.query(models_sql.Country).filter_by(country_iso2=country_iso2).all()
-        if not results:
-            return None
-
-        if len(results) > 1:
-            log.warning("Multiple countries found with country_iso2 %s", country_iso2)
-
-        return models_sql.model_to_dict(results[0])
+        return data_access.get_country(country_iso2)
 
 
     def enrich_sbs_message_pic(self, hex_ident):
@@ -601,23 +1083,28 @@ class SkyWatch():
             return None
 
         iata_code_long = iata_code_long.strip().upper()
-        results = self.postgresql_session.query(models_sql.ICAOType).filter_by(designator=iata_code_long).all()
-        if not results:
-            return None
 
-        output = models_sql.model_to_dict(results[0])
+        shape = self.designator_shapes.get(iata_code_long, None)
+
+        if not shape:
+
+            output = data_access.get_icao_type(iata_code_long)
+            if not output:
+                return None
 
-        designator = output.get("designator", None)
-        description_code = output.get("description_code", None)
-        description = output.get("aircraft_description", None)
-        wtc = output.get("wake_turbulence_category", None)
+            shape = get_aircraft_svg.get_base_shape(output.get("designator", None),                  # B737
+                                                    output.get("description_code", None),            # L2J
+                                                    output.get("aircraft_description", None),        # LandPlane
+                                                    output.get("wake_turbulence_category", None))    # M
 
-        svg = get_aircraft_svg.get_base_marker(designator,         # B737
-                                               description_code,   # L2J
-                                               description,        # LandPlane
-                                               wtc)                # M
+        svg, uri = self.marker_cache.render(shape)
 
-        return svg
+        return {
+            "shape": shape,
+            "size": get_aircraft_svg.shapes[shape].size,
+            "svg": svg,
+            "uri": uri
+        }
 
     ###############################################################################
 
@@ -0,0 +1,251 @@
+# Author: Mani Amoozadeh
+# Email: mani.amoozadeh2@gmail.com
+# Description: Streaming track decimation before time-series storage
+
+# Aircraft report their position several times per second (MSG,3), but most
+# of those points lie on a straight line. The decimator is a streaming,
+# per-aircraft variant of Douglas-Peucker (an "opening window" filter):
+#
+#   - the last kept point is the anchor
+#   - new positions are buffered while every buffered point stays within
+#     'tolerance_m' (and 'tolerance_ft' in altitude) of the line interpolated
+#     in time between the anchor and the newest position
+#   - once a point deviates, the previous position is kept and becomes the
+#     new anchor
+#
+# A keyframe is forced every 'keyframe_sec', and the last position of an
+# aircraft is flushed when it goes quiet, so a track always has its ends.
+# Points are returned with their original reception time.
+#
+# Positions are projected to meters with an equirectangular projection around
+# a fixed reference (the receiver, or the first position seen), so that all
+# the points of a window share the same scale.
+#
+# Messages without a position (callsign, velocity, squawk) are passed through.
+#
+# Demo with synthetic tracks:
+#
+#   python track_decimator.py
+
+import math
+import time
+import random
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+METERS_PER_DEG_LAT = 111320.0
+
+
+class Track_Decimator():
+
+    def __init__(self,
+                 ref_lat=None,          # projection reference, the receiver
+                 ref_lon=None,
+                 tolerance_m=50,
+                 tolerance_ft=100,
+                 keyframe_sec=60,
+                 max_window=64,         # buffered points per aircraft
+                 idle_sec=60):          # flush the track end after this
+
+        self.tolerance_m = tolerance_m
+        self.tolerance_ft = tolerance_ft
+        self.keyframe_sec = keyframe_sec
+        self.max_window = max_window
+        self.idle_sec = idle_sec
+
+        self.ref_lat = None
+        self.ref_lon = None
+        self.meters_per_deg_lon = None
+        if ref_lat is not None and ref_lon is not None:
+            self.set_reference(ref_lat, ref_lon)
+
+        # hex_ident -> {"anchor": point, "window": [points]}
+        # point = (time, x_m, y_m, altitude_ft or None, sbs_dict)
+        self.tracks = {}
+
+        self.input_count = 0
+        self.kept_count = 0
+        self.passed_count = 0
+        self.last_prune = time.time()
+
+
+    def set_reference(self, lat, lon):
+
+        self.ref_lat = lat
+        self.ref_lon = lon
+        self.meters_per_deg_lon = METERS_PER_DEG_LAT * math.cos(math.radians(lat))
+
+
+    def to_point(self, sbs_dict, now):
+
+        try:
+            lat = float(sbs_dict.get("latitude"))
+            lon = float(sbs_dict.get("longitude"))
+        except (TypeError, ValueError):
+            return None
+
+        try:
+            altitude = float(sbs_dict.get("altitude"))
+        except (TypeError, ValueError):
+            altitude = None
+
+        if self.ref_lat is None:
+            self.set_reference(lat, lon)
+
+        # equirectangular projection around the reference, the same scale
+        # for every point of a window
+        x = (lon - self.ref_lon) * self.meters_per_deg_lon
+        y = (lat - self.ref_lat) * METERS_PER_DEG_LAT
+
+        return (now, x, y, altitude, sbs_dict)
+
+
+    def deviates(self, anchor, point, middle):
+        """
+            Synchronized distance of 'middle' from the anchor -> point
+            segment, interpolated at its own time.
+        """
+
+        span = point[0] - anchor[0]
+        ratio = (middle[0] - anchor[0]) / span if span > 0 else 0.0
+
+        x = anchor[1] + (point[1] - anchor[1]) * ratio
+        y = anchor[2] + (point[2] - anchor[2]) * ratio
+
+        if math.hypot(middle[1] - x, middle[2] - y) > self.tolerance_m:
+            return True
+
+        if anchor[3] is not None and point[3] is not None and middle[3] is not None:
+            altitude = anchor[3] + (point[3] - anchor[3]) * ratio
+            if abs(middle[3] - altitude) > self.tolerance_ft:
+                return True
+
+        return False
+
+
+    def process(self, sbs_dict, now=None):
+        """
+            Returns a list of (timestamp_ms, sbs_dict) to forward to storage.
+        """
+
+        now = time.time() if now is None else now
+
+        output = []
+        if now - self.last_prune > self.idle_sec:
+            output.extend(self.prune(now))
+
+        hex_ident = sbs_dict.get("hex_ident", None)
+        point = self.to_point(sbs_dict, now) if hex_ident else None
+
+        if point is None:
+            self.passed_count += 1
+            output.append((int(now * 1000), sbs_dict))
+            return output
+
+        self.input_count += 1
+
+        track = self.tracks.get(hex_ident)
+        if track is None:
+            self.tracks[hex_ident] = {"anchor": point, "window": []}
+            output.append(self.keep(point))
+            return output
+
+        anchor = track["anchor"]
+        window = track["window"]
+
+        if now - anchor[0] >= self.keyframe_sec:
+            track["anchor"] = point
+            track["window"] = []
+            output.append(self.keep(point))
+            return output
+
+        if len(window) >= self.max_window or any(self.deviates(anchor, point, middle) for middle in window):
+            # the last point that still fit the line becomes the new anchor
+            last = window[-1]
+            output.append(self.keep(last))
+            track["anchor"] = last
+            track["window"] = [point]
+            return output
+
+        window.append(point)
+        return output
+
+
+    def keep(self, point):
+
+        self.kept_count += 1
+        return (int(point[0] * 1000), point[4])
+
+
+    def prune(self, now):
+        """
+            Flush the last buffered position of aircraft that went quiet.
+        """
+
+        self.last_prune = now
+        output = []
+
+        for hex_ident in list(self.tracks):
+            track = self.tracks[hex_ident]
+            last_seen = track["window"][-1][0] if track["window"] else track["anchor"][0]
+            if now - last_seen <= self.idle_sec:
+                continue
+            if track["window"]:
+                output.append(self.keep(track["window"][-1]))
+            del self.tracks[hex_ident]
+
+        return output
+
+
+    def stats(self):
+
+        return {
+            "tracks": len(self.tracks),
+            "positions": self.input_count,
+            "kept": self.kept_count,
+            "passed": self.passed_count,
+            "reduction": round(1 - self.kept_count / self.input_count, 3) if self.input_count else None
+        }
+
+
+if __name__ == "__main__":
+
+    decimator = Track_Decimator(38.0, -122.0)
+
+    start = 1745275738.0
+    messages = []
+
+    # straight legs with a turn, a climb and GPS-like noise, 2 positions/sec
+    for aircraft in range(50):
+        hex_ident = f"{aircraft:06X}"
+        lat, lon = 37.5 + random.random(), -122.5 + random.random()
+        heading = random.uniform(0, 360)
+        altitude = random.randint(2000, 30000)
+        for step in range(1200):
+            if step == 600:
+                heading += random.choice([-90, 90])
+            if 300 <= step < 400:
+                altitude += 10
+            distance = 125 / METERS_PER_DEG_LAT   # ~250 kt per half second
+            lat += distance * math.cos(math.radians(heading)) + random.gauss(0, 2e-5)
+            lon += distance * math.sin(math.radians(heading)) / math.cos(math.radians(lat)) + random.gauss(0, 2e-5)
+            messages.append((start + step * 0.5 + aircraft * 0.01, {
+                "hex_ident": hex_ident,
+                "latitude": f"{lat:.5f}",
+                "longitude": f"{lon:.5f}",
+                "altitude": str(altitude)
+            }))
+
+    messages.sort(key=lambda item: item[0])
+
+    forwarded = 0
+    start_time = time.perf_counter()
+    for now, sbs_dict in messages:
+        forwarded += len(decimator.process(sbs_dict, now=now))
+    forwarded += len(decimator.prune(messages[-1][0] + 3600))
+    duration = time.perf_counter() - start_time
+
+    log.info("%d positions in, %d forwarded, %.2f us/msg", len(messages), forwarded, duration / len(messages) * 1e6)
+    log.info("Stats: %s", decimator.stats())
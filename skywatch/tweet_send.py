@@ -29,4 +29,7 @@ class Tweet_Send():
         try:
             status = self.api.update_status(text)
         except Exception as e:
-            print("Error tweeting:", e)
+            log.error("Error tweeting: %s", e)
+            return False, str(e)
+
+        return True, status.id